@@ -0,0 +1,174 @@
+"""
+COMPILACIÓN POR LOTES
+Compila muchos archivos .sd en paralelo usando varios núcleos
+"""
+
+import os
+import glob
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+from compile_cache import CacheStats, CompileCache, DEFAULT_MAX_BYTES
+from intermediate_code import OPT_PEEPHOLE, instructions_to_json
+from ir_format import IR_EXTENSION, write_ir
+
+SOURCE_EXTENSION = ".sd"
+
+# Caché de cada proceso trabajador (se abre una vez, no por archivo)
+_worker_cache: Optional[CompileCache] = None
+
+
+@dataclass
+class FileResult:
+    path: str
+    success: bool
+    output: Optional[str] = None
+    instructions: int = 0
+    errors: List[str] = field(default_factory=list)
+    seconds: float = 0.0
+    cached: bool = False
+    cache_stats: Optional[CacheStats] = None    # contadores de la caché para este archivo
+
+
+@dataclass
+class BatchSummary:
+    results: List[FileResult]
+    seconds: float
+    workers: int
+    cache_stats: Optional[CacheStats] = None    # totales acumulados en la caché
+
+    @property
+    def succeeded(self) -> List[FileResult]:
+        return [r for r in self.results if r.success]
+
+    @property
+    def failed(self) -> List[FileResult]:
+        return [r for r in self.results if not r.success]
+
+    def report(self) -> str:
+        lines = ["=" * 70, "RESUMEN DE COMPILACIÓN POR LOTES".center(70), "=" * 70]
+        for result in self.failed:
+            lines.append(f"✗ {result.path}")
+            for error in result.errors:
+                lines.append(f"    {error}")
+        cached = sum(1 for r in self.results if r.cached)
+        rate = len(self.results) / self.seconds if self.seconds else 0.0
+        lines.extend([
+            "-" * 70,
+            f"Archivos: {len(self.results)}  Correctos: {len(self.succeeded)}  "
+            f"Con errores: {len(self.failed)}  Desde caché: {cached}",
+            f"Tiempo: {self.seconds:.2f} s con {self.workers} proceso(s) ({rate:,.0f} archivos/s)",
+            "=" * 70,
+        ])
+        return "\n".join(lines)
+
+
+def expand_inputs(inputs: Iterable[str]) -> List[str]:
+    """Convierte directorios, patrones glob y archivos en una lista de rutas
+    sin duplicados, en orden estable"""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            found = glob.glob(os.path.join(item, "**", "*" + SOURCE_EXTENSION), recursive=True)
+        elif glob.has_magic(item):
+            found = glob.glob(item, recursive=True)
+        else:
+            found = [item]
+        paths.extend(sorted(found))
+    return list(dict.fromkeys(os.path.normpath(p) for p in paths))
+
+
+def output_base(path: str, output_dir: Optional[str], root: Optional[str]) -> str:
+    stem = os.path.splitext(path)[0]
+    if output_dir is None:
+        return stem
+    # Conserva la estructura de carpetas bajo output_dir para evitar choques
+    relative = os.path.relpath(stem, root) if root else os.path.basename(stem)
+    return os.path.join(output_dir, relative)
+
+
+def compile_file(path: str, base: str, opt_level: int = OPT_PEEPHOLE,
+                 cache_dir: Optional[str] = None, cull: bool = False, binary_ir: bool = False,
+                 cache_size: int = DEFAULT_MAX_BYTES) -> FileResult:
+    # Importación diferida: main importa este módulo para la CLI
+    from main import compile_source, compile_source_cached
+
+    global _worker_cache
+    start = time.perf_counter()
+    cache_stats = None
+    try:
+        with open(path, "r") as f:
+            source_code = f.read()
+        if cache_dir is not None:
+            if (_worker_cache is None or _worker_cache.directory != cache_dir
+                    or _worker_cache.max_bytes != cache_size):
+                _worker_cache = CompileCache(cache_dir, max_bytes=cache_size)
+            result = compile_source_cached(source_code, _worker_cache, opt_level=opt_level, cull=cull)
+            cache_stats = _worker_cache.take_stats()
+        else:
+            result = compile_source(source_code, opt_level=opt_level, cull=cull)
+
+        if not result.success:
+            return FileResult(path, False, errors=result.errors, seconds=time.perf_counter() - start,
+                              cached=result.cached, cache_stats=cache_stats)
+
+        os.makedirs(os.path.dirname(base) or ".", exist_ok=True)
+        if binary_ir:
+            write_ir(f"{base}_intermediate{IR_EXTENSION}", result.instructions)
+        else:
+            with open(f"{base}_intermediate.json", "w") as f:
+                f.write(instructions_to_json(result.instructions))
+        output = f"{base}_output.svg"
+        with open(output, "w") as f:
+            f.write(result.svg)
+        return FileResult(path, True, output, len(result.instructions), seconds=time.perf_counter() - start,
+                          cached=result.cached, cache_stats=cache_stats)
+    except (OSError, UnicodeDecodeError) as e:
+        return FileResult(path, False, errors=[f"Error: {e}"], seconds=time.perf_counter() - start,
+                          cache_stats=cache_stats)
+
+
+def _compile_job(job):
+    return compile_file(*job)
+
+
+def compile_batch(inputs: Iterable[str], output_dir: Optional[str] = None,
+                  workers: Optional[int] = None, opt_level: int = OPT_PEEPHOLE,
+                  cache_dir: Optional[str] = None, cull: bool = False,
+                  binary_ir: bool = False, cache_size: int = DEFAULT_MAX_BYTES) -> BatchSummary:
+    """Compila todos los archivos en un ProcessPoolExecutor.
+
+    workers=None usa todos los núcleos; workers=1 compila en este proceso.
+    Los errores de cada archivo quedan en su FileResult y no detienen el lote.
+    Con cache_dir, cada proceso usa la caché con el límite cache_size (bytes)
+    y las estadísticas de todos se suman a las guardadas en la caché. Cada
+    proceso expulsa según su propio índice, así que al terminar se vuelve a
+    aplicar el límite sobre el estado del disco.
+    """
+    start = time.perf_counter()
+    paths = expand_inputs(inputs)
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths]) if paths else None
+    jobs = [(path, output_base(os.path.abspath(path), output_dir, root), opt_level, cache_dir, cull, binary_ir,
+             cache_size) for path in paths]
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(jobs)))
+
+    if workers == 1:
+        results = [_compile_job(job) for job in jobs]
+    else:
+        # Lotes por tarea para repartir decenas de miles de archivos pequeños
+        chunksize = max(1, min(64, len(jobs) // (workers * 4)))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_compile_job, jobs, chunksize=chunksize))
+
+    summary = BatchSummary(results, time.perf_counter() - start, workers)
+    if cache_dir is not None:
+        cache = CompileCache(cache_dir, max_bytes=cache_size)
+        cache.trim()
+        for result in results:
+            if result.cache_stats is not None:
+                cache.stats.add(result.cache_stats)
+        summary.cache_stats = cache.save_stats()
+    return summary
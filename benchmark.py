@@ -0,0 +1,374 @@
+"""
+BENCHMARKS DEL COMPILADOR
+Compara el rendimiento de los motores del analizador léxico y mide cada
+fase del compilador sobre programas sintéticos grandes, con líneas base
+para detectar regresiones
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional, Sequence, Tuple
+from lexer import Lexer, ENGINES
+
+SAMPLE_PROGRAM = """# Programa de muestra
+Paper 200
+Pen 2
+Rect 10 10 180 180
+Circle 100 100 60
+Line 100 50 100 150
+Line 50.5 100.25 150.75 100
+"""
+
+
+def make_source(repeat: int) -> str:
+    return SAMPLE_PROGRAM * repeat
+
+
+def time_lexer(source: str, engine: str, rounds: int = 3) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        Lexer(source, engine=engine).tokenize()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_lexer(source: str, rounds: int = 3):
+    tokens = len(Lexer(source).tokenize())
+    results = {}
+    for engine in ENGINES:
+        elapsed = time_lexer(source, engine, rounds)
+        results[engine] = {
+            "seconds": elapsed,
+            "tokens_per_second": tokens / elapsed if elapsed else float("inf"),
+        }
+    return tokens, results
+
+
+# Programas sintéticos
+
+# Proporción relativa de cada figura
+DEFAULT_MIX: Tuple[Tuple[str, float], ...] = (("line", 4), ("circle", 2), ("rect", 2))
+_WORD_CHARS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def generate_program(shapes: int = 1000, mix: Sequence[Tuple[str, float]] = DEFAULT_MIX,
+                     comments: float = 0.0, strings: float = 0.0, comment_length: int = 40,
+                     string_length: int = 80, paper: int = 1000, seed: int = 0) -> str:
+    """Programa SimpleDraw de `shapes` figuras elegidas al azar según mix.
+
+    comments y strings son la probabilidad de que una figura vaya precedida
+    de un comentario o de una cadena de la longitud indicada. Las cadenas
+    no son declaraciones válidas: un programa con strings > 0 solo sirve
+    para medir el lexer. La misma semilla da siempre el mismo programa.
+    """
+    rng = random.Random(seed)
+    kinds = [kind for kind, _ in mix]
+    weights = [weight for _, weight in mix]
+
+    def number():
+        if rng.random() < 0.25:
+            return f"{rng.uniform(0, paper):.2f}"
+        return str(rng.randrange(paper))
+
+    def text(length):
+        return "".join(rng.choices(_WORD_CHARS + " ", k=length))
+
+    lines = [f"Paper {paper}", "Pen 2"]
+    for kind in rng.choices(kinds, weights, k=shapes):
+        if comments and rng.random() < comments:
+            lines.append("# " + text(comment_length))
+        if strings and rng.random() < strings:
+            lines.append('"' + text(string_length) + '"')
+        if kind == "line":
+            lines.append(f"Line {number()} {number()} {number()} {number()}")
+        elif kind == "circle":
+            lines.append(f"Circle {number()} {number()} {rng.randrange(1, paper // 10)}")
+        else:
+            lines.append(f"Rect {number()} {number()} {rng.randrange(1, paper // 4)} {rng.randrange(1, paper // 4)}")
+    return "\n".join(lines) + "\n"
+
+
+# Cargas de la suite: argumentos de generate_program; lexer_only para las
+# que no son programas válidos
+WORKLOADS: Dict[str, dict] = {
+    "mixed": {"comments": 0.1},
+    "lines": {"mix": (("line", 1),)},
+    "comments": {"comments": 0.8, "comment_length": 120},
+    "strings": {"strings": 0.3, "string_length": 400, "lexer_only": True},
+}
+
+
+@dataclass
+class WorkloadResult:
+    name: str
+    chars: int
+    tokens: int
+    shapes: int
+    phases: Dict[str, float] = field(default_factory=dict)   # segundos (mejor ronda)
+    total_seconds: float = 0.0
+    main_seconds: Optional[float] = None
+    peak_bytes: int = 0
+
+    @property
+    def tokens_per_second(self) -> float:
+        seconds = self.phases.get("lex", 0.0)
+        return self.tokens / seconds if seconds else 0.0
+
+    @property
+    def shapes_per_second(self) -> float:
+        return self.shapes / self.total_seconds if self.total_seconds and self.shapes else 0.0
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["tokens_per_second"] = self.tokens_per_second
+        data["shapes_per_second"] = self.shapes_per_second
+        return data
+
+
+@dataclass
+class SuiteResult:
+    shapes: int
+    rounds: int
+    results: List[WorkloadResult] = field(default_factory=list)
+    python: str = field(default_factory=platform.python_version)
+    created: float = field(default_factory=time.time)
+
+    def to_json(self) -> str:
+        data = {key: value for key, value in asdict(self).items() if key != "results"}
+        data["results"] = [r.to_dict() for r in self.results]
+        return json.dumps(data, indent=2)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            f.write(self.to_json())
+
+    @classmethod
+    def load(cls, path: str) -> "SuiteResult":
+        with open(path) as f:
+            data = json.load(f)
+        fields = WorkloadResult.__dataclass_fields__
+        results = [WorkloadResult(**{k: v for k, v in r.items() if k in fields}) for r in data.pop("results")]
+        return cls(results=results, **data)
+
+    def report(self) -> str:
+        lines = [f"{'Carga':<10} {'Tokens':>10} {'Figuras':>9} {'Total ms':>10} {'main ms':>9} "
+                 f"{'tokens/s':>12} {'figuras/s':>11} {'Pico MB':>8}"]
+        for r in self.results:
+            main_ms = f"{r.main_seconds * 1000:9.1f}" if r.main_seconds is not None else f"{'-':>9}"
+            lines.append(f"{r.name:<10} {r.tokens:>10,} {r.shapes:>9,} {r.total_seconds * 1000:10.1f} {main_ms} "
+                         f"{r.tokens_per_second:12,.0f} {r.shapes_per_second:11,.0f} {r.peak_bytes / 2**20:8.1f}")
+            phases = "  ".join(f"{name} {seconds * 1000:.1f}" for name, seconds in r.phases.items())
+            lines.append(f"{'':<10} ms por fase: {phases}")
+        return "\n".join(lines)
+
+
+@dataclass
+class Comparison:
+    workload: str
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def change(self) -> float:
+        """Variación relativa; positiva = más lento o más memoria"""
+        return (self.current - self.baseline) / self.baseline if self.baseline else 0.0
+
+
+def _best(function, rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _measure_lexer(name: str, source: str, rounds: int) -> WorkloadResult:
+    tokens = len(Lexer(source).tokenize_buffer())
+    result = WorkloadResult(name, len(source), tokens, 0)
+    result.phases["lex"] = result.total_seconds = _best(lambda: Lexer(source).tokenize_buffer(), rounds)
+    tracemalloc.start()
+    try:
+        Lexer(source).tokenize_buffer()
+        result.peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result
+
+
+def _compile_phases(source: str, memory: bool):
+    from main import SimpleDrawCompiler
+    from metrics import CompileMetrics
+
+    metrics = CompileMetrics(memory=memory)
+    compiler = SimpleDrawCompiler()
+    if not compiler.compile(source, verbose=False, keep_tokens=False, metrics=metrics):
+        raise ValueError(f"El programa generado no compila: {compiler.errors}")
+    with metrics.phase("emit") as items:
+        items["bytes"] = len(compiler.build_svg())
+    return metrics
+
+
+def _time_main(source: str, rounds: int) -> float:
+    # Camino completo de la CLI: leer el archivo, compilar y exportar
+    from main import main
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.sd")
+        with open(path, "w") as f:
+            f.write(source)
+        output = os.path.join(tmp, "bench")
+        with redirect_stdout(io.StringIO()):
+            return _best(lambda: main([path, "-q", "-o", output]), rounds)
+
+
+def measure_workload(name: str, source: str, shapes: int, rounds: int = 3, run_main: bool = True,
+                     lexer_only: bool = False) -> WorkloadResult:
+    """Mejor tiempo de cada fase en `rounds` rondas (sin tracemalloc) y el
+    pico de memoria de una ronda aparte medida con tracemalloc; shapes es
+    el número de figuras del programa"""
+    if lexer_only:
+        return _measure_lexer(name, source, rounds)
+
+    best: Dict[str, float] = {}
+    counts: Dict[str, int] = {}
+    for _ in range(rounds):
+        for p in _compile_phases(source, memory=False).phases:
+            best[p.name] = min(best.get(p.name, float("inf")), p.wall_seconds)
+            counts.update({f"{p.name}.{key}": value for key, value in p.items.items()})
+
+    result = WorkloadResult(name, len(source), counts["lex.tokens"], shapes)
+    result.phases = best
+    result.total_seconds = sum(best.values())
+    result.peak_bytes = _compile_phases(source, memory=True).peak_bytes
+    if run_main:
+        result.main_seconds = _time_main(source, rounds)
+    return result
+
+
+def run_suite(shapes: int = 20000, rounds: int = 3, workloads: Optional[Sequence[str]] = None,
+              run_main: bool = True, seed: int = 0) -> SuiteResult:
+    suite = SuiteResult(shapes, rounds)
+    for name in workloads or WORKLOADS:
+        options = dict(WORKLOADS[name])
+        lexer_only = options.pop("lexer_only", False)
+        source = generate_program(shapes, seed=seed, **options)
+        suite.results.append(measure_workload(name, source, shapes, rounds, run_main, lexer_only))
+    return suite
+
+
+def compare(baseline: SuiteResult, current: SuiteResult) -> List[Comparison]:
+    """Compara cada carga presente en ambas ejecuciones: tiempo total, tiempo
+    de main y pico de memoria. Las dos deben medir los mismos programas con
+    las mismas rondas"""
+    if (baseline.shapes, baseline.rounds) != (current.shapes, current.rounds):
+        raise ValueError(f"La línea base se midió con --shapes {baseline.shapes} --rounds {baseline.rounds}, "
+                         f"no con --shapes {current.shapes} --rounds {current.rounds}")
+    previous = {r.name: r for r in baseline.results}
+    comparisons = []
+    for r in current.results:
+        old = previous.get(r.name)
+        if old is None:
+            continue
+        comparisons.append(Comparison(r.name, "total_seconds", old.total_seconds, r.total_seconds))
+        if r.main_seconds is not None and old.main_seconds is not None:
+            comparisons.append(Comparison(r.name, "main_seconds", old.main_seconds, r.main_seconds))
+        comparisons.append(Comparison(r.name, "peak_bytes", old.peak_bytes, r.peak_bytes))
+    return comparisons
+
+
+def regressions(comparisons: List[Comparison], threshold: float = 0.10) -> List[Comparison]:
+    return [c for c in comparisons if c.change > threshold]
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Benchmarks del compilador SimpleDraw")
+    arg_parser.add_argument("repeat", nargs="?", type=int, default=20000,
+                            help="repeticiones del programa de muestra al comparar los motores del lexer")
+    arg_parser.add_argument("--suite", action="store_true",
+                            help="medir cada fase sobre programas sintéticos en lugar de los motores del lexer")
+    arg_parser.add_argument("--shapes", type=int, default=20000,
+                            help="figuras de cada programa de la suite (por defecto: 20000)")
+    arg_parser.add_argument("--rounds", type=int, default=3, help="rondas por medición (se toma la mejor)")
+    arg_parser.add_argument("--workload", action="append", choices=list(WORKLOADS),
+                            help="cargas a medir (por defecto: todas)")
+    arg_parser.add_argument("--no-main", action="store_true", help="no medir el camino completo de main")
+    arg_parser.add_argument("--baseline", metavar="FILE",
+                            help="comparar con FILE si existe y guardar en él esta ejecución "
+                                 "si no hay regresiones")
+    arg_parser.add_argument("--keep-baseline", action="store_true", help="no sobrescribir la línea base")
+    arg_parser.add_argument("--threshold", type=float, default=0.10,
+                            help="empeoramiento relativo que cuenta como regresión (por defecto: 0.10)")
+    arg_parser.add_argument("--json", metavar="FILE", help="guardar también el resultado en FILE")
+    args = arg_parser.parse_args(argv)
+
+    if not args.suite:
+        return bench_engines(args.repeat)
+
+    suite = run_suite(args.shapes, args.rounds, args.workload, not args.no_main)
+    print("=" * 90)
+    print("BENCHMARK: FASES DEL COMPILADOR".center(90))
+    print("=" * 90)
+    print(suite.report())
+    if args.json:
+        suite.save(args.json)
+
+    status = 0
+    if args.baseline and os.path.exists(args.baseline):
+        try:
+            comparisons = compare(SuiteResult.load(args.baseline), suite)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return 1
+        worse = regressions(comparisons, args.threshold)
+        print("-" * 90)
+        print(f"Comparación con {args.baseline}:")
+        for c in comparisons:
+            mark = "  REGRESIÓN" if c in worse else ""
+            print(f"  {c.workload:<10} {c.metric:<14} {c.baseline:14.6g} -> {c.current:<14.6g} {c.change:+7.1%}{mark}")
+        status = 1 if worse else 0
+    if args.baseline and status:
+        print("Línea base no actualizada: hay regresiones")
+    elif args.baseline and not args.keep_baseline:
+        suite.save(args.baseline)
+        print(f"Línea base guardada en {args.baseline}")
+    print("=" * 90)
+    return status
+
+
+def bench_engines(repeat: int):
+    source = make_source(repeat)
+    tokens, results = bench_lexer(source)
+
+    print("=" * 60)
+    print("BENCHMARK: ANALIZADOR LÉXICO".center(60))
+    print("=" * 60)
+    print(f"Fuente: {len(source):,} caracteres, {tokens:,} tokens")
+    print("-" * 60)
+    for engine, data in results.items():
+        print(f"{engine:<10} {data['seconds'] * 1000:10.1f} ms {data['tokens_per_second']:14,.0f} tokens/s")
+
+    base = results["scanner"]["seconds"]
+    fast = results["regex"]["seconds"]
+    if fast:
+        print("-" * 60)
+        print(f"Aceleración regex vs scanner: {base / fast:.1f}x")
+    print("=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
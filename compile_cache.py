@@ -0,0 +1,213 @@
+"""
+CACHÉ DE COMPILACIÓN
+Guarda en disco el código intermedio y el SVG de cada fuente compilada,
+indexados por un hash del contenido, la versión del compilador (número y hash
+de su código) y las opciones
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Iterable, Optional
+
+ENTRY_SUFFIX = ".entry.json"
+STATS_FILE = "stats.json"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Contadores de CacheStats que se acumulan entre sesiones
+COUNTERS = ("hits", "misses", "evictions", "bytes_read", "bytes_written")
+
+
+def code_fingerprint(paths: Iterable[str]) -> str:
+    """Hash del contenido de los archivos del compilador: cambia con cualquier
+    cambio de su código, aunque no se actualice el número de versión"""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()[:16]
+
+
+def cache_key(source_code: str, version: str, options: Optional[Dict[str, Any]] = None) -> str:
+    digest = hashlib.sha256()
+    digest.update(version.encode())
+    digest.update(b"\0")
+    digest.update(json.dumps(options or {}, sort_keys=True).encode())
+    digest.update(b"\0")
+    digest.update(source_code.encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    bytes_read: int = 0
+    bytes_written: int = 0
+    entries: int = 0
+    size_bytes: int = 0
+
+    def add(self, other: "CacheStats"):
+        """Suma los contadores de otra sesión (p. ej. de otro proceso)"""
+        for name in COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def report(self) -> str:
+        return (f"Caché: {self.hits} aciertos, {self.misses} fallos "
+                f"({self.hit_rate:.0%}), {self.evictions} expulsiones, "
+                f"{self.bytes_read:,} bytes leídos, {self.bytes_written:,} bytes escritos, "
+                f"{self.entries} entradas / {self.size_bytes:,} bytes en disco")
+
+
+class CompileCache:
+    """Caché en disco con expulsión LRU limitada por tamaño.
+
+    Cada entrada es un archivo JSON; su fecha de modificación marca el último
+    uso, así que el orden LRU sobrevive entre procesos. Las estadísticas de
+    la sesión se acumulan en stats.json con save_stats().
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def _load_index(self):
+        found = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(ENTRY_SUFFIX):
+                    info = entry.stat()
+                    found.append((info.st_mtime, entry.name[:-len(ENTRY_SUFFIX)], info.st_size))
+        for _, key, size in sorted(found):
+            self._set(key, size)
+
+    def _set(self, key: str, size: int):
+        # Registra la entrada como la usada más recientemente
+        self._size += size - self._entries.pop(key, 0)
+        self._entries[key] = size
+        self._refresh_size()
+
+    def _drop(self, key: str):
+        self._size -= self._entries.pop(key, 0)
+        self._refresh_size()
+
+    def _refresh_size(self):
+        self.stats.entries = len(self._entries)
+        self.stats.size_bytes = self._size
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            entry = json.loads(data.decode("utf-8"))
+        except (OSError, ValueError):
+            # Entrada ausente o corrupta (p. ej. expulsada por otro proceso)
+            self._drop(key)
+            self.stats.misses += 1
+            return None
+
+        os.utime(path)
+        self._set(key, len(data))
+        self.stats.hits += 1
+        self.stats.bytes_read += len(data)
+        return entry
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        data = json.dumps(entry, separators=(",", ":")).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        # Escritura atómica: otro proceso nunca ve una entrada a medias
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._set(key, len(data))
+        self.stats.bytes_written += len(data)
+        self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            self._drop(key)
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            self.stats.evictions += 1
+
+    def trim(self) -> int:
+        """Vuelve a leer el índice del disco y expulsa las entradas menos
+        usadas hasta respetar max_bytes. Sirve cuando otros procesos han
+        escrito en la caché con índices propios. Devuelve las expulsadas."""
+        self._entries.clear()
+        self._size = 0
+        self._load_index()
+        evictions = self.stats.evictions
+        self._evict()
+        return self.stats.evictions - evictions
+
+    def clear(self):
+        for key in list(self._entries):
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+        self._entries.clear()
+        self._size = 0
+        self._refresh_size()
+
+    def load_totals(self) -> CacheStats:
+        """Estadísticas acumuladas de todas las sesiones guardadas"""
+        totals = CacheStats()
+        try:
+            with open(os.path.join(self.directory, STATS_FILE)) as f:
+                saved = json.load(f)
+            for name in COUNTERS:
+                setattr(totals, name, int(saved.get(name, 0)))
+        except (OSError, ValueError):
+            pass
+        totals.entries = self.stats.entries
+        totals.size_bytes = self.stats.size_bytes
+        return totals
+
+    def save_stats(self) -> CacheStats:
+        """Suma las estadísticas de esta sesión a stats.json y las reinicia"""
+        totals = self.load_totals()
+        totals.add(self.stats)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(asdict(totals), f)
+        os.replace(tmp_path, os.path.join(self.directory, STATS_FILE))
+
+        self.take_stats()
+        return totals
+
+    def take_stats(self) -> CacheStats:
+        """Devuelve las estadísticas de la sesión y empieza otra"""
+        stats = self.stats
+        self.stats = CacheStats(entries=stats.entries, size_bytes=stats.size_bytes)
+        return stats
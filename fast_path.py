@@ -0,0 +1,89 @@
+"""
+CAMINO RÁPIDO POR LÍNEAS
+Traduce cada línea bien formada (una declaración por línea, p. ej.
+"Line 50 10 10 90") directamente a código intermedio, sin tokens ni AST
+"""
+
+from typing import List, MutableSequence, Optional
+
+from lexer import Lexer, KEYWORDS, NON_LEXER_SPACE
+from parser import Parser, STATEMENTS
+from intermediate_code import IntermediateCodeGenerator, IntermediateInstruction
+
+# Palabra clave -> (opcode, número de operandos, conversión). Los opcodes se
+# llaman como los tipos de token de su palabra clave (LINE -> 'LINE').
+_KEYWORD_SPECS = {
+    word: (token_type.name, len(STATEMENTS[token_type][1]), STATEMENTS[token_type][2])
+    for word, token_type in KEYWORDS.items()
+}
+
+
+def _fallback_line(text: str, line: int) -> List[IntermediateInstruction]:
+    # Línea que el camino rápido no reconoce (varias declaraciones, números
+    # raros...): lexer y parser completos; los errores se propagan
+    tokens = Lexer(text, first_line=line).tokenize_buffer()
+    translate = IntermediateCodeGenerator.translate
+    return [translate(stmt) for stmt in Parser(tokens).iter_statements()]
+
+
+def compile_lines(source: str, lines: Optional[MutableSequence[int]] = None
+                  ) -> Optional[List[IntermediateInstruction]]:
+    """Código intermedio sin optimizar de source (una instrucción por
+    declaración, igual que generate_from_ast sobre el AST completo).
+
+    Cada línea se divide por espacios, se busca la palabra clave y se
+    comprueba el número de operandos; las líneas que no encajan pasan por el
+    lexer y el parser normales. Si alguna línea tiene un error devuelve
+    None: el diagnóstico debe salir del camino completo, que analiza todo el
+    léxico antes de la sintaxis. lines, si se indica, recibe la línea de
+    cada instrucción.
+    """
+    if NON_LEXER_SPACE.search(source):
+        return None  # str.split() no separaría como el lexer
+    instructions: List[IntermediateInstruction] = []
+    append = instructions.append
+    specs = _KEYWORD_SPECS
+    Instruction = IntermediateInstruction
+    source_lines = source.split('\n')
+
+    for index, text in enumerate(source_lines):
+        code = text
+        if '#' in code:
+            code = code[:code.index('#')]
+        fields = code.split()
+        if fields:
+            spec = specs.get(fields[0])
+            if spec is not None and len(fields) == spec[1] + 1 and code.isascii():
+                op, _, convert = spec
+                operands = fields[1:]
+                # Mismos valores que los tokens NUMBER: dígitos ASCII y puntos,
+                # empezando por dígito; int sin punto y float con punto
+                digits = ''.join(operands)
+                if digits.isdigit():
+                    operands = list(map(int, operands))
+                elif digits.replace('.', '').isdigit() and not any(field[0] == '.' for field in operands):
+                    try:
+                        operands = [float(field) if '.' in field else int(field) for field in operands]
+                    except ValueError:  # "1.2.3": el lexer también falla
+                        operands = None
+                else:
+                    operands = None
+                if operands is not None:
+                    if convert:
+                        operands = [convert(value) for value in operands]
+                    append(Instruction(op, *operands))
+                    if lines is not None:
+                        lines.append(index + 1)
+                    continue
+        elif code.isascii():
+            continue  # línea vacía o solo comentario
+        try:
+            line_text = text if index == len(source_lines) - 1 else text + '\n'
+            translated = _fallback_line(line_text, index + 1)
+        except Exception:
+            return None
+        instructions.extend(translated)
+        if lines is not None:
+            lines.extend([index + 1] * len(translated))
+
+    return instructions
@@ -0,0 +1,345 @@
+"""
+COMPILACIÓN INCREMENTAL
+Mantiene un programa compilado y lo actualiza con ediciones de texto,
+volviendo a analizar solo las líneas tocadas
+"""
+
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from itertools import accumulate
+from operator import attrgetter
+from typing import List, Optional, Tuple
+
+from lexer import Lexer
+from parser import Parser, ProgramNode, PaperNode, PenNode
+from symbol_table import SymbolTable, shift_values
+from intermediate_code import IntermediateCodeGenerator
+from main import SimpleDrawCompiler, compile_source, shape_params, svg_header, svg_element, SVG_FOOTER
+
+# Declaraciones de configuración, el símbolo que actualizan y su valor
+_CONFIG_SYMBOLS = {PaperNode: ("paper_size", attrgetter('size')), PenNode: ("pen_width", attrgetter('width'))}
+
+# Estado de cada línea. La compilación completa analiza todo el léxico antes
+# de parsear, así que un error léxico gana a cualquier error sintáctico. Una
+# comilla fuera de un comentario siempre es un error, pero la cadena puede
+# seguir en otras líneas: entonces el mensaje sale de una compilación completa.
+LINE_OK = 0
+LINE_LEX_ERROR = 1
+LINE_SYNTAX_ERROR = 2
+LINE_STRING_ERROR = 3
+
+
+@dataclass
+class TextEdit:
+    """Sustituye el texto entre (start_line, start_column) y
+    (end_line, end_column), sin incluir el final, por text.
+    Líneas y columnas empiezan en 1, como en los tokens."""
+    start_line: int
+    start_column: int
+    end_line: int
+    end_column: int
+    text: str = ""
+
+
+@dataclass
+class SvgPatch:
+    """Cambios en el SVG tras una edición: los elementos de figura
+    [start, start + removed) se sustituyen por elements. header trae la nueva
+    cabecera si cambió el tamaño del papel o el grosor del lápiz."""
+    start: int
+    removed: int
+    elements: List[str] = field(default_factory=list)
+    header: Optional[List[str]] = None
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.removed or self.elements or self.header)
+
+
+class IncrementalSession:
+    """Programa compilado que se actualiza con ediciones de texto.
+
+    Cada línea guarda sus declaraciones: una edición solo vuelve a pasar por
+    el lexer y el parser las líneas que toca (las declaraciones no cruzan
+    líneas). Si las declaraciones nuevas son del mismo tipo que las viejas
+    (el caso de cambiar un número), el ProgramNode, la tabla de símbolos, el
+    IR y los elementos SVG se corrigen en su sitio; si se añaden o quitan
+    declaraciones o se mueven líneas, las figuras del rango se sustituyen en
+    la tabla de símbolos y las siguientes se renumeran y desplazan sin
+    reconstruirla (SymbolTable.splice_shapes).
+
+    El IR no se optimiza (una instrucción por declaración), así que equivale
+    a compile_source(source, opt_level=OPT_NONE). Mientras haya errores,
+    las líneas erróneas no aportan declaraciones y errors da el primero, con
+    el mismo mensaje que una compilación completa.
+    """
+
+    def __init__(self, source_code: str = ""):
+        self.lines: List[str] = source_code.split('\n')
+        self.compiler = SimpleDrawCompiler()
+        self.program = ProgramNode(statements=[])
+        self.elements: List[str] = []
+        self._line_statements: List[list] = []
+        self._line_states: List[int] = []
+        self._state_counts = [0, 0, 0, 0]
+        # Primera declaración y primer elemento SVG de cada línea (más el total)
+        self._line_starts = array('l', [0])
+        self._line_elements = array('l', [0])
+        # Índices de las líneas con cada configuración, en orden
+        self._config_lines = {name: [] for name, _ in _CONFIG_SYMBOLS.values()}
+        self._load()
+
+    @property
+    def source(self) -> str:
+        return '\n'.join(self.lines)
+
+    @property
+    def symbol_table(self) -> SymbolTable:
+        return self.compiler.symbol_table
+
+    @property
+    def instructions(self):
+        return self.compiler.code_generator.instructions
+
+    @property
+    def success(self) -> bool:
+        return self._state_counts[LINE_OK] == len(self.lines)
+
+    @property
+    def errors(self) -> List[str]:
+        """El mismo (primer) error que daría compilar el texto completo"""
+        counts = self._state_counts
+        if counts[LINE_STRING_ERROR]:
+            return compile_source(self.source, emit_svg=False).errors
+        for state in (LINE_LEX_ERROR, LINE_SYNTAX_ERROR):
+            if counts[state]:
+                return [self._parse_line(self._line_states.index(state))[2]]
+        return []
+
+    def _line_text(self, index: int) -> str:
+        # Todas las líneas menos la última terminan en salto de línea
+        text = self.lines[index]
+        return text if index == len(self.lines) - 1 else text + '\n'
+
+    def _parse_line(self, index: int) -> Tuple[list, int, Optional[str]]:
+        text = self._line_text(index)
+        state = LINE_LEX_ERROR
+        try:
+            tokens = Lexer(text, first_line=index + 1).tokenize_buffer()
+            state = LINE_SYNTAX_ERROR
+            return list(Parser(tokens).iter_statements()), LINE_OK, None
+        except Exception as e:
+            if '"' in text or "'" in text:
+                state = LINE_STRING_ERROR
+            return [], state, f"Error: {e}"
+
+    def _set_states(self, first: int, stop: int, states: List[int]):
+        for state in self._line_states[first:stop]:
+            self._state_counts[state] -= 1
+        for state in states:
+            self._state_counts[state] += 1
+        self._line_states[first:stop] = states
+
+    def _load(self):
+        self._line_statements = [[] for _ in self.lines]
+        states = [LINE_OK] * len(self.lines)
+        source = self.source
+
+        parsed = False
+        if '"' not in source and "'" not in source:
+            # Camino rápido: un solo lexer sobre todo el texto
+            try:
+                tokens = Lexer(source).tokenize_buffer()
+                parser = Parser(tokens)
+                for stmt in parser.iter_statements():
+                    # La declaración termina en el token anterior a position
+                    line = tokens.lines[parser.position - 1]
+                    self._line_statements[line - 1].append(stmt)
+                parsed = True
+            except Exception:
+                self._line_statements = [[] for _ in self.lines]
+
+        if not parsed:
+            for index in range(len(self.lines)):
+                self._line_statements[index], states[index], _ = self._parse_line(index)
+
+        self._line_states = []
+        self._state_counts = [0, 0, 0, 0]
+        self._set_states(0, 0, states)
+        self.program.statements = [stmt for group in self._line_statements for stmt in group]
+        self.compiler.code_generator.instructions = [
+            IntermediateCodeGenerator.translate(stmt) for stmt in self.program.statements]
+        self._line_starts = array('l', [0])
+        self._line_starts.extend(accumulate(map(len, self._line_statements)))
+        self._line_elements = array('l', [0])
+        self._line_elements.extend(accumulate(map(_count_shapes, self._line_statements)))
+        for node_type, (name, _) in _CONFIG_SYMBOLS.items():
+            self._config_lines[name] = [index for index, group in enumerate(self._line_statements)
+                                        if any(type(stmt) is node_type for stmt in group)]
+        self._rebuild_symbols()
+        self.elements = [svg_element(inst) for inst in self.instructions if inst.op not in ('PAPER', 'PEN')]
+
+    def _rebuild_symbols(self):
+        """Tabla de símbolos desde cero (solo al cargar el texto)"""
+        self.compiler.symbol_table = SymbolTable()
+        lines = [line for line, group in enumerate(self._line_statements, 1) for _ in group]
+        self.compiler.build_symbol_table(self.program, lines)
+
+    def _header(self) -> List[str]:
+        paper = self.symbol_table.get_symbol("paper_size")
+        pen = self.symbol_table.get_symbol("pen_width")
+        return svg_header(paper.value if paper else 100, pen.value if pen else 1)
+
+    def _offset(self, line: int, column: int) -> Tuple[int, int]:
+        if not 1 <= line <= len(self.lines):
+            raise ValueError(f"Línea fuera de rango: {line}")
+        if not 1 <= column <= len(self.lines[line - 1]) + 1:
+            raise ValueError(f"Columna fuera de rango: {column} en línea {line}")
+        return line - 1, column - 1
+
+    def apply_edit(self, edit: TextEdit) -> SvgPatch:
+        """Aplica una edición y devuelve qué elementos SVG cambiaron"""
+        first, start_col = self._offset(edit.start_line, edit.start_column)
+        last, end_col = self._offset(edit.end_line, edit.end_column)
+        if (last, end_col) < (first, start_col):
+            raise ValueError("El final de la edición está antes del inicio")
+
+        text = self.lines[first][:start_col] + edit.text + self.lines[last][end_col:]
+        new_lines = text.split('\n')
+        stop = last + 1
+        new_stop = first + len(new_lines)
+        start = self._line_starts[first]
+        old_count = self._line_starts[stop] - start
+        element_start = self._line_elements[first]
+        element_stop = self._line_elements[stop]
+        header = self._header()
+
+        self.lines[first:stop] = new_lines
+        parsed = [self._parse_line(index) for index in range(first, new_stop)]
+        self._line_statements[first:stop] = [statements for statements, _, _ in parsed]
+        self._set_states(first, stop, [state for _, state, _ in parsed])
+        groups = self._line_statements[first:new_stop]
+        moved = _replace_counts(self._line_starts, first, stop, list(map(len, groups)))
+        moved |= _replace_counts(self._line_elements, first, stop, list(map(_count_shapes, groups)))
+        moved |= new_stop != stop
+
+        new_statements = [stmt for statements in groups for stmt in statements]
+        old_statements = self.program.statements[start:start + old_count]
+        if len(new_statements) == old_count and all(
+                type(new) is type(old) for new, old in zip(new_statements, old_statements)):
+            patch = self._patch_values(start, element_start, new_statements)
+            if moved:
+                # Los nombres no cambian, pero sí las líneas de los símbolos
+                self._splice_shapes(first, new_stop, element_start, element_stop - element_start,
+                                    new_stop - stop)
+        else:
+            patch = self._splice(start, old_count, element_start, element_stop, new_statements)
+            self._splice_shapes(first, new_stop, element_start, element_stop - element_start,
+                                new_stop - stop)
+        self._update_configs(first, stop, new_stop)
+
+        new_header = self._header()
+        if new_header != header:
+            patch.header = new_header
+        return patch
+
+    def _patch_values(self, start: int, element: int, statements: list) -> SvgPatch:
+        # Mismos tipos en las mismas posiciones: nombres e índices no cambian
+        patch = SvgPatch(element, 0)
+        for position, stmt in enumerate(statements, start):
+            shape = shape_params(stmt)
+            # repr distingue 3 de 3.0, que se escriben distinto en el SVG
+            if repr(stmt) != repr(self.program.statements[position]):
+                self.program.statements[position] = stmt
+                instruction = IntermediateCodeGenerator.translate(stmt)
+                self.instructions[position] = instruction
+                if shape is not None:
+                    self.symbol_table.update_symbol(f"{shape[0]}_{element + 1}", shape[1])
+                    self.elements[element] = svg_element(instruction)
+                    if not patch.removed:
+                        patch.start = element
+                    patch.removed = element + 1 - patch.start
+            if shape is not None:
+                element += 1
+
+        patch.elements = self.elements[patch.start:patch.start + patch.removed]
+        return patch
+
+    def _splice(self, start: int, old_count: int, element_start: int, element_stop: int,
+                statements: list) -> SvgPatch:
+        instructions = [IntermediateCodeGenerator.translate(stmt) for stmt in statements]
+        self.program.statements[start:start + old_count] = statements
+        self.instructions[start:start + old_count] = instructions
+        elements = [svg_element(inst) for inst in instructions if inst.op not in ('PAPER', 'PEN')]
+        self.elements[element_start:element_stop] = elements
+        return SvgPatch(element_start, element_stop - element_start, elements)
+
+    def _splice_shapes(self, first: int, new_stop: int, element_start: int, removed: int,
+                       line_delta: int):
+        # Las figuras de las líneas [first, new_stop) sustituyen a las removed
+        # que había desde element_start; las siguientes bajan line_delta líneas
+        shapes = ((shape_params(stmt), line)
+                  for line, group in enumerate(self._line_statements[first:new_stop], first + 1)
+                  for stmt in group)
+        entries = [(shape[0], tuple(shape[1].values()), line) for shape, line in shapes if shape is not None]
+        self.symbol_table.splice_shapes(element_start + 1, removed, entries, line_delta)
+
+    def _update_configs(self, first: int, stop: int, new_stop: int):
+        # Las líneas [first, stop) son ahora [first, new_stop): cada
+        # configuración toma el valor y la línea de su última declaración
+        line_delta = new_stop - stop
+        table = self.symbol_table
+        changed = False
+        for node_type, (name, value_of) in _CONFIG_SYMBOLS.items():
+            lines = self._config_lines[name]
+            low = bisect_left(lines, first)
+            found = [index for index in range(first, new_stop)
+                     if any(type(stmt) is node_type for stmt in self._line_statements[index])]
+            if low == len(lines) and not found:
+                continue
+            lines[low:] = found + [index + line_delta for index in lines[bisect_left(lines, stop):]]
+            changed = True
+            if not lines:
+                table.remove_symbol(name)
+                continue
+            stmt = [stmt for stmt in self._line_statements[lines[-1]] if type(stmt) is node_type][-1]
+            if table.exists(name):
+                table.update_symbol(name, value_of(stmt)).line = lines[-1] + 1
+            else:
+                table.add_config(name, value_of(stmt), lines[-1] + 1)
+        if changed:
+            self._order_configs()
+
+    def _order_configs(self):
+        # Orden de recorrido de la compilación completa: cada configuración
+        # tras las figuras anteriores a su primera declaración
+        firsts = []
+        for node_type, (name, _) in _CONFIG_SYMBOLS.items():
+            lines = self._config_lines[name]
+            if lines:
+                group = self._line_statements[lines[0]]
+                index = next(i for i, stmt in enumerate(group) if type(stmt) is node_type)
+                firsts.append((self._line_starts[lines[0]] + index,
+                               self._line_elements[lines[0]] + _count_shapes(group[:index]), name))
+        for _, shapes_before, name in sorted(firsts):
+            self.symbol_table.move_symbol(name, shapes_before)
+
+    def build_svg(self) -> str:
+        return '\n'.join(self._header() + self.elements + SVG_FOOTER)
+
+
+def _count_shapes(statements: list) -> int:
+    return sum(type(stmt) not in _CONFIG_SYMBOLS for stmt in statements)
+
+
+def _replace_counts(starts: array, first: int, stop: int, counts: List[int]) -> bool:
+    # starts son sumas acumuladas por línea; las líneas [first, stop) pasan a
+    # tener counts y se desplazan las siguientes. Devuelve si cambió algo
+    if stop - first == len(counts) and all(
+            starts[index + 1] - starts[index] == count for index, count in enumerate(counts, first)):
+        return False
+    delta = sum(counts) - (starts[stop] - starts[first])
+    starts[first + 1:stop + 1] = array('l', accumulate([starts[first]] + counts))[1:]
+    shift_values(starts, first + len(counts) + 1, delta)
+    return True
@@ -2,10 +2,18 @@
 GENERADOR DE CÓDIGO INTERMEDIO
 """
 
+from array import array
+from collections import defaultdict
 from dataclasses import dataclass
-from typing import List
+from fractions import Fraction
+from typing import Iterable, Iterator, List, Optional, Tuple
 from parser import *
 
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él se usan bucles sobre array
+    np = None
+
 @dataclass
 class IntermediateInstruction:
     op: str
@@ -23,8 +31,86 @@ class IntermediateInstruction:
             return f"{self.op} {self.arg1}, {self.arg2}, {self.arg3}"
         elif self.op == 'RECT':
             return f"{self.op} {self.arg1}, {self.arg2}, {self.arg3}, {self.result}"
+        elif self.op == 'POLYLINE':
+            points = self.arg1
+            return f"{self.op} " + ", ".join(f"({points[k]} {points[k + 1]})" for k in range(0, len(points), 2))
         return f"{self.op}"
 
+# Niveles de optimización
+OPT_NONE = 0      # Sin optimizar
+OPT_PEEPHOLE = 1  # Duplicados consecutivos (por defecto)
+OPT_GLOBAL = 2    # Figuras repetidas en todo el programa y PAPER/PEN sin efecto
+OPT_GEOMETRY = 3  # Global + segmentos unidos en líneas y polilíneas (POLYLINE)
+OPT_LEVELS = (OPT_NONE, OPT_PEEPHOLE, OPT_GLOBAL, OPT_GEOMETRY)
+
+def _normalize(op: str, args: Tuple) -> Tuple:
+    # Operandos como float (10 == 10.0, -0.0 == 0.0); una línea es la misma
+    # en ambos sentidos
+    values = tuple(float(v) + 0.0 for v in args[:OP_ARITY[op]])
+    if op == 'LINE' and values[2:] < values[:2]:
+        values = values[2:] + values[:2]
+    return values
+
+def global_keep_flags(rows: Iterable[Tuple]) -> List[bool]:
+    """Marca qué instrucciones sobreviven a la optimización global en O(n).
+    
+    - Una figura se elimina si ya se dibujó antes con el mismo lápiz.
+    - Un PEN se elimina si no cambia el lápiz de ninguna figura conservada
+      (repite el valor vigente, lo pisa otro PEN o no le sigue ninguna figura),
+      salvo el último, que fija el grosor del trazo del SVG.
+    - Solo el último PAPER tiene efecto.
+    """
+    keep: List[bool] = []
+    seen = set()
+    pen = None            # lápiz vigente para las figuras siguientes
+    drawn_pen = None      # lápiz del último PEN conservado
+    pending_pen = None    # índice del PEN aún no confirmado
+    last_paper = None
+    last_pen = None
+    
+    for index, row in enumerate(rows):
+        op = row[0]
+        keep.append(False)
+        if op == 'PAPER':
+            last_paper = index
+        elif op == 'PEN':
+            pen = float(row[1]) + 0.0
+            pending_pen = index
+            last_pen = index
+        elif op in OP_ARITY:
+            key = (pen, op, _normalize(op, row[1:]))
+            if key in seen:
+                continue
+            seen.add(key)
+            keep[index] = True
+            if pending_pen is not None and pen != drawn_pen:
+                keep[pending_pen] = True
+                drawn_pen = pen
+            pending_pen = None
+        else:
+            keep[index] = True
+    
+    for index in (last_paper, last_pen):
+        if index is not None:
+            keep[index] = True
+    return keep
+
+def keep_flags(rows: Iterable[Tuple], level: int) -> List[bool]:
+    """Qué instrucciones conserva optimize(level), sin optimizar. OPT_GEOMETRY
+    no tiene equivalente: une varias líneas en una instrucción nueva."""
+    if level == OPT_GEOMETRY:
+        raise ValueError("OPT_GEOMETRY une instrucciones: use opt_level <= OPT_GLOBAL")
+    if level == OPT_GLOBAL:
+        return global_keep_flags(rows)
+    if level == OPT_NONE:
+        return [True for _ in rows]
+    keep = []
+    prev = None
+    for row in rows:
+        keep.append(row != prev)
+        prev = row
+    return keep
+
 class IntermediateCodeGenerator:
     def __init__(self):
         self.instructions: List[IntermediateInstruction] = []
@@ -38,16 +124,35 @@ class IntermediateCodeGenerator:
         if isinstance(node, ProgramNode):
             for stmt in node.statements:
                 self.generate_from_ast(stmt)
-        elif isinstance(node, PaperNode):
-            self.emit('PAPER', node.size)
+        else:
+            instruction = self.translate(node)
+            if instruction is not None:
+                self.instructions.append(instruction)
+    
+    @staticmethod
+    def translate(node: ASTNode) -> Optional[IntermediateInstruction]:
+        if isinstance(node, PaperNode):
+            return IntermediateInstruction('PAPER', node.size)
         elif isinstance(node, PenNode):
-            self.emit('PEN', node.width)
+            return IntermediateInstruction('PEN', node.width)
         elif isinstance(node, LineNode):
-            self.emit('LINE', node.x1, node.y1, node.x2, node.y2)
+            return IntermediateInstruction('LINE', node.x1, node.y1, node.x2, node.y2)
         elif isinstance(node, CircleNode):
-            self.emit('CIRCLE', node.x, node.y, node.radius)
+            return IntermediateInstruction('CIRCLE', node.x, node.y, node.radius)
         elif isinstance(node, RectNode):
-            self.emit('RECT', node.x, node.y, node.width, node.height)
+            return IntermediateInstruction('RECT', node.x, node.y, node.width, node.height)
+        return None
+    
+    def iter_instructions(self, statements: Iterable[ASTNode]) -> Iterator[IntermediateInstruction]:
+        """Traduce declaraciones a instrucciones sin almacenarlas (modo streaming)"""
+        for stmt in statements:
+            instruction = self.translate(stmt)
+            if instruction is not None:
+                yield instruction
+    
+    def rows(self) -> Iterator[Tuple]:
+        for i in self.instructions:
+            yield (i.op, i.arg1, i.arg2, i.arg3, i.result)
     
     def print_code(self):
         print("\n" + "=" * 60)
@@ -58,19 +163,445 @@ class IntermediateCodeGenerator:
         print("=" * 60)
     
     def to_json(self):
-        import json
-        return json.dumps([{
-            'op': i.op, 'arg1': i.arg1, 'arg2': i.arg2,
-            'arg3': i.arg3, 'result': i.result
-        } for i in self.instructions], indent=2)
-    
-    def optimize(self):
-        optimized = []
-        prev = None
-        for inst in self.instructions:
-            if inst != prev:
-                optimized.append(inst)
-            prev = inst
+        return instructions_to_json(self.instructions)
+    
+    def optimize(self, level: int = OPT_PEEPHOLE):
+        if level == OPT_NONE:
+            return 0
+        if level in (OPT_GLOBAL, OPT_GEOMETRY):
+            keep = global_keep_flags(self.rows())
+            optimized = [inst for inst, flag in zip(self.instructions, keep) if flag]
+            if level == OPT_GEOMETRY:
+                optimized = merge_lines(optimized)
+        else:
+            optimized = list(optimize_stream(self.instructions))
         removed = len(self.instructions) - len(optimized)
         self.instructions = optimized
         return removed
+
+
+def instructions_to_json(instructions: Iterable[IntermediateInstruction]) -> str:
+    import json
+    return json.dumps([{
+        'op': i.op, 'arg1': i.arg1, 'arg2': i.arg2,
+        'arg3': i.arg3, 'result': i.result
+    } for i in instructions], indent=2)
+
+
+def optimize_stream(instructions: Iterable[IntermediateInstruction]) -> Iterator[IntermediateInstruction]:
+    """Elimina instrucciones duplicadas consecutivas sobre un flujo"""
+    prev = None
+    for inst in instructions:
+        if inst != prev:
+            yield inst
+        prev = inst
+
+
+def _point(x, y) -> Tuple[float, float]:
+    # Clave de un extremo: 10 == 10.0 y -0.0 == 0.0
+    return (float(x) + 0.0, float(y) + 0.0)
+
+
+def merge_collinear(segments: List[Tuple]) -> List[Tuple]:
+    """Une los segmentos (x1, y1, x2, y2) colineales que se solapan o se
+    tocan en uno solo que va del extremo mínimo al máximo.
+    
+    La recta de cada segmento se calcula con fracciones exactas, así que
+    solo se unen segmentos exactamente alineados. Los segmentos que no se
+    unen conservan sus valores y su sentido; el orden de salida es el de la
+    primera aparición de cada resultado.
+    """
+    groups = defaultdict(list)
+    merged = []
+    for index, segment in enumerate(segments):
+        x1, y1, x2, y2 = (Fraction(v) for v in segment)
+        if x1 == x2 and y1 == y2:
+            merged.append((index, segment))
+            continue
+        if x1 == x2:
+            key, start, end = (None, x1), y1, y2
+        else:
+            slope = (y2 - y1) / (x2 - x1)
+            key, start, end = (slope, y1 - slope * x1), x1, x2
+        groups[key].append((min(start, end), max(start, end), index, segment, start > end))
+    
+    for intervals in groups.values():
+        intervals.sort()
+        run = None
+        for low, high, index, segment, reverse in intervals:
+            if run is not None and low <= run[1]:
+                # Se solapa o toca: se alarga el tramo actual
+                run[4] += 1
+                run[2] = min(run[2], index)
+                if high > run[1]:
+                    run[1] = high
+                    run[6] = segment[:2] if reverse else segment[2:]
+                continue
+            if run is not None:
+                merged.append(_collinear_segment(run))
+            run = [low, high, index, segment, 1,
+                   segment[2:] if reverse else segment[:2],
+                   segment[:2] if reverse else segment[2:]]
+        merged.append(_collinear_segment(run))
+    
+    merged.sort(key=lambda item: item[0])
+    return [segment for _, segment in merged]
+
+
+def _collinear_segment(run) -> Tuple[int, Tuple]:
+    _, _, index, segment, count, low_point, high_point = run
+    if count == 1:
+        return index, segment
+    return index, low_point + high_point
+
+
+def chain_segments(segments: List[Tuple]) -> List[Tuple]:
+    """Encadena segmentos (x1, y1, x2, y2) que comparten extremos.
+    
+    Devuelve una tupla plana de coordenadas (x1, y1, x2, y2, ...) por cada
+    cadena; una cadena de un solo segmento es el segmento original. Cada
+    cadena crece desde un segmento hacia delante y hacia atrás mientras
+    quede algún segmento sin usar en su extremo.
+    """
+    count = len(segments)
+    ends = []
+    incident = defaultdict(list)
+    for index, (x1, y1, x2, y2) in enumerate(segments):
+        a, b = _point(x1, y1), _point(x2, y2)
+        ends.append((a, b))
+        if a != b:
+            incident[a].append(index)
+            incident[b].append(index)
+    
+    used = [False] * count
+    
+    def extend(vertex) -> list:
+        # Puntos (valores originales) que se añaden avanzando desde vertex
+        points = []
+        edges = incident[vertex]
+        while edges:
+            index = edges.pop()
+            if used[index]:
+                continue
+            used[index] = True
+            a, b = ends[index]
+            x1, y1, x2, y2 = segments[index]
+            if a == vertex:
+                points.append((x2, y2))
+                vertex = b
+            else:
+                points.append((x1, y1))
+                vertex = a
+            edges = incident[vertex]
+        return points
+    
+    chains = []
+    for index in range(count):
+        if used[index]:
+            continue
+        used[index] = True
+        x1, y1, x2, y2 = segments[index]
+        if ends[index][0] == ends[index][1]:
+            chains.append(segments[index])
+            continue
+        forward = extend(ends[index][1])
+        backward = extend(ends[index][0])
+        points = backward[::-1] + [(x1, y1), (x2, y2)] + forward
+        chains.append(tuple(v for point in points for v in point))
+    return chains
+
+
+def merge_lines(instructions: Iterable[IntermediateInstruction]) -> List[IntermediateInstruction]:
+    """Une los LINE que dibuja un mismo lápiz: primero los colineales que se
+    tocan (merge_collinear) y después los que comparten extremos, que pasan a
+    ser una POLYLINE cuyo arg1 es la tupla plana de coordenadas.
+    
+    Un PEN corta los tramos. Las líneas de cada tramo se escriben donde
+    estaba su primera línea; como todas las figuras comparten color y no
+    tienen relleno, el dibujo no cambia salvo en las esquinas, que la
+    polilínea une en lugar de dejar dos extremos rectos.
+    """
+    output = []
+    lines = None
+    
+    def flush():
+        if lines:
+            segments = merge_collinear([(i.arg1, i.arg2, i.arg3, i.result) for i in lines])
+            lines[:] = [IntermediateInstruction('LINE', *chain) if len(chain) == 4
+                        else IntermediateInstruction('POLYLINE', chain)
+                        for chain in chain_segments(segments)]
+    
+    for inst in instructions:
+        if inst.op == 'LINE':
+            if lines is None:
+                lines = []
+                output.append(lines)
+            lines.append(inst)
+            continue
+        if inst.op == 'PEN':
+            flush()
+            lines = None
+        output.append(inst)
+    flush()
+    
+    merged = []
+    for item in output:
+        if isinstance(item, list):
+            merged.extend(item)
+        else:
+            merged.append(item)
+    return merged
+
+
+# Representación columnar del código intermedio
+OPCODES = ('PAPER', 'PEN', 'LINE', 'CIRCLE', 'RECT')
+OP_CODES = {op: code for code, op in enumerate(OPCODES)}
+OP_ARITY = {'PAPER': 1, 'PEN': 1, 'LINE': 4, 'CIRCLE': 3, 'RECT': 4}
+IR_WIDTH = 4
+# Los enteros de valor absoluto mayor no caben exactos en un float64
+MAX_EXACT_INT = 2 ** 53
+
+_ARITY_BY_CODE = [OP_ARITY[op] for op in OPCODES]
+_NODE_OPERANDS = {
+    PaperNode: ('PAPER', ('size',)),
+    PenNode: ('PEN', ('width',)),
+    LineNode: ('LINE', ('x1', 'y1', 'x2', 'y2')),
+    CircleNode: ('CIRCLE', ('x', 'y', 'radius')),
+    RectNode: ('RECT', ('x', 'y', 'width', 'height')),
+}
+_NODE_SPECS = {
+    node_class: (OP_CODES[op], lambda node, fields=fields: tuple(getattr(node, f) for f in fields),
+                 (0.0,) * (IR_WIDTH - len(fields)))
+    for node_class, (op, fields) in _NODE_OPERANDS.items()
+}
+# Operandos que son coordenadas X, coordenadas Y o longitudes, por opcode
+_X_SLOTS = {'LINE': (0, 2), 'CIRCLE': (0,), 'RECT': (0,)}
+_Y_SLOTS = {'LINE': (1, 3), 'CIRCLE': (1,), 'RECT': (1,)}
+_LENGTH_SLOTS = {'CIRCLE': (2,), 'RECT': (2, 3)}
+_ROW_CHUNK = 65536
+
+
+def inexact_int_error(value: int) -> ValueError:
+    return ValueError(f"Entero demasiado grande para un operando float64: {value} "
+                      f"(máximo {MAX_EXACT_INT} en valor absoluto)")
+
+
+class ColumnarIR:
+    """Código intermedio en columnas: un array de opcodes y una matriz de
+    operandos float64 de IR_WIDTH columnas, en lugar de un objeto por
+    instrucción. int_mask marca qué operandos eran enteros para conservar
+    el formato de salida (10 frente a 10.0); un entero mayor que
+    MAX_EXACT_INT en valor absoluto se rechaza con ValueError en lugar de
+    redondearlo. Los operandos no usados valen 0.
+    
+    Ofrece la misma interfaz que IntermediateCodeGenerator, así que puede
+    sustituirlo en SimpleDrawCompiler. Con NumPy instalado, optimize() y
+    transform() son vectoriales.
+    """
+    
+    def __init__(self):
+        self.ops = array('B')
+        self.operands = array('d')
+        self.int_mask = array('B')
+    
+    def __len__(self):
+        return len(self.ops)
+    
+    @property
+    def instructions(self) -> "ColumnarIR":
+        return self
+    
+    def emit(self, op: str, arg1=None, arg2=None, arg3=None, result=None):
+        self.emit_many(op, [(arg1, arg2, arg3, result)[:OP_ARITY[op]]])
+    
+    def emit_many(self, op: str, rows: Iterable[Tuple]):
+        """Añade en bloque filas de operandos de un mismo opcode"""
+        code = OP_CODES[op]
+        padding = (0.0,) * (IR_WIDTH - OP_ARITY[op])
+        ops, operands, int_mask = self.ops, self.operands, self.int_mask
+        for row in rows:
+            mask = 0
+            for slot, value in enumerate(row):
+                if isinstance(value, int):
+                    if not -MAX_EXACT_INT <= value <= MAX_EXACT_INT:
+                        raise inexact_int_error(value)
+                    mask |= 1 << slot
+            ops.append(code)
+            operands.extend(row)
+            operands.extend(padding)
+            int_mask.append(mask)
+    
+    def generate_from_ast(self, node: ASTNode):
+        statements = node.statements if isinstance(node, ProgramNode) else [node]
+        ops, int_mask = self.ops, self.int_mask
+        flat = []
+        for stmt in statements:
+            spec = _NODE_SPECS.get(type(stmt))
+            if spec is None:
+                continue
+            code, get_operands, padding = spec
+            row = get_operands(stmt)
+            mask = 0
+            for slot, value in enumerate(row):
+                if type(value) is int:
+                    if not -MAX_EXACT_INT <= value <= MAX_EXACT_INT:
+                        raise inexact_int_error(value)
+                    mask |= 1 << slot
+            ops.append(code)
+            int_mask.append(mask)
+            flat += row
+            flat += padding
+            if len(flat) >= _ROW_CHUNK:
+                self.operands.extend(flat)
+                flat = []
+        self.operands.extend(flat)
+    
+    @classmethod
+    def from_instructions(cls, instructions: Iterable[IntermediateInstruction]) -> "ColumnarIR":
+        ir = cls()
+        for i in instructions:
+            ir.emit(i.op, i.arg1, i.arg2, i.arg3, i.result)
+        return ir
+    
+    def _row(self, code: int, values, mask: int) -> Tuple:
+        arity = _ARITY_BY_CODE[code]
+        args = [int(values[slot]) if mask >> slot & 1 else values[slot] for slot in range(arity)]
+        args.extend([None] * (IR_WIDTH - arity))
+        return (OPCODES[code], *args)
+    
+    def rows(self) -> Iterator[Tuple]:
+        """Recorre las filas por bloques: (op, arg1, arg2, arg3, result)"""
+        row = self._row
+        for start in range(0, len(self.ops), _ROW_CHUNK):
+            stop = start + _ROW_CHUNK
+            ops = self.ops[start:stop].tolist()
+            values = self.operands[start * IR_WIDTH:stop * IR_WIDTH].tolist()
+            masks = self.int_mask[start:stop].tolist()
+            for k, code in enumerate(ops):
+                yield row(code, values[k * IR_WIDTH:(k + 1) * IR_WIDTH], masks[k])
+    
+    def __getitem__(self, index: int) -> IntermediateInstruction:
+        index = range(len(self.ops))[index]
+        values = self.operands[index * IR_WIDTH:(index + 1) * IR_WIDTH]
+        return IntermediateInstruction(*self._row(self.ops[index], values, self.int_mask[index]))
+    
+    def __iter__(self) -> Iterator[IntermediateInstruction]:
+        return (IntermediateInstruction(*row) for row in self.rows())
+    
+    def to_instructions(self) -> List[IntermediateInstruction]:
+        return list(self)
+    
+    def print_code(self):
+        print("\n" + "=" * 60)
+        print("CÓDIGO INTERMEDIO".center(60))
+        print("=" * 60)
+        for i, inst in enumerate(self):
+            print(f"{i:3d}: {inst}")
+        print("=" * 60)
+    
+    def to_json(self):
+        import json
+        return json.dumps([{
+            'op': op, 'arg1': arg1, 'arg2': arg2,
+            'arg3': arg3, 'result': result
+        } for op, arg1, arg2, arg3, result in self.rows()], indent=2)
+    
+    def nbytes(self) -> int:
+        return sum(c.itemsize * len(c) for c in (self.ops, self.operands, self.int_mask))
+    
+    def as_numpy(self):
+        """Vistas NumPy sin copia: (opcodes, matriz de operandos n x IR_WIDTH)"""
+        if np is None:
+            raise RuntimeError("NumPy no está instalado")
+        ops = np.frombuffer(self.ops, dtype=np.uint8)
+        operands = np.frombuffer(self.operands, dtype=np.float64).reshape(-1, IR_WIDTH)
+        return ops, operands
+    
+    def _keep(self, keep):
+        # Conserva solo las filas marcadas en keep (secuencia de booleanos)
+        ops, operands, int_mask = array('B'), array('d'), array('B')
+        for index, flag in enumerate(keep):
+            if flag:
+                ops.append(self.ops[index])
+                operands.extend(self.operands[index * IR_WIDTH:(index + 1) * IR_WIDTH])
+                int_mask.append(self.int_mask[index])
+        self.ops, self.operands, self.int_mask = ops, operands, int_mask
+    
+    def _keep_numpy(self, keep):
+        ops, operands = self.as_numpy()
+        masks = np.frombuffer(self.int_mask, dtype=np.uint8)
+        kept_ops = ops[keep].tobytes()
+        kept_operands = operands[keep].tobytes()
+        kept_masks = masks[keep].tobytes()
+        self.ops = array('B', kept_ops)
+        self.operands = array('d')
+        self.operands.frombytes(kept_operands)
+        self.int_mask = array('B', kept_masks)
+    
+    def optimize(self, level: int = OPT_PEEPHOLE):
+        """Mismos niveles que IntermediateCodeGenerator.optimize; en el nivel
+        de mirilla 10 y 10.0 se consideran iguales, como en las dataclasses"""
+        if level == OPT_GEOMETRY:
+            raise ValueError("ColumnarIR no admite POLYLINE: use opt_level <= OPT_GLOBAL")
+        count = len(self.ops)
+        if level == OPT_NONE or count == 0:
+            return 0
+        if level == OPT_GLOBAL:
+            keep = global_keep_flags(self.rows())
+            removed = keep.count(False)
+            if removed:
+                if np is not None:
+                    self._keep_numpy(np.array(keep, dtype=bool))
+                else:
+                    self._keep(keep)
+            return removed
+        if count < 2:
+            return 0
+        if np is not None:
+            ops, operands = self.as_numpy()
+            keep = np.ones(count, dtype=bool)
+            keep[1:] = (ops[1:] != ops[:-1]) | (operands[1:] != operands[:-1]).any(axis=1)
+            removed = int(count - keep.sum())
+            if removed:
+                self._keep_numpy(keep)
+            return removed
+        
+        keep = [True] * count
+        operands = self.operands
+        for index in range(1, count):
+            if (self.ops[index] == self.ops[index - 1] and
+                    operands[index * IR_WIDTH:(index + 1) * IR_WIDTH] ==
+                    operands[(index - 1) * IR_WIDTH:index * IR_WIDTH]):
+                keep[index] = False
+        removed = keep.count(False)
+        if removed:
+            self._keep(keep)
+        return removed
+    
+    def transform(self, scale: float = 1.0, dx: float = 0.0, dy: float = 0.0):
+        """Escala y desplaza en bloque todas las figuras (PAPER/PEN no cambian).
+        Un operando entero sigue siéndolo solo si el resultado es entero."""
+        if np is not None:
+            ops, operands = self.as_numpy()
+            masks = np.frombuffer(self.int_mask, dtype=np.uint8).copy()
+            for op in ('LINE', 'CIRCLE', 'RECT'):
+                rows = ops == OP_CODES[op]
+                for slots, offset in ((_X_SLOTS, dx), (_Y_SLOTS, dy), (_LENGTH_SLOTS, 0.0)):
+                    for slot in slots.get(op, ()):
+                        column = operands[rows, slot] * scale + offset
+                        operands[rows, slot] = column
+                        integral = np.floor(column) == column
+                        masks[rows] &= np.where(integral, 0xFF, 0xFF ^ (1 << slot)).astype(np.uint8)
+            self.int_mask = array('B', masks.tobytes())
+            return
+        
+        operands = self.operands
+        for index, code in enumerate(self.ops):
+            op = OPCODES[code]
+            for slots, offset in ((_X_SLOTS, dx), (_Y_SLOTS, dy), (_LENGTH_SLOTS, 0.0)):
+                for slot in slots.get(op, ()):
+                    position = index * IR_WIDTH + slot
+                    value = operands[position] * scale + offset
+                    operands[position] = value
+                    if not value.is_integer():
+                        self.int_mask[index] &= 0xFF ^ (1 << slot)
@@ -0,0 +1,277 @@
+"""
+FORMATO BINARIO DEL CÓDIGO INTERMEDIO
+Archivo .sdir compacto que se carga con mmap y vistas memoryview, sin
+analizar instrucción por instrucción
+
+Estructura (little-endian, secciones de float64 alineadas a 8 bytes):
+
+    cabecera    32 bytes: magic b'SDIR', versión (H), ancho de operandos (H),
+                número de opcodes (H), 6 bytes reservados, instrucciones (Q),
+                coordenadas de polilíneas (Q)
+    opcodes     un nombre de 8 bytes por opcode (relleno con NUL)
+    ops         un byte por instrucción: índice en la tabla de opcodes
+    int_mask    un byte por instrucción: bit k = el operando k era entero
+    operands    ancho float64 por instrucción (0 en los no usados)
+    points      float64 de las polilíneas; una POLYLINE guarda en sus
+                operandos (inicio, número de coordenadas)
+    point_mask  un byte por coordenada: 1 = era entera
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: solo para as_numpy()
+    np = None
+
+from intermediate_code import (ColumnarIR, IntermediateInstruction, OPCODES, OP_ARITY, OP_CODES,
+                               IR_WIDTH, MAX_EXACT_INT, inexact_int_error)
+
+IR_MAGIC = b'SDIR'
+IR_VERSION = 1
+IR_EXTENSION = '.sdir'
+
+# Tabla de opcodes que se escribe: los del IR columnar y POLYLINE (-O 3)
+FILE_OPCODES = OPCODES + ('POLYLINE',)
+_POLYLINE = len(OPCODES)
+
+_HEADER = struct.Struct('<4sHHH6xQQ')
+_NAME = struct.Struct('8s')
+_ROW_CHUNK = 65536
+# Los arrays se guardan en el orden de bytes de la máquina
+_SWAP = sys.byteorder != 'little'
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _layout(opcodes: int, count: int, points: int) -> Tuple[int, int, int, int, int, int]:
+    """Desplazamientos de (ops, int_mask, operands, points, point_mask, fin)"""
+    ops = _HEADER.size + opcodes * _NAME.size
+    masks = ops + count
+    operands = _align(masks + count)
+    point_values = operands + count * IR_WIDTH * 8
+    point_masks = point_values + points * 8
+    return ops, masks, operands, point_values, point_masks, point_masks + points
+
+
+def _copy(typecode: str, buffer) -> array:
+    copy = array(typecode)
+    copy.frombytes(memoryview(buffer).cast('B'))
+    return copy
+
+
+def _encode(instructions: Iterable[IntermediateInstruction]):
+    # Lista de instrucciones -> arrays del formato
+    ops, masks, operands = array('B'), array('B'), array('d')
+    points, point_masks = array('d'), array('B')
+    for i in instructions:
+        if i.op == 'POLYLINE':
+            ops.append(_POLYLINE)
+            masks.append(0)
+            operands.extend((len(points), len(i.arg1), 0.0, 0.0))
+            for value in i.arg1:
+                if type(value) is int and not -MAX_EXACT_INT <= value <= MAX_EXACT_INT:
+                    raise inexact_int_error(value)
+            points.extend(i.arg1)
+            point_masks.extend(1 if type(value) is int else 0 for value in i.arg1)
+            continue
+        arity = OP_ARITY[i.op]
+        args = (i.arg1, i.arg2, i.arg3, i.result)[:arity]
+        mask = 0
+        for slot, value in enumerate(args):
+            if type(value) is int:
+                if not -MAX_EXACT_INT <= value <= MAX_EXACT_INT:
+                    raise inexact_int_error(value)
+                mask |= 1 << slot
+        ops.append(OP_CODES[i.op])
+        masks.append(mask)
+        operands.extend(args)
+        operands.extend((0.0,) * (IR_WIDTH - arity))
+    return ops, masks, operands, points, point_masks
+
+
+def write_ir(path: str, instructions) -> int:
+    """Escribe el código intermedio (lista de instrucciones o ColumnarIR)
+    en formato .sdir y devuelve el tamaño en bytes. Un ColumnarIR se vuelca
+    tal cual, sin recorrer sus filas."""
+    if isinstance(instructions, ColumnarIR):
+        ops, masks, operands = instructions.ops, instructions.int_mask, instructions.operands
+        points, point_masks = array('d'), array('B')
+    else:
+        ops, masks, operands, points, point_masks = _encode(instructions)
+    if _SWAP:
+        operands, points = array('d', operands), array('d', points)
+        operands.byteswap()
+        points.byteswap()
+
+    count = len(ops)
+    offsets = _layout(len(FILE_OPCODES), count, len(points))
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(IR_MAGIC, IR_VERSION, IR_WIDTH, len(FILE_OPCODES), count, len(points)))
+        f.write(b''.join(_NAME.pack(op.encode()) for op in FILE_OPCODES))
+        f.write(ops.tobytes())
+        f.write(masks.tobytes())
+        f.write(b'\0' * (offsets[2] - offsets[1] - count))
+        f.write(operands.tobytes())
+        f.write(points.tobytes())
+        f.write(point_masks.tobytes())
+    return offsets[-1]
+
+
+class MappedIR:
+    """Código intermedio .sdir mapeado en memoria.
+
+    Abrirlo solo lee la cabecera y la tabla de opcodes: ops, int_mask,
+    operands, points y point_mask son vistas memoryview sobre el mmap, sin
+    copia. Las filas (op, arg1, arg2, arg3, result) se construyen al
+    recorrerlas, igual que en ColumnarIR.rows(), así que sirve como fuente
+    de filas para SvgWriter, cull_rows o SpatialIndex. Uso:
+
+        with MappedIR("dibujo.sdir") as ir:
+            write_svg("dibujo.svg", ir.rows(), *ir.canvas())
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # archivo vacío
+                raise ValueError(f"{path}: no es un archivo {IR_EXTENSION}") from None
+        try:
+            self._open()
+        except Exception:
+            self._map.close()
+            raise
+
+    def _open(self):
+        buffer = self._map
+        if len(buffer) < _HEADER.size:
+            raise ValueError(f"{self.path}: no es un archivo {IR_EXTENSION}")
+        magic, version, width, opcodes, count, points = _HEADER.unpack_from(buffer)
+        if magic != IR_MAGIC:
+            raise ValueError(f"{self.path}: no es un archivo {IR_EXTENSION}")
+        if version != IR_VERSION or width != IR_WIDTH:
+            raise ValueError(f"{self.path}: versión {version} (ancho {width}) no soportada")
+        self._count = count
+        offsets = _layout(opcodes, count, points)
+        if len(buffer) < offsets[-1]:
+            raise ValueError(f"{self.path}: archivo truncado")
+
+        names = [_NAME.unpack_from(buffer, _HEADER.size + k * _NAME.size)[0].rstrip(b'\0').decode()
+                 for k in range(opcodes)]
+        self.opcodes: List[str] = names
+        self._arity = [OP_ARITY.get(name, 2) for name in names]
+        self._polyline = names.index('POLYLINE') if 'POLYLINE' in names else -1
+
+        view = memoryview(buffer)
+        ops, masks, operands, point_values, point_masks, end = offsets
+        self.ops = view[ops:masks]
+        self.int_mask = view[masks:masks + count]
+        self.operands = view[operands:point_values].cast('d')
+        self.points = view[point_values:point_masks].cast('d')
+        self.point_mask = view[point_masks:end]
+        if _SWAP:
+            # Máquina big-endian: una copia con los bytes invertidos
+            self.operands, self.points = _copy('d', self.operands), _copy('d', self.points)
+            self.operands.byteswap()
+            self.points.byteswap()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _find_last(self, op: str) -> Optional[int]:
+        # Última instrucción op, buscada por bytes en la sección de opcodes
+        if op not in self.opcodes:
+            return None
+        start = _HEADER.size + len(self.opcodes) * _NAME.size
+        position = self._map.rfind(bytes((self.opcodes.index(op),)), start, start + len(self.ops))
+        return None if position < 0 else position - start
+
+    def canvas(self) -> Tuple:
+        """(paper_size, pen_width): último PAPER y último PEN, o los valores
+        por defecto, como SimpleDrawCompiler.canvas()"""
+        values = []
+        for op, default in (('PAPER', 100), ('PEN', 1)):
+            index = self._find_last(op)
+            values.append(default if index is None else self[index].arg1)
+        return tuple(values)
+
+    def _row(self, code: int, values, mask: int) -> Tuple:
+        if code == self._polyline:
+            start, length = int(values[0]), int(values[1])
+            coords = self.points[start:start + length].tolist()
+            flags = self.point_mask[start:start + length]
+            return ('POLYLINE', tuple(int(v) if flag else v for v, flag in zip(coords, flags)),
+                    None, None, None)
+        arity = self._arity[code]
+        args = [int(values[slot]) if mask >> slot & 1 else values[slot] for slot in range(arity)]
+        args.extend([None] * (IR_WIDTH - arity))
+        return (self.opcodes[code], *args)
+
+    def rows(self) -> Iterator[Tuple]:
+        """Recorre las filas por bloques: (op, arg1, arg2, arg3, result)"""
+        row = self._row
+        for start in range(0, len(self.ops), _ROW_CHUNK):
+            stop = start + _ROW_CHUNK
+            ops = self.ops[start:stop].tolist()
+            values = self.operands[start * IR_WIDTH:stop * IR_WIDTH].tolist()
+            masks = self.int_mask[start:stop].tolist()
+            for k, code in enumerate(ops):
+                yield row(code, values[k * IR_WIDTH:(k + 1) * IR_WIDTH], masks[k])
+
+    def __getitem__(self, index: int) -> IntermediateInstruction:
+        index = range(len(self.ops))[index]
+        values = self.operands[index * IR_WIDTH:(index + 1) * IR_WIDTH].tolist()
+        return IntermediateInstruction(*self._row(self.ops[index], values, self.int_mask[index]))
+
+    def __iter__(self) -> Iterator[IntermediateInstruction]:
+        return (IntermediateInstruction(*row) for row in self.rows())
+
+    def to_instructions(self) -> List[IntermediateInstruction]:
+        return list(self)
+
+    def to_columnar(self) -> ColumnarIR:
+        """Copia en bloque a un ColumnarIR (sin POLYLINE)"""
+        if self._polyline >= 0 and self._polyline in self.ops.tobytes():
+            raise ValueError("ColumnarIR no admite POLYLINE")
+        if self.opcodes[:len(OPCODES)] != list(OPCODES):
+            raise ValueError("Tabla de opcodes distinta de la del IR columnar")
+        ir = ColumnarIR()
+        ir.ops = _copy('B', self.ops)
+        ir.int_mask = _copy('B', self.int_mask)
+        ir.operands = _copy('d', self.operands)
+        return ir
+
+    def as_numpy(self):
+        """Vistas NumPy sin copia: (opcodes, matriz de operandos n x IR_WIDTH)"""
+        if np is None:
+            raise RuntimeError("NumPy no está instalado")
+        ops = np.frombuffer(self.ops, dtype=np.uint8)
+        operands = np.frombuffer(self.operands, dtype=np.float64).reshape(-1, IR_WIDTH)
+        return ops, operands
+
+    def close(self):
+        # Las vistas deben soltarse antes de cerrar el mmap
+        for name in ('ops', 'int_mask', 'operands', 'points', 'point_mask'):
+            view = getattr(self, name, None)
+            if isinstance(view, memoryview):
+                view.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_ir(path: str) -> MappedIR:
+    """Abre un archivo .sdir (ver MappedIR)"""
+    return MappedIR(path)
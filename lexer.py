@@ -4,9 +4,11 @@ Tokeniza el código fuente del lenguaje SimpleDraw
 """
 
 import re
+import mmap
+from array import array
 from enum import Enum
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 class TokenType(Enum):
     # Palabras clave
@@ -27,6 +29,7 @@ class TokenType(Enum):
 
 @dataclass
 class Token:
+    __slots__ = ('type', 'value', 'line', 'column')
     type: TokenType
     value: any
     line: int
@@ -35,22 +38,227 @@ class Token:
     def __repr__(self):
         return f"Token({self.type.name}, {self.value}, L{self.line}:C{self.column})"
 
+
+# Códigos numéricos de TokenType para el almacenamiento columnar
+TOKEN_TYPES = list(TokenType)
+TYPE_CODES = {token_type: code for code, token_type in enumerate(TOKEN_TYPES)}
+# Códigos extra de NUMBER según cómo se guarda el valor
+CODE_FLOAT = len(TOKEN_TYPES)       # float en la columna values
+CODE_BIG_INT = len(TOKEN_TYPES) + 1  # entero sin representación exacta en float64
+CODE_NUMBER = TYPE_CODES[TokenType.NUMBER]
+_MAX_EXACT_INT = 2 ** 53
+
+class TokenBuffer:
+    """Tokens en columnas (struct-of-arrays) en lugar de un objeto por token.
+    
+    types guarda el código de tipo, lines/columns la posición y values el
+    valor numérico o el índice de la cadena internada en strings.
+    """
+    
+    def __init__(self):
+        self.types = array('B')
+        self.lines = array('L')
+        self.columns = array('L')
+        self.values = array('d')
+        self.strings: List[str] = []
+        self._string_ids: Dict[str, int] = {}
+    
+    def __len__(self):
+        return len(self.types)
+    
+    def intern(self, text: str) -> int:
+        index = self._string_ids.get(text)
+        if index is None:
+            index = len(self.strings)
+            self.strings.append(text)
+            self._string_ids[text] = index
+        return index
+    
+    def append(self, token_type: TokenType, value, line: int, column: int):
+        if token_type is TokenType.NUMBER:
+            if isinstance(value, float):
+                code = CODE_FLOAT
+            elif -_MAX_EXACT_INT <= value <= _MAX_EXACT_INT:
+                code = CODE_NUMBER
+            else:
+                code, value = CODE_BIG_INT, self.intern(str(value))
+        else:
+            code = TYPE_CODES[token_type]
+            value = self.intern(value) if isinstance(value, str) else 0
+        self.types.append(code)
+        self.lines.append(line)
+        self.columns.append(column)
+        self.values.append(value)
+    
+    def extend(self, tokens: Iterable):
+        # Acepta objetos Token o tuplas (tipo, valor, línea, columna)
+        append = self.append
+        for token in tokens:
+            if isinstance(token, Token):
+                append(token.type, token.value, token.line, token.column)
+            else:
+                append(*token)
+    
+    def type_at(self, index: int) -> TokenType:
+        code = self.types[index]
+        return TokenType.NUMBER if code >= CODE_FLOAT else TOKEN_TYPES[code]
+    
+    def is_number(self, index: int) -> bool:
+        code = self.types[index]
+        return code == CODE_NUMBER or code >= CODE_FLOAT
+    
+    def value_at(self, index: int):
+        code = self.types[index]
+        value = self.values[index]
+        if code == CODE_NUMBER:
+            return int(value)
+        if code == CODE_FLOAT:
+            return value
+        if code == CODE_BIG_INT:
+            return int(self.strings[int(value)])
+        token_type = TOKEN_TYPES[code]
+        if token_type is TokenType.NEWLINE:
+            return '\\n'
+        if token_type is TokenType.EOF:
+            return None
+        return self.strings[int(value)]
+    
+    def token(self, index: int) -> Token:
+        return Token(self.type_at(index), self.value_at(index), self.lines[index], self.columns[index])
+    
+    def __getitem__(self, index: int) -> Token:
+        return self.token(range(len(self))[index])
+    
+    def __iter__(self) -> Iterator[Token]:
+        return (self.token(i) for i in range(len(self)))
+    
+    @classmethod
+    def from_tokens(cls, tokens: Iterable) -> "TokenBuffer":
+        buffer = cls()
+        buffer.extend(tokens)
+        return buffer
+    
+    def nbytes(self) -> int:
+        columns = (self.types, self.lines, self.columns, self.values)
+        return sum(c.itemsize * len(c) for c in columns) + sum(len(t) for t in self.strings)
+
+# Motores de análisis léxico disponibles
+ENGINE_SCANNER = "scanner"  # Recorrido carácter por carácter (original)
+ENGINE_REGEX = "regex"      # Expresión regular maestra, un token por match
+ENGINES = (ENGINE_SCANNER, ENGINE_REGEX)
+DEFAULT_ENGINE = ENGINE_REGEX
+# Se elige solo cuando la fuente son bytes UTF-8 (p. ej. un mmap del archivo)
+ENGINE_BYTES = "bytes"
+BYTES_SOURCES = (bytes, bytearray, memoryview, mmap.mmap)
+
+# Expresión regular maestra: reconoce tokens completos de una sola vez.
+# Los caracteres no ASCII caen en OTHER y se resuelven con las mismas
+# reglas de str.isdigit()/str.isalpha() que usa el scanner original.
+_TOKEN_RE = re.compile(r"""
+    [ \t\r]*
+    (?:(?P<COMMENT>\#[^\n]*)
+    |(?P<NEWLINE>\n)
+    |(?P<NUMBER>\d[\d.]*)
+    |(?P<STRING>"[^"]*"?|'[^']*'?)
+    |(?P<WORD>[A-Za-z]\w*)
+    |(?P<OTHER>.)
+    |(?P<END>\Z))
+""", re.VERBOSE | re.DOTALL)
+
+# Versión para bytes: mismos tokens que el motor regex sobre el texto leído en
+# modo texto (saltos de línea universales: \r\n y \r solos cuentan como \n).
+_BYTE_TOKEN_RE = re.compile(rb"""
+    [ \t]*
+    (?:(?P<COMMENT>\#[^\r\n]*)
+    |(?P<NEWLINE>\r\n?|\n)
+    |(?P<NUMBER>[0-9][0-9.]*)
+    |(?P<STRING>"[^"]*"?|'[^']*'?)
+    |(?P<WORD>[A-Za-z][A-Za-z0-9_]*)
+    |(?P<OTHER>.)
+    |(?P<END>\Z))
+""", re.VERBOSE | re.DOTALL)
+
+RawToken = Tuple[TokenType, object, int, int]
+
+def _utf8_char(source, pos: int) -> Tuple[str, int]:
+    lead = source[pos]
+    size = 1 if lead < 0x80 else 2 if lead < 0xE0 else 3 if lead < 0xF0 else 4
+    return bytes(source[pos:pos + size]).decode('utf-8'), size
+
+def _utf8_run(source, pos: int, end: int, accept) -> Tuple[int, str]:
+    # Lee caracteres UTF-8 desde pos mientras accept(carácter) sea cierto
+    chars = []
+    while pos < end:
+        char, size = _utf8_char(source, pos)
+        if not accept(char):
+            break
+        chars.append(char)
+        pos += size
+    return pos, ''.join(chars)
+
+def _is_number_char(char: str) -> bool:
+    return char.isdigit() or char == '.'
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == '_'
+
+def _number_value(text: str):
+    return float(text) if '.' in text else int(text)
+
+def map_file(path: str):
+    """mmap de solo lectura de un archivo; b'' si está vacío (no se puede mapear)"""
+    with open(path, 'rb') as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return b''
+
+def close_source(source):
+    if isinstance(source, mmap.mmap):
+        source.close()
+
+# str.split() separa también por estos caracteres ASCII, que para el lexer no
+# son espacios (se leen como UNKNOWN)
+NON_LEXER_SPACE = re.compile('[\x0b\x0c\x1c-\x1f]')
+
+# Palabras clave
+KEYWORDS = {
+    'Paper': TokenType.PAPER,
+    'Pen': TokenType.PEN,
+    'Line': TokenType.LINE,
+    'Circle': TokenType.CIRCLE,
+    'Rect': TokenType.RECT,
+}
+
 class Lexer:
-    def __init__(self, source_code: str):
+    def __init__(self, source_code: str, engine: str = DEFAULT_ENGINE, first_line: int = 1):
+        if engine not in ENGINES:
+            raise ValueError(f"Motor léxico desconocido: {engine!r} (opciones: {', '.join(ENGINES)})")
         self.source = source_code
+        # Bytes o mmap: se recorren sin decodificar el archivo completo
+        self.engine = ENGINE_BYTES if isinstance(source_code, BYTES_SOURCES) else engine
         self.position = 0
-        self.line = 1
+        # first_line > 1 cuando source_code es un fragmento de un archivo mayor
+        self.line = first_line
         self.column = 1
         self.tokens: List[Token] = []
         
-        # Palabras clave
-        self.keywords = {
-            'Paper': TokenType.PAPER,
-            'Pen': TokenType.PEN,
-            'Line': TokenType.LINE,
-            'Circle': TokenType.CIRCLE,
-            'Rect': TokenType.RECT,
-        }
+        self.keywords = KEYWORDS
+    
+    @classmethod
+    def from_file(cls, path: str, first_line: int = 1) -> "Lexer":
+        """Lexer sobre un mmap de solo lectura del archivo (UTF-8): no hay
+        lectura previa y solo se decodifica el texto de cada token."""
+        return cls(map_file(path), first_line=first_line)
+    
+    def close(self):
+        close_source(self.source)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
     
     def current_char(self) -> Optional[str]:
         if self.position >= len(self.source):
@@ -122,6 +330,176 @@ class Lexer:
         return Token(TokenType.STRING, string_value, start_line, start_col)
     
     def tokenize(self) -> List[Token]:
+        self.tokens.extend(self.iter_tokens())
+        return self.tokens
+    
+    def tokenize_buffer(self) -> TokenBuffer:
+        """Tokeniza en un TokenBuffer compacto sin crear objetos Token"""
+        if self.engine == ENGINE_SCANNER:
+            return TokenBuffer.from_tokens(self._scan_scanner())
+        return TokenBuffer.from_tokens(self._scan_raw())
+    
+    def iter_tokens(self) -> Iterator[Token]:
+        """Genera los tokens uno a uno sin acumularlos en self.tokens"""
+        if self.engine == ENGINE_SCANNER:
+            return self._scan_scanner()
+        return (Token(*raw) for raw in self._scan_raw())
+    
+    def _scan_raw(self) -> Iterator[RawToken]:
+        if self.engine == ENGINE_BYTES:
+            return self._scan_bytes()
+        return self._scan_regex()
+    
+    def _scan_bytes(self) -> Iterator[RawToken]:
+        # Las columnas cuentan caracteres, no bytes: wide acumula los bytes de
+        # continuación UTF-8 ya vistos en la línea actual.
+        source = self.source
+        keywords = self.keywords
+        match = _BYTE_TOKEN_RE.match
+        end = len(source)
+        pos = self.position
+        line = self.line
+        line_start = pos - (self.column - 1)
+        wide = 0
+        
+        while pos < end:
+            m = match(source, pos)
+            kind = m.lastgroup
+            pos = m.start(kind)
+            col = pos - line_start - wide + 1
+            stop = m.end()
+            
+            if kind == 'COMMENT':
+                raw = m.group(kind)
+                if not raw.isascii():
+                    wide += len(raw) - len(raw.decode('utf-8'))
+            elif kind == 'END':
+                pass
+            elif kind == 'NEWLINE':
+                yield (TokenType.NEWLINE, '\\n', line, col)
+                line += 1
+                line_start = stop
+                wide = 0
+            elif kind == 'NUMBER' or kind == 'WORD':
+                text = m.group(kind).decode('ascii')
+                if stop < end and source[stop] >= 0x80:
+                    # El token sigue con caracteres no ASCII
+                    accept = _is_number_char if kind == 'NUMBER' else _is_word_char
+                    run_stop, run = _utf8_run(source, stop, end, accept)
+                    wide += (run_stop - stop) - len(run)
+                    text += run
+                    stop = run_stop
+                if kind == 'NUMBER':
+                    yield (TokenType.NUMBER, _number_value(text), line, col)
+                else:
+                    yield (keywords.get(text, TokenType.UNKNOWN), text, line, col)
+            elif kind == 'STRING':
+                raw = m.group(kind)
+                closed = len(raw) > 1 and raw[-1] == raw[0]
+                value = raw[1:-1] if closed else raw[1:]
+                value = value.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+                yield (TokenType.STRING, value, line, col)
+                last_break = max(raw.rfind(b'\n'), raw.rfind(b'\r'))
+                if last_break >= 0:
+                    line += value.count('\n')
+                    line_start = pos + last_break + 1
+                    tail = raw[last_break + 1:]
+                    wide = len(tail) - len(tail.decode('utf-8'))
+                else:
+                    wide += len(raw) - len(raw.decode('utf-8'))
+            else:
+                # Carácter suelto: mismas reglas que el scanner original
+                char, size = _utf8_char(source, pos)
+                if char.isdigit() or char.isalpha():
+                    accept = _is_number_char if char.isdigit() else _is_word_char
+                    stop, text = _utf8_run(source, pos, end, accept)
+                    wide += (stop - pos) - len(text)
+                    if char.isdigit():
+                        yield (TokenType.NUMBER, _number_value(text), line, col)
+                    else:
+                        yield (keywords.get(text, TokenType.UNKNOWN), text, line, col)
+                else:
+                    wide += size - 1
+                    stop = pos + size
+                    yield (TokenType.UNKNOWN, char, line, col)
+            
+            pos = stop
+        
+        self.position = pos
+        self.line = line
+        self.column = pos - line_start - wide + 1
+        yield (TokenType.EOF, None, self.line, self.column)
+    
+    def _scan_regex(self, final: bool = True) -> Iterator[RawToken]:
+        # Con final=False el texto es un fragmento de un flujo mayor: el
+        # último token que toca el final del fragmento se deja sin consumir
+        # (self.position) porque podría continuar en el siguiente fragmento.
+        source = self.source
+        keywords = self.keywords
+        match = _TOKEN_RE.match
+        end = len(source)
+        pos = self.position
+        line = self.line
+        line_start = pos - (self.column - 1)
+        
+        while pos < end:
+            m = match(source, pos)
+            kind = m.lastgroup
+            pos = m.start(kind)
+            text = m.group(kind)
+            col = pos - line_start + 1
+            
+            if not final and kind != 'NEWLINE' and m.end() == end:
+                break
+            
+            if kind == 'COMMENT' or kind == 'END':
+                pass
+            elif kind == 'NEWLINE':
+                yield (TokenType.NEWLINE, '\\n', line, col)
+                line += 1
+                line_start = pos + 1
+            elif kind == 'NUMBER':
+                yield (TokenType.NUMBER, _number_value(text), line, col)
+            elif kind == 'WORD':
+                yield (keywords.get(text, TokenType.UNKNOWN), text, line, col)
+            elif kind == 'STRING':
+                value = text[1:-1] if len(text) > 1 and text[-1] == text[0] else text[1:]
+                yield (TokenType.STRING, value, line, col)
+                newlines = text.count('\n')
+                if newlines:
+                    line += newlines
+                    line_start = pos + text.rfind('\n') + 1
+            else:
+                # Carácter no ASCII: mismas reglas que el scanner original
+                stop = pos + 1
+                if text.isdigit():
+                    while stop < end and (source[stop].isdigit() or source[stop] == '.'):
+                        stop += 1
+                    if not final and stop == end:
+                        break
+                    text = source[pos:stop]
+                    yield (TokenType.NUMBER, _number_value(text), line, col)
+                elif text.isalpha():
+                    while stop < end and (source[stop].isalnum() or source[stop] == '_'):
+                        stop += 1
+                    if not final and stop == end:
+                        break
+                    text = source[pos:stop]
+                    yield (keywords.get(text, TokenType.UNKNOWN), text, line, col)
+                else:
+                    yield (TokenType.UNKNOWN, text, line, col)
+                pos = stop
+                continue
+            
+            pos = m.end()
+        
+        self.position = pos
+        self.line = line
+        self.column = pos - line_start + 1
+        if final:
+            yield (TokenType.EOF, None, self.line, self.column)
+    
+    def _scan_scanner(self) -> Iterator[Token]:
         while self.position < len(self.source):
             self.skip_whitespace()
             
@@ -133,29 +511,27 @@ class Lexer:
                 continue
             
             if self.current_char() == '\n':
-                token = Token(TokenType.NEWLINE, '\\n', self.line, self.column)
-                self.tokens.append(token)
+                yield Token(TokenType.NEWLINE, '\\n', self.line, self.column)
                 self.advance()
                 continue
             
             if self.current_char().isdigit():
-                self.tokens.append(self.read_number())
+                yield self.read_number()
                 continue
             
             if self.current_char() in '"\'':
-                self.tokens.append(self.read_string())
+                yield self.read_string()
                 continue
             
             if self.current_char().isalpha():
-                self.tokens.append(self.read_word())
+                yield self.read_word()
                 continue
             
             token = Token(TokenType.UNKNOWN, self.current_char(), self.line, self.column)
-            self.tokens.append(token)
             self.advance()
+            yield token
         
-        self.tokens.append(Token(TokenType.EOF, None, self.line, self.column))
-        return self.tokens
+        yield Token(TokenType.EOF, None, self.line, self.column)
     
     def print_tokens(self):
         print("\n=== TOKENS GENERADOS ===")
@@ -163,6 +539,36 @@ class Lexer:
             print(f"{i}: {token}")
 
 
+def iter_tokens_from_chunks(chunks: Iterable[str]) -> Iterator[Token]:
+    """Tokeniza un flujo de fragmentos de texto (p. ej. las líneas de un archivo)
+    manteniendo en memoria solo el token que queda a medias entre fragmentos.
+
+    Los fragmentos se acumulan en una lista y no se vuelven a analizar hasta
+    que doblan el token pendiente, así que un token partido en muchos
+    fragmentos cuesta tiempo lineal y no cuadrático."""
+    lexer = Lexer('')
+    parts: List[str] = []
+    pending = 0
+    retry = 0
+    for chunk in chunks:
+        parts.append(chunk)
+        pending += len(chunk)
+        if pending < retry:
+            continue
+        lexer.source = ''.join(parts)
+        lexer.position = 0
+        for raw in lexer._scan_regex(final=False):
+            yield Token(*raw)
+        tail = lexer.source[lexer.position:]
+        parts = [tail] if tail else []
+        pending = len(tail)
+        retry = 2 * pending
+    lexer.source = ''.join(parts)
+    lexer.position = 0
+    for raw in lexer._scan_regex():
+        yield Token(*raw)
+
+
 if __name__ == "__main__":
     code = """
 Paper 100
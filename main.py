@@ -2,91 +2,297 @@
 COMPILADOR SIMPLEDRAW - MAIN
 """
 
+import os
 import sys
 import json
-from lexer import Lexer
-from parser import Parser, ProgramNode, PaperNode, PenNode, LineNode, CircleNode, RectNode
-from symbol_table import SymbolTable
-from intermediate_code import IntermediateCodeGenerator
+import argparse
+from functools import lru_cache
+from array import array
+from operator import attrgetter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from lexer import Lexer, Token, iter_tokens_from_chunks, map_file, close_source
+from parser import Parser, ProgramNode, PaperNode, PenNode, LineNode, CircleNode, RectNode, statement_lines
+from symbol_table import SymbolTable, SHAPE_FIELDS
+from compile_cache import CompileCache, cache_key, code_fingerprint
+from fast_path import compile_lines
+from validate import DEFAULT_MAX_ERRORS, validate_file
+from intermediate_code import (IntermediateCodeGenerator, IntermediateInstruction, ColumnarIR,
+                               optimize_stream, instructions_to_json, keep_flags, OPT_PEEPHOLE, OPT_GEOMETRY,
+                               OPT_LEVELS)
+from spatial_index import SpatialIndex, DEFAULT_NODE_SIZE, cull_rows
+from tiles import TileManifest, export_tiles, parse_grid
+from svg_writer import SVG_NS, SvgWriter, write_svg
+from ir_format import IR_EXTENSION, MappedIR, write_ir
+from raster import MAX_SIDE, write_png
+from source_map import SourceMap, SOURCE_MAP_EXTENSION
+from metrics import CompileMetrics, phase
+from batch import compile_batch, expand_inputs
+from parallel import compile_parallel
+
+__version__ = "1.0.0"
+
+# Módulos cuyo código determina el IR y el SVG que guarda la caché
+_COMPILER_MODULES = ('lexer', 'parser', 'symbol_table', 'intermediate_code', 'fast_path',
+                     'spatial_index', 'svg_writer')
+
+# Callback de trazado: recibe el nombre de la fase y sus datos
+TraceCallback = Callable[[str, Dict[str, Any]], None]
+
+# Espacio reservado en la cabecera del SVG en modo streaming: el tamaño del
+# papel y el grosor del lápiz solo se conocen al terminar y se escriben después.
+STREAM_HEADER_SLOT = 128
+
+
+def svg_header(paper_size, pen_width):
+    return [
+        f'<svg width="{paper_size}" height="{paper_size}" xmlns="{SVG_NS}">',
+        f'  <rect width="100%" height="100%" fill="white"/>',
+        f'  <g stroke="black" stroke-width="{pen_width}" fill="none">'
+    ]
+
+
+SVG_FOOTER = ['  </g>', '</svg>']
+
+
+def svg_row(op, arg1, arg2, arg3, result):
+    if op == 'LINE':
+        return f'    <line x1="{arg1}" y1="{arg2}" x2="{arg3}" y2="{result}"/>'
+    elif op == 'CIRCLE':
+        return f'    <circle cx="{arg1}" cy="{arg2}" r="{arg3}"/>'
+    elif op == 'RECT':
+        return f'    <rect x="{arg1}" y="{arg2}" width="{arg3}" height="{result}"/>'
+    elif op == 'POLYLINE':
+        points = ' '.join(f'{arg1[k]},{arg1[k + 1]}' for k in range(0, len(arg1), 2))
+        return f'    <polyline points="{points}"/>'
+    return None
+
+
+def svg_element(inst):
+    return svg_row(inst.op, inst.arg1, inst.arg2, inst.arg3, inst.result)
+
+
+def shape_params(stmt):
+    """(tipo, parámetros) con que se registra una figura en la tabla de
+    símbolos; None si la declaración no es una figura"""
+    if isinstance(stmt, LineNode):
+        return "Line", {"x1": stmt.x1, "y1": stmt.y1, "x2": stmt.x2, "y2": stmt.y2}
+    elif isinstance(stmt, CircleNode):
+        return "Circle", {"x": stmt.x, "y": stmt.y, "radius": stmt.radius}
+    elif isinstance(stmt, RectNode):
+        return "Rect", {"x": stmt.x, "y": stmt.y, "width": stmt.width, "height": stmt.height}
+    return None
+
+
+# Clave en la tabla de símbolos y operandos de cada declaración / instrucción
+_SYMBOL_NODES = {
+    PaperNode: ("paper_size", attrgetter('size')),
+    PenNode: ("pen_width", attrgetter('width')),
+    LineNode: ("Line", attrgetter(*SHAPE_FIELDS["Line"])),
+    CircleNode: ("Circle", attrgetter(*SHAPE_FIELDS["Circle"])),
+    RectNode: ("Rect", attrgetter(*SHAPE_FIELDS["Rect"])),
+}
+_SYMBOL_OPS = {
+    'PAPER': ("paper_size", attrgetter('arg1')),
+    'PEN': ("pen_width", attrgetter('arg1')),
+    'LINE': ("Line", attrgetter('arg1', 'arg2', 'arg3', 'result')),
+    'CIRCLE': ("Circle", attrgetter('arg1', 'arg2', 'arg3')),
+    'RECT': ("Rect", attrgetter('arg1', 'arg2', 'arg3', 'result')),
+}
+
+
+def _symbol_entries(items, specs, key, lines=None):
+    # Entradas (clave, valores, línea) de SymbolTable.add_many; sin lines,
+    # la línea es el número de declaración
+    for line, item in zip(lines, items) if lines is not None else enumerate(items, 1):
+        spec = specs.get(key(item))
+        if spec is not None:
+            yield spec[0], spec[1](item), line
+
+
+def _source_text(source) -> str:
+    # Texto de la fuente tal como lo lee open() en modo texto (los offsets
+    # del mapa de fuentes son caracteres de este texto)
+    if isinstance(source, str):
+        return source
+    return bytes(source).decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
 
 class SimpleDrawCompiler:
-    def __init__(self):
+    def __init__(self, columnar_ir: bool = False):
         self.lexer = None
         self.parser = None
         self.symbol_table = SymbolTable()
-        self.code_generator = IntermediateCodeGenerator()
+        # columnar_ir usa ColumnarIR (opcodes + matriz float64) como backend
+        self.code_generator = ColumnarIR() if columnar_ir else IntermediateCodeGenerator()
         self.tokens = []
         self.ast = None
+        self.source_map: Optional[SourceMap] = None
         self.errors = []
     
-    def compile(self, source_code: str) -> bool:
+    def compile(self, source_code: str, verbose: bool = True, keep_tokens: bool = True,
+                trace: Optional[TraceCallback] = None, opt_level: int = OPT_PEEPHOLE,
+                metrics: Optional[CompileMetrics] = None, fast_path: bool = True,
+                source_map: bool = False) -> bool:
+        """Compila el código fuente.
+        
+        verbose imprime cada fase en consola (comportamiento de la CLI);
+        con keep_tokens=False y sin verbose los tokens se guardan en un
+        TokenBuffer compacto en lugar de en self.tokens. trace, si se indica, recibe
+        (fase, datos) al terminar cada fase. opt_level elige el nivel de
+        optimización del código intermedio (ver intermediate_code.OPT_*).
+        metrics, si se indica, recibe las mediciones de cada fase (ver
+        metrics.CompileMetrics); la impresión en consola no se mide.
+        
+        Con fast_path=True, keep_tokens=False y sin verbose, trace ni
+        metrics (que observan cada fase) las líneas bien formadas se traducen
+        directamente a IR (ver fast_path.py): no quedan tokens ni AST
+        (self.ast es None). Si hay algún error se repite la compilación
+        completa, así que los diagnósticos no cambian.
+        
+        Con source_map=True queda en self.source_map la posición en el código
+        de cada declaración, instrucción y elemento SVG (ver source_map.py);
+        no admite OPT_GEOMETRY.
+        """
         self.errors = []
+        self.source_map = None
         
         try:
-            print("\n" + "="*70)
-            print("FASE 1: ANÁLISIS LÉXICO".center(70))
-            print("="*70)
-            self.lexer = Lexer(source_code)
-            self.tokens = self.lexer.tokenize()
-            self.lexer.print_tokens()
-            
-            print("\n" + "="*70)
-            print("FASE 2: ANÁLISIS SINTÁCTICO".center(70))
-            print("="*70)
-            self.parser = Parser(self.tokens)
-            self.ast = self.parser.parse()
-            self.parser.print_ast(self.ast)
-            
-            print("\n" + "="*70)
-            print("FASE 3: TABLA DE SÍMBOLOS".center(70))
-            print("="*70)
-            self.build_symbol_table(self.ast)
-            self.symbol_table.print_table()
-            
-            print("\n" + "="*70)
-            print("FASE 4: CÓDIGO INTERMEDIO".center(70))
-            print("="*70)
-            self.code_generator.generate_from_ast(self.ast)
-            self.code_generator.print_code()
+            instructions = None
+            lines = array('L')
+            if fast_path and not (keep_tokens or verbose) and trace is None and metrics is None:
+                instructions = self._compile_lines(source_code, lines)
+            if instructions is not None:
+                # Camino rápido: ni tokens ni AST; la tabla de símbolos sale del IR
+                self.tokens = []
+                self.ast = None
+                with phase(metrics, 'symbols') as items:
+                    self.build_symbol_table_from_ir(instructions, lines)
+                    items['symbols'] = len(self.symbol_table.symbols)
+                self._trace(trace, 'symbols', symbols=len(self.symbol_table.symbols))
+                self.code_generator.instructions = instructions
+            else:
+                self._banner("FASE 1: ANÁLISIS LÉXICO", verbose)
+                with phase(metrics, 'lex') as items:
+                    self.lexer = Lexer(source_code)
+                    if keep_tokens or verbose:
+                        self.tokens = self.lexer.tokenize()
+                        token_source = self.tokens
+                    else:
+                        # Almacenamiento columnar: el parser lo recorre sin objetos Token
+                        self.tokens = []
+                        token_source = self.lexer.tokenize_buffer()
+                    items['tokens'] = len(token_source)
+                self._trace(trace, 'lex', tokens=len(token_source))
+                if verbose:
+                    self.lexer.print_tokens()
+                
+                self._banner("FASE 2: ANÁLISIS SINTÁCTICO", verbose)
+                with phase(metrics, 'parse') as items:
+                    self.parser = Parser(token_source)
+                    self.ast = self.parser.parse()
+                    items['statements'] = len(self.ast.statements)
+                self._trace(trace, 'parse', statements=len(self.ast.statements))
+                if verbose:
+                    self.parser.print_ast(self.ast)
+                
+                self._banner("FASE 3: TABLA DE SÍMBOLOS", verbose)
+                with phase(metrics, 'symbols') as items:
+                    self.build_symbol_table(self.ast, statement_lines(token_source))
+                    items['symbols'] = len(self.symbol_table.symbols)
+                self._trace(trace, 'symbols', symbols=len(self.symbol_table.symbols))
+                if verbose:
+                    self.symbol_table.print_table()
+                
+                self._banner("FASE 4: CÓDIGO INTERMEDIO", verbose)
+                with phase(metrics, 'ir') as items:
+                    self.code_generator.generate_from_ast(self.ast)
+                    items['instructions'] = len(self.code_generator.instructions)
+                self._trace(trace, 'ir', instructions=len(self.code_generator.instructions))
+                if verbose:
+                    self.code_generator.print_code()
             
-            removed = self.code_generator.optimize()
-            if removed > 0:
+            keep = keep_flags(self.code_generator.rows(), opt_level) if source_map else None
+            with phase(metrics, 'optimize') as items:
+                removed = self.code_generator.optimize(opt_level)
+                items['removed'] = removed
+                items['instructions'] = len(self.code_generator.instructions)
+            self._trace(trace, 'optimize', removed=removed)
+            if verbose and removed > 0:
                 print(f"\n✓ Optimización: {removed} instrucción(es) eliminada(s)")
             
-            print("\n" + "="*70)
-            print("✓ COMPILACIÓN EXITOSA".center(70))
-            print("="*70)
+            if source_map:
+                with phase(metrics, 'source_map') as items:
+                    ops = [row[0] for row in self.code_generator.rows()]
+                    self.source_map = SourceMap.build(_source_text(source_code), keep, ops)
+                    items['statements'] = len(keep)
+                self._trace(trace, 'source_map', statements=len(keep))
+            
+            if verbose:
+                print("\n" + "="*70)
+                print("✓ COMPILACIÓN EXITOSA".center(70))
+                print("="*70)
             return True
             
         except SyntaxError as e:
             self.errors.append(f"Error: {e}")
-            print(f"\n✗ ERROR: {e}")
+            if verbose:
+                print(f"\n✗ ERROR: {e}")
             return False
         except Exception as e:
             self.errors.append(f"Error: {e}")
-            print(f"\n✗ ERROR: {e}")
+            if verbose:
+                print(f"\n✗ ERROR: {e}")
             return False
     
-    def build_symbol_table(self, node):
+    def _compile_lines(self, source_code, lines) -> Optional[List[IntermediateInstruction]]:
+        # Solo para texto y con el IR en lista
+        if not isinstance(source_code, str) or type(self.code_generator) is not IntermediateCodeGenerator:
+            return None
+        return compile_lines(source_code, lines)
+    
+    @staticmethod
+    def _banner(title: str, verbose: bool):
+        if verbose:
+            print("\n" + "="*70)
+            print(title.center(70))
+            print("="*70)
+    
+    @staticmethod
+    def _trace(trace: Optional[TraceCallback], phase: str, **data):
+        if trace is not None:
+            trace(phase, data)
+    
+    def build_symbol_table(self, node, lines: Optional[Sequence[int]] = None):
+        """lines es la línea de cada declaración (ver parser.statement_lines);
+        sin ella se usa el número de declaración"""
         if isinstance(node, ProgramNode):
-            line = 1
-            for stmt in node.statements:
-                if isinstance(stmt, PaperNode):
-                    self.symbol_table.add_config("paper_size", stmt.size, line)
-                elif isinstance(stmt, PenNode):
-                    self.symbol_table.add_config("pen_width", stmt.width, line)
-                elif isinstance(stmt, LineNode):
-                    params = {"x1": stmt.x1, "y1": stmt.y1, "x2": stmt.x2, "y2": stmt.y2}
-                    self.symbol_table.add_shape("Line", params, line)
-                elif isinstance(stmt, CircleNode):
-                    params = {"x": stmt.x, "y": stmt.y, "radius": stmt.radius}
-                    self.symbol_table.add_shape("Circle", params, line)
-                elif isinstance(stmt, RectNode):
-                    params = {"x": stmt.x, "y": stmt.y, "width": stmt.width, "height": stmt.height}
-                    self.symbol_table.add_shape("Rect", params, line)
-                line += 1
-    
-    def generate_svg(self, output_file: str):
+            self.symbol_table.add_many(_symbol_entries(node.statements, _SYMBOL_NODES, type, lines))
+    
+    def build_symbol_table_from_ir(self, instructions: Iterable[IntermediateInstruction],
+                                   lines: Optional[Sequence[int]] = None):
+        """Equivalente a build_symbol_table a partir del código intermedio sin
+        optimizar (una instrucción por declaración, en el mismo orden)"""
+        self.symbol_table.add_many(_symbol_entries(instructions, _SYMBOL_OPS, attrgetter('op'), lines))
+    
+    def element_source_map(self, cull: bool = False) -> Optional[SourceMap]:
+        """self.source_map con los elementos que escriben build_svg y
+        write_svg con el mismo cull"""
+        if self.source_map is None or not cull:
+            return self.source_map
+        paper_size, pen_width = self.canvas()
+        rows = list(self.code_generator.rows())
+        kept = {id(row) for row in cull_rows(rows, paper_size, pen_width)}
+        return self.source_map.with_elements(
+            index for index, row in enumerate(rows) if id(row) in kept and row[0] not in ('PAPER', 'PEN'))
+    
+    def build_spatial_index(self, node_size: int = DEFAULT_NODE_SIZE) -> SpatialIndex:
+        """Índice espacial de las figuras; los ids son posiciones en
+        code_generator.instructions"""
+        return SpatialIndex.from_instructions(self.code_generator.instructions, node_size)
+    
+    def canvas(self) -> Tuple[Any, Any]:
+        """(paper_size, pen_width) finales según la tabla de símbolos"""
         paper_size = 100
         pen_width = 1
         
@@ -94,46 +300,557 @@ class SimpleDrawCompiler:
             paper_size = self.symbol_table.get_symbol("paper_size").value
         if self.symbol_table.exists("pen_width"):
             pen_width = self.symbol_table.get_symbol("pen_width").value
+        return paper_size, pen_width
+    
+    def build_svg(self, cull: bool = False) -> str:
+        """Documento SVG; con cull=True omite las figuras fuera del lienzo"""
+        paper_size, pen_width = self.canvas()
+        svg_lines = svg_header(paper_size, pen_width)
         
-        svg_lines = [
-            f'<svg width="{paper_size}" height="{paper_size}" xmlns="http://www.w3.org/2000/svg">',
-            f'  <rect width="100%" height="100%" fill="white"/>',
-            f'  <g stroke="black" stroke-width="{pen_width}" fill="none">'
-        ]
-        
-        for inst in self.code_generator.instructions:
-            if inst.op == 'LINE':
-                svg_lines.append(f'    <line x1="{inst.arg1}" y1="{inst.arg2}" x2="{inst.arg3}" y2="{inst.result}"/>')
-            elif inst.op == 'CIRCLE':
-                svg_lines.append(f'    <circle cx="{inst.arg1}" cy="{inst.arg2}" r="{inst.arg3}"/>')
-            elif inst.op == 'RECT':
-                svg_lines.append(f'    <rect x="{inst.arg1}" y="{inst.arg2}" width="{inst.arg3}" height="{inst.result}"/>')
+        rows = self.code_generator.rows()
+        if cull:
+            rows = cull_rows(rows, paper_size, pen_width)
+        for row in rows:
+            element = svg_row(*row)
+            if element is not None:
+                svg_lines.append(element)
         
-        svg_lines.extend(['  </g>', '</svg>'])
-        svg_content = '\n'.join(svg_lines)
+        svg_lines.extend(SVG_FOOTER)
+        return '\n'.join(svg_lines)
+    
+    def generate_svg(self, output_file: str, verbose: bool = True, cull: bool = False):
+        svg_content = self.build_svg(cull)
         
         with open(output_file, 'w') as f:
             f.write(svg_content)
         
-        print(f"\n✓ SVG generado: {output_file}")
+        if verbose:
+            print(f"\n✓ SVG generado: {output_file}")
         return svg_content
     
-    def export_results(self, base_filename: str):
+    def write_svg(self, output_file: str, precision: Optional[int] = None, cull: bool = False,
+                  compress: Optional[bool] = None) -> int:
+        """Como generate_svg, pero escribe por lotes en un archivo binario sin
+        construir el documento en memoria (.svgz se comprime con gzip).
+        precision limita los decimales. Devuelve el número de elementos."""
+        paper_size, pen_width = self.canvas()
+        rows = self.code_generator.rows()
+        if cull:
+            rows = cull_rows(rows, paper_size, pen_width)
+        with SvgWriter(output_file, paper_size, pen_width, precision, compress) as writer:
+            writer.write_rows(rows)
+        return writer.elements
+    
+    def write_png(self, output_file: str, size: Optional[int] = None) -> Tuple[int, int]:
+        """Rasteriza el dibujo a PNG sin pasar por el SVG (ver raster.py);
+        size es el lado en píxeles (por defecto uno por unidad del papel).
+        Devuelve (ancho, alto)."""
+        paper_size, pen_width = self.canvas()
+        return write_png(output_file, self.code_generator.rows(), paper_size, pen_width, size)
+    
+    def export_tiles(self, output_dir: str, rows: int, cols: int,
+                     workers: Optional[int] = None) -> TileManifest:
+        """Escribe el dibujo como una cuadrícula rows x cols de SVG (ver tiles.py)"""
+        paper_size, pen_width = self.canvas()
+        return export_tiles(self.code_generator.instructions, output_dir, rows, cols,
+                            paper_size=paper_size, pen_width=pen_width, workers=workers)
+    
+    def compile_stream(self, source_chunks: Iterable[str], output_file: str) -> bool:
+        """Compila y escribe el SVG a medida que se produce.
+        
+        Tokens, declaraciones, instrucciones y elementos SVG fluyen por
+        generadores, así que la memoria no crece con el tamaño del programa.
+        No se conservan tokens, AST ni instrucciones; solo la configuración
+        (en la tabla de símbolos) y los contadores en self.stream_stats.
+        """
+        self.errors = []
+        self.stream_stats = {'statements': 0, 'instructions': 0, 'elements': 0}
+        stats = self.stream_stats
+        paper_size = 100
+        pen_width = 1
+        
+        def counted(items, key):
+            for item in items:
+                stats[key] += 1
+                yield item
+        
+        try:
+            with open(output_file, 'wb') as f:
+                # La cabecera lleva un hueco de espacios que se rellena al final
+                f.write(b'<svg' + b' ' * STREAM_HEADER_SLOT + f' xmlns="{SVG_NS}">\n'.encode())
+                f.write(b'  <rect width="100%" height="100%" fill="white"/>\n')
+                pen_offset = f.tell()
+                f.write(b'  <g' + b' ' * STREAM_HEADER_SLOT + b' stroke="black" fill="none">\n')
+                
+                parser = Parser(iter_tokens_from_chunks(source_chunks))
+                statements = counted(parser.iter_statements(), 'statements')
+                instructions = counted(optimize_stream(self.code_generator.iter_instructions(statements)), 'instructions')
+                
+                for inst in instructions:
+                    if inst.op == 'PAPER':
+                        paper_size = inst.arg1
+                        self.symbol_table.add_config("paper_size", paper_size, stats['statements'])
+                    elif inst.op == 'PEN':
+                        pen_width = inst.arg1
+                        self.symbol_table.add_config("pen_width", pen_width, stats['statements'])
+                    else:
+                        element = svg_element(inst)
+                        if element is not None:
+                            f.write(f'{element}\n'.encode())
+                            stats['elements'] += 1
+                
+                f.write('\n'.join(SVG_FOOTER).encode())
+                
+                svg_attrs = f' width="{paper_size}" height="{paper_size}"'
+                g_attrs = f' stroke-width="{pen_width}"'
+                if max(len(svg_attrs), len(g_attrs)) > STREAM_HEADER_SLOT:
+                    raise ValueError("Valores de Paper/Pen demasiado largos para la cabecera SVG")
+                f.seek(len(b'<svg'))
+                f.write(svg_attrs.ljust(STREAM_HEADER_SLOT).encode())
+                f.seek(pen_offset + len(b'  <g'))
+                f.write(g_attrs.ljust(STREAM_HEADER_SLOT).encode())
+            return True
+        
+        except (SyntaxError, ValueError) as e:
+            self.errors.append(f"Error: {e}")
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            return False
+    
+    def export_results(self, base_filename: str, verbose: bool = True, cull: bool = False,
+                       precision: Optional[int] = None, compress: bool = False, binary_ir: bool = False):
+        """Tokens, código intermedio y SVG; con binary_ir=True el código
+        intermedio se escribe en formato .sdir (ver ir_format.py) en lugar de JSON.
+        Si se compiló con source_map=True, el mapa de fuentes se escribe junto
+        al SVG (.svg.map). Devuelve el número de elementos del SVG."""
         with open(f"{base_filename}_tokens.json", 'w') as f:
             json.dump([{"type": t.type.name, "value": t.value, "line": t.line} for t in self.tokens], f, indent=2)
         
-        with open(f"{base_filename}_intermediate.json", 'w') as f:
-            f.write(self.code_generator.to_json())
+        if binary_ir:
+            write_ir(f"{base_filename}_intermediate{IR_EXTENSION}", self.code_generator.instructions)
+        else:
+            with open(f"{base_filename}_intermediate.json", 'w') as f:
+                f.write(self.code_generator.to_json())
         
-        self.generate_svg(f"{base_filename}_output.svg")
-        print(f"\n✓ Archivos exportados: {base_filename}_*")
+        output_file = f"{base_filename}_output.svg{'z' if compress else ''}"
+        elements = self.write_svg(output_file, precision, cull, compress)
+        map_file = None
+        if self.source_map is not None:
+            map_file = f"{output_file}{SOURCE_MAP_EXTENSION}"
+            self.element_source_map(cull).write(map_file, os.path.basename(output_file))
+        if verbose:
+            print(f"\n✓ SVG generado: {output_file}")
+            if map_file is not None:
+                print(f"✓ Mapa de fuentes: {map_file}")
+            print(f"\n✓ Archivos exportados: {base_filename}_*")
+        return elements
+
 
+@dataclass
+class CompileResult:
+    success: bool
+    instructions: Sequence[IntermediateInstruction] = field(default_factory=list)
+    svg: Optional[str] = None
+    errors: List[str] = field(default_factory=list)
+    tokens: Optional[List[Token]] = None
+    symbols: Optional[SymbolTable] = None
+    cached: bool = False
+    metrics: Optional[CompileMetrics] = None
+    source_map: Optional[SourceMap] = None
+    
+    @property
+    def diagnostics(self) -> List[str]:
+        return self.errors
+
+
+def compile_source(source_code: str, *, keep_tokens: bool = False, emit_svg: bool = True,
+                   columnar: bool = False, opt_level: int = OPT_PEEPHOLE, cull: bool = False,
+                   verbose: bool = False, trace: Optional[TraceCallback] = None,
+                   instrument: bool = False, source_map: bool = False) -> CompileResult:
+    """Punto de entrada de biblioteca: compila sin escribir en consola.
+    
+    Devuelve un CompileResult con IR, SVG y diagnósticos. Los tokens solo se
+    conservan con keep_tokens=True; verbose y trace los activa quien llama.
+    Con columnar=True el IR es un ColumnarIR en lugar de una lista; con
+    cull=True el SVG omite las figuras fuera del lienzo (el IR las conserva).
+    Con instrument=True result.metrics trae las mediciones de cada fase.
+    Con source_map=True result.source_map relaciona declaraciones,
+    instrucciones y elementos del SVG con el código (ver source_map.py);
+    no admite OPT_GEOMETRY (ValueError).
+    """
+    if source_map and opt_level == OPT_GEOMETRY:
+        raise ValueError("source_map no admite OPT_GEOMETRY: use opt_level <= OPT_GLOBAL")
+    metrics = CompileMetrics() if instrument else None
+    compiler = SimpleDrawCompiler(columnar_ir=columnar)
+    success = compiler.compile(source_code, verbose=verbose, keep_tokens=keep_tokens,
+                               trace=trace, opt_level=opt_level, metrics=metrics, source_map=source_map)
+    if not success:
+        return CompileResult(False, errors=list(compiler.errors), metrics=metrics)
+    
+    svg = None
+    if emit_svg:
+        with phase(metrics, 'emit') as items:
+            svg = compiler.build_svg(cull)
+            items['bytes'] = len(svg)
+        SimpleDrawCompiler._trace(trace, 'emit', bytes=len(svg))
+    return CompileResult(
+        True,
+        instructions=compiler.code_generator.instructions,
+        svg=svg,
+        tokens=compiler.tokens if keep_tokens else None,
+        symbols=compiler.symbol_table,
+        metrics=metrics,
+        source_map=compiler.element_source_map(cull),
+    )
+
+
+def compile_source_file(path: str, **options) -> CompileResult:
+    """compile_source sobre un mmap del archivo: el lexer recorre los bytes
+    directamente, sin leer ni decodificar la fuente completa. Acepta las
+    mismas opciones que compile_source."""
+    source = map_file(path)
+    try:
+        return compile_source(source, **options)
+    finally:
+        close_source(source)
+
+
+@lru_cache(maxsize=None)
+def compiler_version() -> str:
+    """Versión de las entradas de la caché: __version__ más un hash del código
+    del compilador, para que cualquier cambio en el IR o el SVG las invalide"""
+    paths = [sys.modules[name].__file__ for name in _COMPILER_MODULES] + [os.path.abspath(__file__)]
+    return f"{__version__}+{code_fingerprint(paths)}"
+
+
+def compile_source_cached(source_code: str, cache: CompileCache, *, emit_svg: bool = True,
+                          opt_level: int = OPT_PEEPHOLE, cull: bool = False) -> CompileResult:
+    """compile_source con caché en disco: si la fuente, la versión y las
+    opciones no cambiaron, devuelve el IR y el SVG guardados sin lexer,
+    parser ni generación de código (tokens y tabla de símbolos no se guardan)."""
+    key = cache_key(source_code, compiler_version(), {'emit_svg': emit_svg, 'opt_level': opt_level, 'cull': cull})
+    entry = cache.get(key)
+    if entry is not None:
+        return CompileResult(
+            entry['success'],
+            # JSON devuelve como lista la tupla de puntos de POLYLINE
+            instructions=[IntermediateInstruction(op, tuple(arg1) if isinstance(arg1, list) else arg1, *args)
+                          for op, arg1, *args in entry['instructions']],
+            svg=entry['svg'],
+            errors=entry['errors'],
+            cached=True,
+        )
+    
+    result = compile_source(source_code, emit_svg=emit_svg, opt_level=opt_level, cull=cull)
+    cache.put(key, {
+        'success': result.success,
+        'instructions': [[i.op, i.arg1, i.arg2, i.arg3, i.result] for i in result.instructions],
+        'svg': result.svg,
+        'errors': result.errors,
+    })
+    return result
+
+
+def _int_range(minimum: int, maximum: Optional[int] = None) -> Callable[[str], int]:
+    """Tipo de argparse: entero en [minimum, maximum]"""
+    def parse(text: str) -> int:
+        value = int(text)
+        if value < minimum or (maximum is not None and value > maximum):
+            bounds = f"entre {minimum} y {maximum}" if maximum is not None else f">= {minimum}"
+            raise argparse.ArgumentTypeError(f"{value} no válido (debe ser {bounds})")
+        return value
+    parse.__name__ = 'int'     # para el mensaje de error de argparse
+    return parse
+
+
+def build_arg_parser():
+    arg_parser = argparse.ArgumentParser(description="Compilador SimpleDraw")
+    arg_parser.add_argument("sources", nargs="*", metavar="source",
+                            help="archivo .sd a compilar (varios, directorios o globs en modo --batch) "
+                                 f"o {IR_EXTENSION} ya compilado para generar solo el SVG")
+    arg_parser.add_argument("--batch", action="store_true",
+                            help="compilar varios archivos en paralelo (implícito con varias entradas o un directorio)")
+    arg_parser.add_argument("--parallel", action="store_true",
+                            help="compilar un archivo grande por fragmentos en varios procesos")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=None,
+                            help="procesos para --batch, --parallel y --tiles (por defecto: todos los núcleos)")
+    arg_parser.add_argument("--out-dir", default=None,
+                            help="directorio de salida para --batch (por defecto: junto a cada fuente) "
+                                 "y --tiles (por defecto: <output>_tiles)")
+    arg_parser.add_argument("--stream", action="store_true",
+                            help="compilar en modo streaming directo a SVG (memoria constante)")
+    arg_parser.add_argument("--mmap", action="store_true",
+                            help="analizar el archivo mapeado en memoria, sin leerlo entero (fuentes enormes)")
+    arg_parser.add_argument("--validate", action="store_true",
+                            help="solo comprobar la sintaxis y listar todos los errores (sin generar archivos)")
+    arg_parser.add_argument("--max-errors", type=int, default=DEFAULT_MAX_ERRORS, metavar="N",
+                            help=f"errores por archivo antes de detenerse en --validate (por defecto: {DEFAULT_MAX_ERRORS})")
+    arg_parser.add_argument("-q", "--quiet", action="store_true",
+                            help="no imprimir las fases, solo el resumen")
+    arg_parser.add_argument("-O", "--opt-level", type=int, choices=OPT_LEVELS, default=OPT_PEEPHOLE,
+                            help="nivel de optimización: 0 ninguna, 1 duplicados consecutivos, "
+                                 "2 figuras repetidas y PAPER/PEN sin efecto, "
+                                 "3 además une segmentos en polilíneas (por defecto: 1)")
+    arg_parser.add_argument("--cull", action="store_true",
+                            help="omitir en el SVG las figuras que quedan fuera del lienzo")
+    arg_parser.add_argument("--precision", type=_int_range(0), default=None, metavar="N",
+                            help="decimales de las coordenadas en el SVG (por defecto: sin redondear)")
+    arg_parser.add_argument("--svgz", action="store_true",
+                            help="escribir el SVG comprimido con gzip (.svgz)")
+    arg_parser.add_argument("--source-map", action="store_true",
+                            help="escribir junto al SVG un mapa de fuentes (.map) con la posición "
+                                 "en el código de cada elemento (-O 0 a 2)")
+    arg_parser.add_argument("--png", action="store_true",
+                            help="escribir además <output>_output.png con el rasterizador integrado")
+    arg_parser.add_argument("--png-size", type=_int_range(1, MAX_SIDE), default=None, metavar="PX",
+                            help="lado del PNG en píxeles, para miniaturas (por defecto: uno por unidad "
+                                 f"de Paper, como mucho {MAX_SIDE})")
+    arg_parser.add_argument("--binary-ir", action="store_true",
+                            help=f"escribir el código intermedio en formato binario {IR_EXTENSION} en lugar de JSON")
+    arg_parser.add_argument("--tiles", type=parse_grid, metavar="NxM",
+                            help="exportar además el dibujo en N filas x M columnas de SVG")
+    arg_parser.add_argument("--metrics", metavar="FILE",
+                            help="guardar tiempos, CPU, memoria y contadores por fase en FILE "
+                                 "(JSON, o texto de Prometheus si termina en .prom; '-' para la consola)")
+    arg_parser.add_argument("--cache", metavar="DIR",
+                            help="usar una caché de compilación en disco en DIR")
+    arg_parser.add_argument("--cache-size", type=int, default=256,
+                            help="tamaño máximo de la caché en MB (por defecto: 256)")
+    arg_parser.add_argument("--cache-stats", action="store_true",
+                            help="mostrar las estadísticas acumuladas de la caché")
+    arg_parser.add_argument("-o", "--output", default="output",
+                            help="prefijo de los archivos generados (por defecto: output)")
+    return arg_parser
+
+
+def run_stream(path: str, base_filename: str):
+    output_file = f"{base_filename}_output.svg"
+    compiler = SimpleDrawCompiler()
+    try:
+        with open(path, 'r') as f:
+            success = compiler.compile_stream(f, output_file)
+    except FileNotFoundError:
+        print(f"Error: Archivo no encontrado")
+        return
+    
+    if success:
+        stats = compiler.stream_stats
+        print(f"\n✓ SVG generado: {output_file}")
+        print(f"✓ Declaraciones: {stats['statements']}")
+        print(f"✓ Instrucciones: {stats['instructions']}")
+        print(f"✓ Elementos SVG: {stats['elements']}")
+    else:
+        for error in compiler.errors:
+            print(f"\n✗ {error}")
+
+
+def _ir_canvas(instructions: Sequence[IntermediateInstruction]) -> Tuple[Any, Any]:
+    # (paper_size, pen_width): último PAPER y último PEN, como MappedIR.canvas()
+    values = {'PAPER': 100, 'PEN': 1}
+    found = set()
+    for instruction in reversed(instructions):
+        if instruction.op in values and instruction.op not in found:
+            values[instruction.op] = instruction.arg1
+            found.add(instruction.op)
+            if len(found) == 2:
+                break
+    return values['PAPER'], values['PEN']
+
+
+def write_result(result: CompileResult, args, origin: str):
+    """Archivos de un CompileResult ya compilado (--cache, --mmap o
+    --parallel) con las mismas opciones de salida que la compilación normal"""
+    if not result.success:
+        for error in result.errors:
+            print(f"\n✗ {error}")
+        return
+    base_filename = args.output
+    if args.binary_ir:
+        write_ir(f"{base_filename}_intermediate{IR_EXTENSION}", result.instructions)
+    else:
+        with open(f"{base_filename}_intermediate.json", 'w') as f:
+            f.write(instructions_to_json(result.instructions))
+    
+    paper_size, pen_width = _ir_canvas(result.instructions)
+    output_file = f"{base_filename}_output.svg{'z' if args.svgz else ''}"
+    if args.svgz or args.precision is not None:
+        rows = ((i.op, i.arg1, i.arg2, i.arg3, i.result) for i in result.instructions)
+        if args.cull:
+            rows = cull_rows(rows, paper_size, pen_width)
+        write_svg(output_file, rows, paper_size, pen_width, args.precision, args.svgz)
+    else:
+        with open(output_file, 'w') as f:
+            f.write(result.svg)
+    print(f"\n✓ SVG generado: {output_file} ({origin})")
+    if result.source_map is not None:
+        map_file = f"{output_file}{SOURCE_MAP_EXTENSION}"
+        result.source_map.write(map_file, os.path.basename(output_file))
+        print(f"✓ Mapa de fuentes: {map_file}")
+    if args.png:
+        rows = ((i.op, i.arg1, i.arg2, i.arg3, i.result) for i in result.instructions)
+        width, height = write_png(f"{base_filename}_output.png", rows, paper_size, pen_width, args.png_size)
+        print(f"✓ PNG generado: {base_filename}_output.png ({width}x{height})")
+    if args.tiles:
+        grid_rows, grid_cols = args.tiles
+        tiles_dir = args.out_dir or f"{base_filename}_tiles"
+        manifest = export_tiles(result.instructions, tiles_dir, grid_rows, grid_cols,
+                                paper_size=paper_size, pen_width=pen_width, workers=args.jobs)
+        print(f"✓ Mosaico: {grid_rows}x{grid_cols} SVG en {tiles_dir} ({manifest.seconds:.2f} s)")
+    print(f"✓ Instrucciones: {len(result.instructions)}")
+
+
+def run_ir(path: str, args):
+    """SVG de un código intermedio .sdir ya compilado, sin lexer ni parser"""
+    output_file = f"{args.output}_output.svg{'z' if args.svgz else ''}"
+    try:
+        ir = MappedIR(path)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return
+    with ir:
+        paper_size, pen_width = ir.canvas()
+        rows = ir.rows()
+        if args.cull:
+            rows = cull_rows(rows, paper_size, pen_width)
+        elements = write_svg(output_file, rows, paper_size, pen_width, args.precision, args.svgz)
+        if args.png:
+            write_png(f"{args.output}_output.png", ir.rows(), paper_size, pen_width, args.png_size)
+    print(f"\n✓ SVG generado: {output_file} ({IR_EXTENSION})")
+    if args.png:
+        print(f"✓ PNG generado: {args.output}_output.png")
+    print(f"✓ Instrucciones: {len(ir)}")
+    print(f"✓ Elementos SVG: {elements}")
 
-def main():
+
+def run_cached(source_code: str, args):
+    cache = CompileCache(args.cache, max_bytes=args.cache_size * 1024 * 1024)
+    result = compile_source_cached(source_code, cache, opt_level=args.opt_level, cull=args.cull)
+    write_result(result, args, "caché" if result.cached else "compilado")
+    
+    totals = cache.save_stats()
+    if args.cache_stats:
+        print(f"\n{totals.report()}")
+
+
+def run_batch(args) -> int:
+    """Compila el lote; devuelve 1 si algún archivo falló"""
+    summary = compile_batch(args.sources, output_dir=args.out_dir, workers=args.jobs,
+                            opt_level=args.opt_level, cache_dir=args.cache, cull=args.cull,
+                            binary_ir=args.binary_ir, cache_size=args.cache_size * 1024 * 1024)
+    print(summary.report())
+    if args.cache_stats and summary.cache_stats is not None:
+        print(f"\n{summary.cache_stats.report()}")
+    return 1 if summary.failed else 0
+
+
+def run_validate(args) -> int:
+    """Valida las fuentes sin compilarlas; devuelve 1 si alguna tiene errores"""
+    paths = expand_inputs(args.sources)
+    if not paths:
+        print("Error: --validate requiere al menos un archivo")
+        return 1
+    invalid = 0
+    for path in paths:
+        try:
+            result = validate_file(path, args.max_errors)
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"{path}: Error: {e}")
+            invalid += 1
+            continue
+        if not result.valid:
+            print(result.report(path))
+            invalid += 1
+    print(f"✓ {len(paths) - invalid} válido(s), ✗ {invalid} con errores")
+    return 1 if invalid else 0
+
+
+# Opciones que no usa cada modo de la CLI: se rechazan en lugar de ignorarlas
+_UNSUPPORTED_OPTIONS = {
+    'batch': ('stream', 'mmap', 'parallel', 'svgz', 'precision', 'source_map', 'png', 'tiles', 'metrics'),
+    'ir': ('stream', 'mmap', 'parallel', 'cache', 'opt_level', 'binary_ir', 'source_map', 'tiles', 'metrics'),
+    'stream': ('mmap', 'parallel', 'cache', 'opt_level', 'binary_ir', 'cull', 'svgz', 'precision',
+               'source_map', 'png', 'tiles', 'metrics'),
+    'mmap': ('parallel', 'cache'),
+    'cache': ('parallel', 'source_map', 'metrics'),
+    'parallel': ('source_map', 'metrics'),
+}
+_MODE_NAMES = {'batch': "--batch", 'ir': f"una entrada {IR_EXTENSION}", 'stream': "--stream",
+               'mmap': "--mmap", 'cache': "--cache", 'parallel': "--parallel"}
+
+
+def _cli_mode(args) -> str:
+    """Modo de la CLI según los argumentos (en orden de prioridad)"""
+    if args.validate:
+        return 'validate'
+    if args.batch or len(args.sources) > 1 or (args.source and os.path.isdir(args.source)):
+        return 'batch'
+    if args.source and args.source.endswith(IR_EXTENSION):
+        return 'ir'
+    for mode in ('stream', 'mmap', 'cache', 'parallel'):
+        if getattr(args, mode):
+            return mode
+    return 'compile'
+
+
+def _check_options(arg_parser: argparse.ArgumentParser, args, mode: str):
+    def given(name):
+        value = getattr(args, name)
+        return value != OPT_PEEPHOLE if name == 'opt_level' else value not in (None, False)
+    
+    rejected = [name for name in _UNSUPPORTED_OPTIONS.get(mode, ()) if given(name)]
+    if rejected:
+        flags = ', '.join("-O" if name == 'opt_level' else "--" + name.replace('_', '-') for name in rejected)
+        arg_parser.error(f"{flags}: no se admite con {_MODE_NAMES[mode]}")
+    if args.source_map and args.opt_level == OPT_GEOMETRY:
+        arg_parser.error(f"--source-map: no se admite con -O {OPT_GEOMETRY}")
+
+
+def main(argv=None):
+    arg_parser = build_arg_parser()
+    args = arg_parser.parse_args(argv)
+    args.source = args.sources[0] if args.sources else None
+    mode = _cli_mode(args)
+    _check_options(arg_parser, args, mode)
+    
+    if mode == 'validate':
+        return run_validate(args)
+    
+    if mode == 'batch':
+        return run_batch(args)
+    
     print("="*70)
     print("COMPILADOR MINI COMPILER v1.0".center(70))
     print("="*70)
     
+    if mode == 'ir':
+        print(f"Archivo: {args.source}")
+        run_ir(args.source, args)
+        return
+    
+    if mode == 'stream':
+        if not args.source:
+            print("Error: El modo --stream requiere un archivo")
+            return
+        print(f"Archivo: {args.source} (streaming)")
+        run_stream(args.source, args.output)
+        return
+    
+    if mode == 'mmap':
+        if not args.source:
+            print("Error: El modo --mmap requiere un archivo")
+            return
+        print(f"Archivo: {args.source} (mmap)")
+        try:
+            result = compile_source_file(args.source, opt_level=args.opt_level, cull=args.cull,
+                                         source_map=args.source_map, instrument=bool(args.metrics))
+        except FileNotFoundError:
+            print(f"Error: Archivo no encontrado")
+            return
+        write_result(result, args, "mmap")
+        if result.metrics is not None:
+            write_metrics(result.metrics, args.metrics)
+        return
+    
     example_code = """# Triángulo
 Paper 100
 Pen 3
@@ -142,11 +859,11 @@ Line 10 90 90 90
 Line 90 90 50 10
 """
     
-    if len(sys.argv) > 1:
+    if args.source:
         try:
-            with open(sys.argv[1], 'r') as f:
+            with open(args.source, 'r') as f:
                 source_code = f.read()
-            print(f"Archivo: {sys.argv[1]}")
+            print(f"Archivo: {args.source}")
         except FileNotFoundError:
             print(f"Error: Archivo no encontrado")
             return
@@ -154,22 +871,61 @@ Line 90 90 50 10
         print("\nUsando ejemplo...")
         source_code = example_code
     
-    print("\n" + "-"*70)
-    print("CÓDIGO:")
-    print("-"*70)
-    print(source_code)
-    print("-"*70)
+    if mode == 'cache':
+        run_cached(source_code, args)
+        return
+    
+    if mode == 'parallel':
+        result = compile_parallel(source_code, workers=args.jobs, opt_level=args.opt_level, cull=args.cull)
+        write_result(result, args, "en paralelo")
+        return
+    
+    verbose = not args.quiet
+    if verbose:
+        print("\n" + "-"*70)
+        print("CÓDIGO:")
+        print("-"*70)
+        print(source_code)
+        print("-"*70)
     
+    metrics = CompileMetrics() if args.metrics else None
     compiler = SimpleDrawCompiler()
-    success = compiler.compile(source_code)
+    success = compiler.compile(source_code, verbose=verbose, opt_level=args.opt_level, metrics=metrics,
+                               source_map=args.source_map)
+    
+    if not success and not verbose:
+        for error in compiler.errors:
+            print(f"\n✗ {error}")
     
     if success:
-        compiler.export_results("output")
+        with phase(metrics, 'emit') as items:
+            items['elements'] = compiler.export_results(args.output, verbose, args.cull, args.precision,
+                                                        args.svgz, args.binary_ir)
+        if args.png:
+            width, height = compiler.write_png(f"{args.output}_output.png", args.png_size)
+            print(f"\n✓ PNG generado: {args.output}_output.png ({width}x{height})")
+        if args.tiles:
+            rows, cols = args.tiles
+            tiles_dir = args.out_dir or f"{args.output}_tiles"
+            manifest = compiler.export_tiles(tiles_dir, rows, cols, args.jobs)
+            print(f"\n✓ Mosaico: {rows}x{cols} SVG en {tiles_dir} ({manifest.seconds:.2f} s)")
         stats = compiler.symbol_table.get_statistics()
         print(f"\n✓ Tokens: {len(compiler.tokens)}")
         print(f"✓ Símbolos: {stats['total']}")
         print(f"✓ Instrucciones: {len(compiler.code_generator.instructions)}")
+    
+    if metrics is not None:
+        write_metrics(metrics, args.metrics)
+
+
+def write_metrics(metrics: CompileMetrics, path: str):
+    if path == '-':
+        print("\n" + metrics.report())
+        return
+    with open(path, 'w') as f:
+        f.write(metrics.to_prometheus() if path.endswith('.prom') else metrics.to_json())
+    print(f"\n✓ Métricas: {path}")
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+MÉTRICAS DE COMPILACIÓN
+Tiempo de reloj, tiempo de CPU, pico de memoria (tracemalloc) y contadores
+de cada fase del compilador
+"""
+
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Iterator, List, Optional
+
+# Fases en el orden en que se ejecutan
+PHASES = ('lex', 'parse', 'symbols', 'ir', 'optimize', 'emit')
+PROMETHEUS_PREFIX = "simpledraw"
+
+
+@dataclass
+class PhaseMetrics:
+    name: str
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    peak_bytes: int = 0        # memoria reservada por encima de la del inicio de la fase
+    items: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class CompileMetrics:
+    """Mediciones por fase de una compilación.
+
+    Cada fase se mide con el contexto phase(), que devuelve un diccionario
+    para los contadores de la fase:
+
+        metrics = CompileMetrics()
+        compiler.compile(codigo, verbose=False, metrics=metrics)
+        with metrics.phase('emit') as items:
+            items['elements'] = compiler.write_svg(ruta)
+        print(metrics.to_json())
+
+    Con memory=True cada fase se ejecuta bajo tracemalloc (si nadie lo
+    había activado, solo durante la fase), lo que la ralentiza; con
+    memory=False peak_bytes vale 0.
+    """
+    memory: bool = True
+    phases: List[PhaseMetrics] = field(default_factory=list)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[Dict[str, int]]:
+        own_tracing = self.memory and not tracemalloc.is_tracing()
+        if own_tracing:
+            tracemalloc.start()
+        elif self.memory and hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+
+            tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0] if self.memory else 0
+        wall, cpu = time.perf_counter(), time.process_time()
+        items: Dict[str, int] = {}
+        try:
+            yield items
+        finally:
+            metrics = PhaseMetrics(name, time.perf_counter() - wall, time.process_time() - cpu, items=items)
+            if self.memory:
+                metrics.peak_bytes = max(0, tracemalloc.get_traced_memory()[1] - base)
+                if own_tracing:
+                    tracemalloc.stop()
+            self.phases.append(metrics)
+
+    def get(self, name: str) -> Optional[PhaseMetrics]:
+        for metrics in self.phases:
+            if metrics.name == name:
+                return metrics
+        return None
+
+    @property
+    def wall_seconds(self) -> float:
+        return sum(p.wall_seconds for p in self.phases)
+
+    @property
+    def cpu_seconds(self) -> float:
+        return sum(p.cpu_seconds for p in self.phases)
+
+    @property
+    def peak_bytes(self) -> int:
+        return max((p.peak_bytes for p in self.phases), default=0)
+
+    def to_dict(self) -> dict:
+        return {
+            'phases': [asdict(p) for p in self.phases],
+            'wall_seconds': self.wall_seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'peak_bytes': self.peak_bytes,
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self, prefix: str = PROMETHEUS_PREFIX, labels: Optional[Dict[str, str]] = None) -> str:
+        """Formato de texto de Prometheus (gauges con la etiqueta phase;
+        los contadores de cada fase llevan además la etiqueta item)"""
+        extra = ''.join(f',{key}="{_escape(value)}"' for key, value in (labels or {}).items())
+        lines = []
+
+        def gauge(name: str, help_text: str, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            for sample_labels, value in samples:
+                lines.append(f"{prefix}_{name}{{{sample_labels}{extra}}} {value!r}")
+
+        gauge("phase_wall_seconds", "Tiempo de reloj de la fase",
+              ((f'phase="{p.name}"', p.wall_seconds) for p in self.phases))
+        gauge("phase_cpu_seconds", "Tiempo de CPU de la fase",
+              ((f'phase="{p.name}"', p.cpu_seconds) for p in self.phases))
+        if self.memory:
+            gauge("phase_peak_bytes", "Pico de memoria reservada durante la fase",
+                  ((f'phase="{p.name}"', p.peak_bytes) for p in self.phases))
+        gauge("phase_items", "Elementos procesados por la fase",
+              ((f'phase="{p.name}",item="{item}"', count)
+               for p in self.phases for item, count in p.items.items()))
+        return '\n'.join(lines) + '\n'
+
+    def report(self) -> str:
+        lines = [f"{'Fase':<10} {'Reloj ms':>10} {'CPU ms':>10} {'Pico KB':>10}  Elementos"]
+        for p in self.phases:
+            items = ', '.join(f"{key}={value}" for key, value in p.items.items())
+            lines.append(f"{p.name:<10} {p.wall_seconds * 1000:10.2f} {p.cpu_seconds * 1000:10.2f} "
+                         f"{p.peak_bytes / 1024:10.1f}  {items}")
+        lines.append(f"{'total':<10} {self.wall_seconds * 1000:10.2f} {self.cpu_seconds * 1000:10.2f} "
+                     f"{self.peak_bytes / 1024:10.1f}")
+        return '\n'.join(lines)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+@contextmanager
+def _no_phase() -> Iterator[Dict[str, int]]:
+    yield {}
+
+
+def phase(metrics: Optional[CompileMetrics], name: str):
+    """metrics.phase(name), o un contexto vacío si no se mide"""
+    return metrics.phase(name) if metrics is not None else _no_phase()
@@ -0,0 +1,108 @@
+"""
+COMPILACIÓN PARALELA DE UN ARCHIVO GRANDE
+Divide una fuente en fragmentos por líneas y los compila en varios núcleos
+"""
+
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from lexer import Lexer
+from parser import Parser, statement_lines
+from intermediate_code import IntermediateCodeGenerator, IntermediateInstruction, OPT_PEEPHOLE
+
+# Por debajo de este tamaño no compensa arrancar procesos
+MIN_CHUNK_CHARS = 256 * 1024
+CHUNKS_PER_WORKER = 4
+
+Chunk = Tuple[str, int]  # (texto, número de su primera línea)
+
+
+def split_source(source_code: str, chunk_chars: int) -> List[Chunk]:
+    """Corta la fuente en fragmentos de unos chunk_chars caracteres, siempre
+    justo después de un salto de línea. Las declaraciones no cruzan líneas,
+    así que cada fragmento se puede analizar por separado."""
+    chunks = []
+    start = 0
+    line = 1
+    end = len(source_code)
+    while start < end:
+        cut = source_code.find('\n', start + chunk_chars)
+        stop = end if cut == -1 else cut + 1
+        chunks.append((source_code[start:stop], line))
+        line += source_code.count('\n', start, stop)
+        start = stop
+    return chunks
+
+
+def compile_chunk(chunk: Chunk):
+    """Lexer + Parser + código intermedio de un fragmento.
+
+    Devuelve (filas de IR, línea de cada fila, error); el error usa el mismo
+    formato que SimpleDrawCompiler.compile y las líneas son las del archivo
+    completo.
+    """
+    text, first_line = chunk
+    generator = IntermediateCodeGenerator()
+    try:
+        tokens = Lexer(text, first_line=first_line).tokenize_buffer()
+        for stmt in Parser(tokens).iter_statements():
+            generator.generate_from_ast(stmt)
+        return list(generator.rows()), statement_lines(tokens), None
+    except Exception as e:
+        return [], [], f"Error: {e}"
+
+
+def compile_parallel(source_code: str, workers: Optional[int] = None,
+                     chunk_chars: Optional[int] = None, opt_level: int = OPT_PEEPHOLE,
+                     emit_svg: bool = True, cull: bool = False):
+    """Compila una fuente grande repartiendo sus fragmentos en procesos.
+
+    El resultado (CompileResult) es el mismo que el de compile_source: los
+    fragmentos se unen en orden, la tabla de símbolos se construye sobre el
+    IR unido (mismos nombres Line_N y líneas) y la optimización se aplica
+    después, para no perder duplicados en los bordes entre fragmentos.
+    """
+    from main import compile_source
+
+    workers = workers or os.cpu_count() or 1
+    if chunk_chars is None:
+        chunk_chars = max(MIN_CHUNK_CHARS, len(source_code) // (workers * CHUNKS_PER_WORKER) + 1)
+
+    # Las cadenas pueden abarcar varias líneas: sin cortes seguros, en serie
+    if '"' in source_code or "'" in source_code or len(source_code) <= chunk_chars:
+        return compile_source(source_code, emit_svg=emit_svg, opt_level=opt_level, cull=cull)
+
+    chunks = split_source(source_code, chunk_chars)
+    if workers == 1:
+        return _merge(source_code, map(compile_chunk, chunks), opt_level, emit_svg, cull)
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+        return _merge(source_code, executor.map(compile_chunk, chunks), opt_level, emit_svg, cull)
+
+
+def _merge(source_code: str, outputs, opt_level: int, emit_svg: bool, cull: bool = False):
+    # Importación diferida: main importa este módulo para la CLI
+    from main import SimpleDrawCompiler, CompileResult, compile_source
+
+    instructions = []
+    lines = array('L')
+    for rows, chunk_lines, error in outputs:
+        if error is not None:
+            # El error de un fragmento no tiene por qué ser el de la compilación
+            # en serie (que pasa el lexer por todo el archivo antes del parser):
+            # se repite en serie para dar el mismo diagnóstico
+            return compile_source(source_code, emit_svg=emit_svg, opt_level=opt_level, cull=cull)
+        instructions.extend(IntermediateInstruction(*row) for row in rows)
+        lines.extend(chunk_lines)
+
+    compiler = SimpleDrawCompiler()
+    compiler.build_symbol_table_from_ir(instructions, lines)
+    compiler.code_generator.instructions = instructions
+    compiler.code_generator.optimize(opt_level)
+    return CompileResult(
+        True,
+        instructions=compiler.code_generator.instructions,
+        svg=compiler.build_svg(cull) if emit_svg else None,
+        symbols=compiler.symbol_table,
+    )
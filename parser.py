@@ -3,28 +3,36 @@ ANALIZADOR SINTÁCTICO (PARSER)
 Genera el Árbol de Sintaxis Abstracta (AST)
 """
 
+from array import array
 from dataclasses import dataclass
-from typing import List, Optional
-from lexer import Token, TokenType, Lexer
+from typing import Iterable, Iterator, List, Optional, Union
+from lexer import Token, TokenType, Lexer, TokenBuffer, TYPE_CODES, CODE_FLOAT, CODE_NUMBER
+
+# Los nodos declaran __slots__: sin __dict__ por instancia, lo que reduce la
+# memoria del AST en programas de millones de declaraciones
 
 @dataclass
 class ASTNode:
-    pass
+    __slots__ = ()
 
 @dataclass
 class ProgramNode(ASTNode):
+    __slots__ = ('statements',)
     statements: List[ASTNode]
 
 @dataclass
 class PaperNode(ASTNode):
+    __slots__ = ('size',)
     size: int
 
 @dataclass
 class PenNode(ASTNode):
+    __slots__ = ('width',)
     width: int
 
 @dataclass
 class LineNode(ASTNode):
+    __slots__ = ('x1', 'y1', 'x2', 'y2')
     x1: float
     y1: float
     x2: float
@@ -32,37 +40,85 @@ class LineNode(ASTNode):
 
 @dataclass
 class CircleNode(ASTNode):
+    __slots__ = ('x', 'y', 'radius')
     x: float
     y: float
     radius: float
 
 @dataclass
 class RectNode(ASTNode):
+    __slots__ = ('x', 'y', 'width', 'height')
     x: float
     y: float
     width: float
     height: float
 
+# Tabla de declaraciones: palabra clave -> (nodo, tipos de los operandos,
+# conversión de cada operando). El parser no tiene una rutina por declaración:
+# lee los operandos de la tabla de una vez y construye el nodo.
+STATEMENTS = {
+    TokenType.PAPER: (PaperNode, (TokenType.NUMBER,), int),
+    TokenType.PEN: (PenNode, (TokenType.NUMBER,), int),
+    TokenType.LINE: (LineNode, (TokenType.NUMBER,) * 4, None),
+    TokenType.CIRCLE: (CircleNode, (TokenType.NUMBER,) * 3, None),
+    TokenType.RECT: (RectNode, (TokenType.NUMBER,) * 4, None),
+}
+
+# La misma tabla por código de tipo, para el parser de TokenBuffer: código
+# de la palabra clave -> (nodo, número de operandos NUMBER, conversión)
+_BUFFER_STATEMENTS = {
+    TYPE_CODES[keyword]: (node_class, len(operand_types), convert)
+    for keyword, (node_class, operand_types, convert) in STATEMENTS.items()
+    if all(operand_type is TokenType.NUMBER for operand_type in operand_types)
+}
+
+def statement_lines(tokens: Union[List[Token], TokenBuffer]) -> array:
+    """Línea de cada declaración de un programa sin errores: cada palabra
+    clave empieza una declaración y ninguna cruza líneas"""
+    if isinstance(tokens, TokenBuffer):
+        codes = set(_BUFFER_STATEMENTS)
+        return array('L', [line for code, line in zip(tokens.types, tokens.lines) if code in codes])
+    return array('L', [token.line for token in tokens if token.type in STATEMENTS])
+
+def expected_message(expected: TokenType, found: str, line) -> str:
+    """Mensaje de error de un token de tipo found donde se esperaba expected"""
+    return f"Error de sintaxis: Se esperaba {expected.name}, pero se encontró {found} en línea {line}"
+
+def unexpected_message(found: str) -> str:
+    """Mensaje de error de una declaración que no empieza por palabra clave"""
+    return f"Declaración inesperada: {found}"
+
 class Parser:
-    def __init__(self, tokens: List[Token]):
+    def __init__(self, tokens: Iterable[Token]):
         self.tokens = tokens
         self.position = 0
-        self.current_token = self.tokens[0] if tokens else None
+        # Modo streaming: los tokens llegan de un iterador y no se indexan.
+        # Un TokenBuffer se recorre por columnas sin crear objetos Token.
+        if isinstance(tokens, TokenBuffer):
+            self._stream = None
+            self.current_token = None
+        elif isinstance(tokens, list):
+            self._stream = None
+            self.current_token = self.tokens[0] if tokens else None
+        else:
+            self._stream = iter(tokens)
+            self.current_token = next(self._stream, None)
     
     def advance(self):
         self.position += 1
-        if self.position < len(self.tokens):
+        if self._stream is not None:
+            self.current_token = next(self._stream, None)
+        elif self.position < len(self.tokens):
             self.current_token = self.tokens[self.position]
         else:
             self.current_token = None
     
     def expect(self, token_type: TokenType) -> Token:
         if not self.current_token or self.current_token.type != token_type:
-            raise SyntaxError(
-                f"Error de sintaxis: Se esperaba {token_type.name}, "
-                f"pero se encontró {self.current_token.type.name if self.current_token else 'EOF'} "
-                f"en línea {self.current_token.line if self.current_token else 'N/A'}"
-            )
+            raise SyntaxError(expected_message(
+                token_type,
+                self.current_token.type.name if self.current_token else 'EOF',
+                self.current_token.line if self.current_token else 'N/A'))
         token = self.current_token
         self.advance()
         return token
@@ -71,38 +127,29 @@ class Parser:
         while self.current_token and self.current_token.type == TokenType.NEWLINE:
             self.advance()
     
+    def parse_keyword(self, keyword: TokenType) -> ASTNode:
+        """Declaración de la tabla STATEMENTS, token a token con expect()"""
+        node_class, operand_types, convert = STATEMENTS[keyword]
+        self.expect(keyword)
+        operands = [self.expect(operand_type).value for operand_type in operand_types]
+        if convert:
+            operands = [convert(value) for value in operands]
+        return node_class(*operands)
+    
     def parse_paper(self) -> PaperNode:
-        self.expect(TokenType.PAPER)
-        size_token = self.expect(TokenType.NUMBER)
-        return PaperNode(size=int(size_token.value))
+        return self.parse_keyword(TokenType.PAPER)
     
     def parse_pen(self) -> PenNode:
-        self.expect(TokenType.PEN)
-        width_token = self.expect(TokenType.NUMBER)
-        return PenNode(width=int(width_token.value))
+        return self.parse_keyword(TokenType.PEN)
     
     def parse_line(self) -> LineNode:
-        self.expect(TokenType.LINE)
-        x1 = self.expect(TokenType.NUMBER).value
-        y1 = self.expect(TokenType.NUMBER).value
-        x2 = self.expect(TokenType.NUMBER).value
-        y2 = self.expect(TokenType.NUMBER).value
-        return LineNode(x1=x1, y1=y1, x2=x2, y2=y2)
+        return self.parse_keyword(TokenType.LINE)
     
     def parse_circle(self) -> CircleNode:
-        self.expect(TokenType.CIRCLE)
-        x = self.expect(TokenType.NUMBER).value
-        y = self.expect(TokenType.NUMBER).value
-        radius = self.expect(TokenType.NUMBER).value
-        return CircleNode(x=x, y=y, radius=radius)
+        return self.parse_keyword(TokenType.CIRCLE)
     
     def parse_rect(self) -> RectNode:
-        self.expect(TokenType.RECT)
-        x = self.expect(TokenType.NUMBER).value
-        y = self.expect(TokenType.NUMBER).value
-        width = self.expect(TokenType.NUMBER).value
-        height = self.expect(TokenType.NUMBER).value
-        return RectNode(x=x, y=y, width=width, height=height)
+        return self.parse_keyword(TokenType.RECT)
     
     def parse_statement(self) -> Optional[ASTNode]:
         self.skip_newlines()
@@ -111,32 +158,104 @@ class Parser:
             return None
         
         token_type = self.current_token.type
-        
-        if token_type == TokenType.PAPER:
-            return self.parse_paper()
-        elif token_type == TokenType.PEN:
-            return self.parse_pen()
-        elif token_type == TokenType.LINE:
-            return self.parse_line()
-        elif token_type == TokenType.CIRCLE:
-            return self.parse_circle()
-        elif token_type == TokenType.RECT:
-            return self.parse_rect()
-        else:
-            raise SyntaxError(f"Declaración inesperada: {token_type.name}")
+        if token_type not in STATEMENTS:
+            raise SyntaxError(unexpected_message(token_type.name))
+        return self.parse_keyword(token_type)
     
-    def parse(self) -> ProgramNode:
-        statements = []
-        
+    def iter_statements(self) -> Iterator[ASTNode]:
+        if isinstance(self.tokens, TokenBuffer):
+            yield from self._iter_buffer_statements()
+            return
+        if self._stream is None:
+            yield from self._iter_list_statements()
+            return
         while self.current_token and self.current_token.type != TokenType.EOF:
             self.skip_newlines()
             if self.current_token and self.current_token.type != TokenType.EOF:
                 stmt = self.parse_statement()
                 if stmt:
-                    statements.append(stmt)
+                    yield stmt
                 self.skip_newlines()
+    
+    def _iter_list_statements(self) -> Iterator[ASTNode]:
+        # Lista de tokens: los operandos de cada declaración se leen de una
+        # vez con un slice; si alguno no encaja se repite la declaración con
+        # parse_statement() para dar exactamente el mismo error
+        tokens = self.tokens
+        count = len(tokens)
+        newline, eof = TokenType.NEWLINE, TokenType.EOF
+        statements = STATEMENTS
+        position = self.position
+        
+        while position < count:
+            token_type = tokens[position].type
+            if token_type is newline:
+                position += 1
+                continue
+            if token_type is eof:
+                break
+            spec = statements.get(token_type)
+            end = position + 1 + len(spec[1]) if spec else position
+            operands = tokens[position + 1:end]
+            if spec is None or [token.type for token in operands] != list(spec[1]):
+                self.position = position
+                self.current_token = tokens[position]
+                self.parse_statement()
+            node_class, _, convert = spec
+            if convert:
+                yield node_class(*[convert(token.value) for token in operands])
+            else:
+                yield node_class(*[token.value for token in operands])
+            position = end
+            self.position = position
         
-        return ProgramNode(statements=statements)
+        self.position = position
+        self.current_token = tokens[position] if position < count else None
+    
+    def _iter_buffer_statements(self) -> Iterator[ASTNode]:
+        buffer = self.tokens
+        types = buffer.types
+        values = buffer.values
+        count = len(types)
+        newline = TYPE_CODES[TokenType.NEWLINE]
+        eof = TYPE_CODES[TokenType.EOF]
+        statements = _BUFFER_STATEMENTS
+        position = self.position
+        
+        while position < count:
+            code = types[position]
+            if code == newline:
+                position += 1
+                continue
+            if code == eof:
+                break
+            spec = statements.get(code)
+            if spec is None:
+                raise SyntaxError(unexpected_message(buffer.type_at(position).name))
+            node_class, arity, convert = spec
+            start, end = position + 1, position + 1 + arity
+            codes = types[start:end]
+            # Camino habitual: todos los operandos son enteros exactos o
+            # flotantes y se leen en bloque de la columna de valores
+            if len(codes) == arity and all(c == CODE_NUMBER or c == CODE_FLOAT for c in codes):
+                operands = [int(v) if c == CODE_NUMBER else v for c, v in zip(codes, values[start:end])]
+            else:
+                operands = []
+                for index in range(start, end):
+                    if index >= count or not buffer.is_number(index):
+                        self.position = index
+                        found = buffer.type_at(index).name if index < count else 'EOF'
+                        line = buffer.lines[index] if index < count else 'N/A'
+                        raise SyntaxError(expected_message(TokenType.NUMBER, found, line))
+                    operands.append(buffer.value_at(index))
+            position = end
+            self.position = position
+            yield node_class(*map(convert, operands)) if convert else node_class(*operands)
+        
+        self.position = position
+    
+    def parse(self) -> ProgramNode:
+        return ProgramNode(statements=list(self.iter_statements()))
     
     def print_ast(self, node: ASTNode, indent=0):
         prefix = "  " * indent
@@ -0,0 +1,322 @@
+"""
+RASTERIZADOR PNG
+Dibuja las figuras del código intermedio en un búfer de píxeles (escala de
+grises, 8 bits) y lo guarda como PNG usando solo zlib
+"""
+
+import struct
+import zlib
+from typing import Iterable, List, Optional, Tuple
+
+try:
+    from math import isqrt
+except ImportError:  # Python 3.7
+    def isqrt(n: int) -> int:
+        x = n
+        y = (x + 1) // 2
+        while y < x:
+            x, y = y, (y + n // y) // 2
+        return x
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él se usa un bytearray
+    np = None
+
+WHITE = 255
+BLACK = 0
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Lado máximo de la imagen (el búfer ocupa lado² bytes)
+MAX_SIDE = 8192
+# Los cálculos vectorizados usan int64: con valores mayores se usa el bucle
+_INT64_LIMIT = 2 ** 62
+
+
+def png_bytes(width: int, height: int, pixels: bytes, compresslevel: int = 6,
+              filtered: bool = False) -> bytes:
+    """PNG en escala de grises de 8 bits a partir de las filas de píxeles
+    consecutivas (width * height bytes). Con filtered=True cada fila ya
+    trae delante su byte de filtro."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    # Cada fila va precedida de su filtro (0 = ninguno)
+    raw = pixels if filtered else b''.join(b'\0' + pixels[y * width:(y + 1) * width] for y in range(height))
+    header = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+    return (PNG_SIGNATURE + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(raw, compresslevel)) + chunk(b'IEND', b''))
+
+
+def midpoint_extents(radius: int) -> List[int]:
+    """Algoritmo del punto medio: para cada fila dy en [0, radius], la
+    mayor dx del contorno de la circunferencia de ese radio"""
+    extents = [0] * (radius + 1)
+    x, y = radius, 0
+    d = 1 - radius
+    while x >= y:
+        extents[y] = max(extents[y], x)
+        extents[x] = max(extents[x], y)
+        y += 1
+        if d < 0:
+            d += 2 * y + 1
+        else:
+            x -= 1
+            d += 2 * (y - x) + 1
+    return extents
+
+
+def _fits_int64(X0: int, Y0: int, n: int, d: int, last: int) -> bool:
+    # Si los pasos k <= last de una línea (eje mayor n, menor d) caben en int64
+    return max(abs(X0), abs(Y0), 2 * (abs(last) * abs(d) + n)) < _INT64_LIMIT
+
+
+def midpoint_reach(radius: int, first: int, last: int) -> List[int]:
+    """midpoint_extents(radius)[first:last + 1] sin recorrer el contorno
+    entero: en el primer octante la x de la fila y es la mayor con
+    x·(x - 1) < r² - y²; en el segundo, la fila x toma la mayor y con esa x"""
+    square = radius * radius
+    # Última fila del primer octante (x >= y, es decir, 2y² - y < r²)
+    octant = isqrt(square // 2)
+    while 2 * (octant + 1) ** 2 - (octant + 1) < square:
+        octant += 1
+    while octant > 0 and 2 * octant * octant - octant >= square:
+        octant -= 1
+    lowest_x = (1 + isqrt(4 * (square - octant * octant) - 3)) // 2 if square else 0
+    reach = []
+    for row in range(max(first, 0), min(last, radius) + 1):
+        extent = 0
+        if row <= octant:
+            extent = (1 + isqrt(4 * (square - row * row) - 3)) // 2 if square > row * row else 0
+        if square and row >= lowest_x:
+            extent = max(extent, min(octant, isqrt(square - row * row + row - 1)))
+        reach.append(extent)
+    return reach
+
+
+class Raster:
+    """Lienzo de píxeles con trazos negros sobre fondo blanco.
+
+    Las coordenadas se multiplican por scale y se truncan al píxel. Los
+    trazos tienen `width` píxeles centrados en la geometría, como en el SVG
+    (extremos rectos, sin relleno). Las líneas usan Bresenham y los círculos
+    dos circunferencias de punto medio (exterior e interior del trazo), de
+    las que solo se calculan las filas visibles; todo
+    se pinta por tramos horizontales. Con NumPy el búfer es una matriz y los
+    píxeles de las líneas se calculan en bloque.
+    """
+
+    def __init__(self, width: int, height: int, scale: float = 1.0):
+        if width < 1 or height < 1:
+            raise ValueError(f"Tamaño de imagen no válido: {width}x{height}")
+        self.width = width
+        self.height = height
+        self.scale = scale
+        if np is not None:
+            self.pixels = np.full((height, width), WHITE, dtype=np.uint8)
+        else:
+            self.pixels = bytearray(bytes((WHITE,)) * (width * height))
+            self._ink = memoryview(bytes((BLACK,)) * width)
+
+    def _px(self, value) -> int:
+        try:
+            return int(value * self.scale // 1)
+        except OverflowError:  # entero que no cabe en un float: lejos de cualquier lienzo
+            return -_INT64_LIMIT if value < 0 else _INT64_LIMIT
+
+    def stroke_width(self, pen_width) -> int:
+        return max(1, int(abs(pen_width) * self.scale + 0.5))
+
+    def fill_span(self, y: int, x0: int, x1: int):
+        """Pinta los píxeles [x0, x1] de la fila y (recortado al lienzo)"""
+        if not 0 <= y < self.height:
+            return
+        x0, x1 = max(x0, 0), min(x1, self.width - 1)
+        if x0 > x1:
+            return
+        if np is not None:
+            self.pixels[y, x0:x1 + 1] = BLACK
+        else:
+            start = y * self.width
+            self.pixels[start + x0:start + x1 + 1] = self._ink[:x1 - x0 + 1]
+
+    def _fill_rows(self, y: int, rows: int, x0: int, x1: int):
+        # Bloque de filas [y, y + rows) x columnas [x0, x1]
+        if np is not None:
+            y0, y1 = max(y, 0), min(y + rows, self.height)
+            x0, x1 = max(x0, 0), min(x1, self.width - 1)
+            if y0 < y1 and x0 <= x1:
+                self.pixels[y0:y1, x0:x1 + 1] = BLACK
+            return
+        for row in range(max(y, 0), min(y + rows, self.height)):
+            self.fill_span(row, x0, x1)
+
+    def line(self, x1, y1, x2, y2, width: int = 1):
+        """Segmento de Bresenham; el grosor se extiende en el eje menor"""
+        X0, Y0, X1, Y1 = self._px(x1), self._px(y1), self._px(x2), self._px(y2)
+        offset = (width - 1) // 2
+        dx, dy = X1 - X0, Y1 - Y0
+        if dx == 0 and dy == 0:
+            self._fill_rows(Y0 - offset, width, X0 - offset, X0 - offset + width - 1)
+            return
+        if abs(dx) >= abs(dy):
+            if dx < 0:
+                X0, Y0, dx, dy = X1, Y1, -dx, -dy
+            # k: paso a lo largo de x, recortado a las columnas visibles
+            first, last = max(0, -X0), min(dx, self.width - 1 - X0)
+            if first <= last:
+                self._line_x_major(X0, Y0, dx, dy, first, last, width, offset)
+        else:
+            if dy < 0:
+                X0, Y0, dx, dy = X1, Y1, -dx, -dy
+            first, last = max(0, -Y0), min(dy, self.height - 1 - Y0)
+            if first <= last:
+                self._line_y_major(X0, Y0, dx, dy, first, last, width, offset)
+
+    def _line_x_major(self, X0, Y0, n, dy, first, last, width, offset):
+        # y_k = Y0 + floor((2·k·dy + n) / 2n): el y de Bresenham en la columna X0 + k
+        if np is not None and _fits_int64(X0, Y0, n, dy, last):
+            ks = np.arange(first, last + 1)
+            xs = X0 + ks
+            ys = Y0 + (2 * ks * dy + n) // (2 * n) - offset
+            for _ in range(width):
+                visible = (ys >= 0) & (ys < self.height)
+                self.pixels[ys[visible], xs[visible]] = BLACK
+                ys = ys + 1
+            return
+        numerator = 2 * first * dy + n
+        y, error = Y0 + numerator // (2 * n), numerator % (2 * n)
+        run_start = X0 + first
+        for k in range(first + 1, last + 1):
+            error += 2 * dy
+            step = 0
+            if error >= 2 * n:
+                error -= 2 * n
+                step = 1
+            elif error < 0:
+                error += 2 * n
+                step = -1
+            if step:
+                # Tramo horizontal terminado: se pinta con todo el grosor
+                self._fill_rows(y - offset, width, run_start, X0 + k - 1)
+                y += step
+                run_start = X0 + k
+        self._fill_rows(y - offset, width, run_start, X0 + last)
+
+    def _line_y_major(self, X0, Y0, dx, n, first, last, width, offset):
+        if np is not None and _fits_int64(Y0, X0, n, dx, last):
+            ks = np.arange(first, last + 1)
+            ys = Y0 + ks
+            xs = X0 + (2 * ks * dx + n) // (2 * n) - offset
+            for _ in range(width):
+                visible = (xs >= 0) & (xs < self.width)
+                self.pixels[ys[visible], xs[visible]] = BLACK
+                xs = xs + 1
+            return
+        numerator = 2 * first * dx + n
+        x, error = X0 + numerator // (2 * n), numerator % (2 * n)
+        for k in range(first, last + 1):
+            if k > first:
+                error += 2 * dx
+                if error >= 2 * n:
+                    error -= 2 * n
+                    x += 1
+                elif error < 0:
+                    error += 2 * n
+                    x -= 1
+            self.fill_span(Y0 + k, x - offset, x - offset + width - 1)
+
+    def circle(self, x, y, radius, width: int = 1):
+        """Anillo entre las circunferencias de punto medio exterior e
+        interior del trazo; si el trazo es más ancho que el radio, un disco"""
+        cx, cy = self._px(x), self._px(y)
+        outer = int(abs(radius) * self.scale + width / 2 + 0.5)
+        inner = outer - width
+        if cx + outer < 0 or cy + outer < 0 or cx - outer >= self.width or cy - outer >= self.height:
+            return
+        top, bottom = max(-outer, -cy), min(outer, self.height - 1 - cy)
+        # Solo las filas visibles: |dy| en [first, last]
+        first = 0 if top <= 0 <= bottom else min(abs(top), abs(bottom))
+        last = max(abs(top), abs(bottom))
+        outer_x = midpoint_reach(outer, first, last)
+        inner_x = midpoint_reach(inner, first, last) if inner >= 0 else []
+        for dy in range(top, bottom + 1):
+            row = abs(dy)
+            reach = outer_x[row - first]
+            if row <= inner:
+                gap = min(inner_x[row - first] + 1, reach)
+                self.fill_span(cy + dy, cx - reach, cx - gap)
+                self.fill_span(cy + dy, cx + gap, cx + reach)
+            else:
+                self.fill_span(cy + dy, cx - reach, cx + reach)
+
+    def rect(self, x, y, w, h, width: int = 1):
+        """Borde del rectángulo: dos bandas horizontales y dos verticales"""
+        X0, X1 = sorted((self._px(x), self._px(x + w)))
+        Y0, Y1 = sorted((self._px(y), self._px(y + h)))
+        offset = (width - 1) // 2
+        left, right = X0 - offset, X1 - offset + width - 1
+        self._fill_rows(Y0 - offset, width, left, right)
+        self._fill_rows(Y1 - offset, width, left, right)
+        # Lados entre las dos bandas
+        top = Y0 - offset + width
+        self._fill_rows(top, Y1 - offset - top, left, X0 - offset + width - 1)
+        self._fill_rows(top, Y1 - offset - top, X1 - offset, right)
+
+    def polyline(self, points, width: int = 1):
+        for k in range(0, len(points) - 2, 2):
+            self.line(*points[k:k + 4], width)
+
+    def draw_rows(self, rows: Iterable[Tuple], pen_width=1) -> int:
+        """Dibuja filas (op, arg1, arg2, arg3, result) con el grosor
+        pen_width; PAPER y PEN se ignoran, como en el SVG. Devuelve el
+        número de figuras dibujadas."""
+        width = self.stroke_width(pen_width)
+        line, circle, rect = self.line, self.circle, self.rect
+        shapes = 0
+        for op, a, b, c, d in rows:
+            if op == 'LINE':
+                line(a, b, c, d, width)
+            elif op == 'CIRCLE':
+                circle(a, b, c, width)
+            elif op == 'RECT':
+                rect(a, b, c, d, width)
+            elif op == 'POLYLINE':
+                self.polyline(a, width)
+            else:
+                continue
+            shapes += 1
+        return shapes
+
+    def tobytes(self) -> bytes:
+        if np is not None:
+            return self.pixels.tobytes()
+        return bytes(self.pixels)
+
+    def to_png(self, compresslevel: int = 6) -> bytes:
+        if np is not None:
+            # Columna de filtros (0) delante de cada fila, en bloque
+            rows = np.zeros((self.height, self.width + 1), dtype=np.uint8)
+            rows[:, 1:] = self.pixels
+            return png_bytes(self.width, self.height, rows.tobytes(), compresslevel, filtered=True)
+        return png_bytes(self.width, self.height, self.tobytes(), compresslevel)
+
+
+def rasterize(rows: Iterable[Tuple], paper_size=100, pen_width=1, size: Optional[int] = None) -> Raster:
+    """Dibuja el lienzo paper_size x paper_size; size fija el lado de la
+    imagen en píxeles (miniaturas) y por defecto es un píxel por unidad,
+    como mucho MAX_SIDE"""
+    if size is not None and not 1 <= size <= MAX_SIDE:
+        raise ValueError(f"Tamaño de imagen no válido: {size} (entre 1 y {MAX_SIDE})")
+    side = int(size) if size else min(max(1, int(paper_size)), MAX_SIDE)
+    raster = Raster(side, side, side / paper_size if paper_size else 1.0)
+    raster.draw_rows(rows, pen_width)
+    return raster
+
+
+def write_png(path: str, rows: Iterable[Tuple], paper_size=100, pen_width=1,
+              size: Optional[int] = None, compresslevel: int = 6) -> Tuple[int, int]:
+    """Escribe el PNG y devuelve (ancho, alto)"""
+    raster = rasterize(rows, paper_size, pen_width, size)
+    with open(path, 'wb') as f:
+        f.write(raster.to_png(compresslevel))
+    return raster.width, raster.height
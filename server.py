@@ -0,0 +1,403 @@
+"""
+SERVIDOR DE COMPILACIÓN
+Demonio asyncio que compila fuentes con procesos ya calientes, sobre un
+socket Unix o TCP local, para no pagar el arranque del intérprete y las
+importaciones en cada compilación
+
+Protocolo: una petición JSON por línea y una respuesta JSON por línea, en
+el mismo orden. Un cliente puede enviar varias peticiones sin esperar las
+respuestas (pipelining):
+
+    -> {"id": 1, "source": "Paper 100\\nLine 0 0 10 10\\n", "opt_level": 1}
+    <- {"id": 1, "success": true, "errors": [], "instructions": [...], "svg": "..."}
+
+Opciones de cada petición: opt_level, cull, emit_svg (por defecto true) e
+ir (por defecto true: devolver las instrucciones). {"command": "stats"}
+devuelve los contadores del servidor.
+"""
+
+import os
+import sys
+import json
+import stat
+import time
+import errno
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), "simpledraw.sock")
+# Respuestas pendientes por conexión: al llegar a este número el servidor
+# deja de leer de esa conexión hasta que el cliente recoja respuestas
+DEFAULT_PIPELINE = 32
+# Compilaciones en curso en todo el servidor
+DEFAULT_MAX_PENDING = 256
+# Fuentes de hasta este tamaño se compilan en el propio bucle de eventos:
+# compilarlas cuesta menos que enviarlas a un proceso trabajador
+DEFAULT_INLINE_BYTES = 2048
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+
+_WARMUP_SOURCE = "Paper 100\nPen 1\nLine 0 0 10 10\nCircle 5 5 2\nRect 1 1 2 2\n"
+
+
+def handle_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Compila una petición ya decodificada y devuelve la respuesta"""
+    from main import compile_source
+    from intermediate_code import OPT_LEVELS, OPT_PEEPHOLE
+
+    source = request.get("source")
+    if not isinstance(source, str):
+        raise ValueError("falta el campo 'source' (texto)")
+    opt_level = request.get("opt_level", OPT_PEEPHOLE)
+    # bool es un int y 1.0 == 1: solo se aceptan enteros de verdad
+    if type(opt_level) is not int or opt_level not in OPT_LEVELS:
+        raise ValueError(f"opt_level no válido: {opt_level!r}")
+    emit_svg = bool(request.get("emit_svg", True))
+
+    result = compile_source(source, emit_svg=emit_svg, opt_level=opt_level, cull=bool(request.get("cull", False)))
+    response: Dict[str, Any] = {"success": result.success, "errors": result.errors}
+    if result.success:
+        if request.get("ir", True):
+            response["instructions"] = [[i.op, i.arg1, i.arg2, i.arg3, i.result] for i in result.instructions]
+        if emit_svg:
+            response["svg"] = result.svg
+    return response
+
+
+def parse_request(line: bytes) -> Dict[str, Any]:
+    """Decodifica una línea de petición (una sola vez, en el bucle de eventos)"""
+    request = json.loads(line)
+    if not isinstance(request, dict):
+        raise ValueError("la petición debe ser un objeto JSON")
+    return request
+
+
+def run_request(request: Dict[str, Any]) -> bytes:
+    """Petición decodificada -> línea de respuesta (se ejecuta en los
+    procesos trabajadores; la codificación JSON también se hace allí)"""
+    start = time.perf_counter()
+    try:
+        response = handle_request(request)
+    except Exception as e:
+        response = {"success": False, "errors": [f"Error: petición no válida: {e}"]}
+    response["id"] = request.get("id")
+    response["seconds"] = time.perf_counter() - start
+    return json.dumps(response).encode() + b"\n"
+
+
+def _warm_up():
+    # Importaciones y expresiones regulares listas antes de la primera petición
+    run_request({"source": _WARMUP_SOURCE})
+
+
+def _init_worker():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C lo gestiona el proceso principal
+    _warm_up()
+
+
+def _remove_stale_socket(path: str):
+    """Borra path si es un socket Unix en el que ya no escucha nadie (de una
+    ejecución anterior). Otro tipo de archivo o un servidor activo son un error"""
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(errno.EEXIST, "El archivo existe y no es un socket", path)
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise OSError(errno.EADDRINUSE, "Ya hay un servidor escuchando", path)
+
+
+def _error_line(request_id, message: str) -> bytes:
+    return json.dumps({"id": request_id, "success": False, "errors": [f"Error: {message}"]}).encode() + b"\n"
+
+
+class CompileServer:
+    """Servidor de compilación sobre un socket Unix (path) o TCP (host, port).
+
+    workers procesos trabajadores (por defecto uno por núcleo), arrancados y
+    calentados antes de aceptar conexiones, compilan las peticiones. Las de
+    hasta inline_bytes se compilan en el propio bucle de eventos, que para
+    dibujos pequeños es más rápido que el viaje de ida y vuelta al proceso;
+    con workers=0 se compila todo ahí. Cada conexión responde en el orden
+    de sus peticiones.
+
+    Contrapresión: una conexión con `pipeline` respuestas pendientes deja
+    de leerse hasta que el cliente las recoja, y en todo el servidor nunca
+    hay más de max_pending compilaciones en curso; las escrituras esperan
+    a que el cliente lea (drain).
+    """
+
+    def __init__(self, path: Optional[str] = None, host: str = "127.0.0.1", port: Optional[int] = None,
+                 workers: Optional[int] = None, pipeline: int = DEFAULT_PIPELINE,
+                 max_pending: int = DEFAULT_MAX_PENDING, inline_bytes: int = DEFAULT_INLINE_BYTES,
+                 max_request_bytes: int = MAX_REQUEST_BYTES):
+        if path is None and port is None:
+            path = DEFAULT_SOCKET
+        self.path = path
+        self.host = host
+        self.port = port
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.pipeline = pipeline
+        self.max_pending = max_pending
+        self.inline_bytes = inline_bytes
+        self.max_request_bytes = max_request_bytes
+        self.stats = {"connections": 0, "requests": 0, "errors": 0, "in_flight": 0}
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        # Conexión abierta -> tarea que la atiende
+        self._connections: Dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+    @property
+    def address(self) -> str:
+        return self.path if self.port is None else f"{self.host}:{self.port}"
+
+    async def start(self):
+        self._slots = asyncio.Semaphore(self.max_pending)
+        if self.workers > 0:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+            # Arranca todos los procesos antes de aceptar conexiones
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(loop.run_in_executor(self._executor, time.sleep, 0.01)
+                                   for _ in range(self.workers)))
+        _warm_up()
+        if self.port is None:
+            _remove_stale_socket(self.path)
+            self._server = await asyncio.start_unix_server(self._handle, self.path, limit=self.max_request_bytes)
+        else:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port,
+                                                      limit=self.max_request_bytes)
+            self.port = self._server.sockets[0].getsockname()[1]  # port=0: el que asignó el sistema
+        return self
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        listening = self._server is not None
+        if listening:
+            self._server.close()
+        # Las conexiones abiertas terminan al ver el fin de la entrada
+        handlers = list(self._connections.values())
+        for writer in list(self._connections):
+            writer.transport.abort()
+        await asyncio.gather(*handlers, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+            self._server = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if listening and self.port is None and os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _compile(self, line: bytes) -> bytes:
+        self.stats["in_flight"] += 1
+        try:
+            try:
+                request = parse_request(line)
+            except ValueError as e:
+                return _error_line(None, f"petición no válida: {e}")
+            if "command" in request:
+                return self._command(request)
+            if self._executor is None or len(line) <= self.inline_bytes:
+                return run_request(request)
+            return await asyncio.get_running_loop().run_in_executor(self._executor, run_request, request)
+        finally:
+            self.stats["in_flight"] -= 1
+            self._slots.release()
+
+    def _command(self, request: Dict[str, Any]) -> bytes:
+        if request.get("command") != "stats":
+            return _error_line(request.get("id"), f"comando desconocido: {request.get('command')!r}")
+        return json.dumps({"id": request.get("id"), "success": True, "stats": dict(self.stats)}).encode() + b"\n"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.stats["connections"] += 1
+        self._connections[writer] = asyncio.current_task()
+        pending: asyncio.Queue = asyncio.Queue(maxsize=self.pipeline)
+        responder = asyncio.ensure_future(self._respond(pending, writer))
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    # Petición demasiado larga: no se puede seguir leyendo la conexión
+                    self.stats["errors"] += 1
+                    await pending.put(_done(_error_line(None, f"petición de más de {self.max_request_bytes} bytes")))
+                    break
+                except ConnectionError:
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                self.stats["requests"] += 1
+                await self._slots.acquire()
+                await pending.put(asyncio.ensure_future(self._compile(line)))
+        finally:
+            await pending.put(None)
+            await responder
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+            self._connections.pop(writer, None)
+
+    async def _respond(self, pending: asyncio.Queue, writer: asyncio.StreamWriter):
+        connected = True
+        while True:
+            future = await pending.get()
+            if future is None:
+                return
+            try:
+                payload = await future
+            except Exception as e:
+                self.stats["errors"] += 1
+                payload = _error_line(None, str(e))
+            if not connected:
+                continue  # el cliente se fue: se descartan las respuestas restantes
+            try:
+                writer.write(payload)
+                await writer.drain()
+            except ConnectionError:
+                connected = False
+
+
+def _done(payload: bytes) -> asyncio.Future:
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(payload)
+    return future
+
+
+class CompileClient:
+    """Cliente síncrono del servidor de compilación.
+
+        with CompileClient(DEFAULT_SOCKET) as client:
+            response = client.compile(codigo)
+            response["svg"]
+    """
+
+    def __init__(self, path: Optional[str] = None, host: str = "127.0.0.1", port: Optional[int] = None,
+                 timeout: Optional[float] = None):
+        if port is None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            address: Any = path or DEFAULT_SOCKET
+        else:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            address = (host, port)
+        self._socket.settimeout(timeout)
+        self._socket.connect(address)
+        self._reader = self._socket.makefile("rb")
+        self._next_id = 0
+
+    def _send(self, request: Dict[str, Any]) -> int:
+        self._next_id += 1
+        request["id"] = self._next_id
+        self._socket.sendall(json.dumps(request).encode() + b"\n")
+        return self._next_id
+
+    def _receive(self, request_id: int) -> Dict[str, Any]:
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("El servidor cerró la conexión")
+        response = json.loads(line)
+        if response.get("id") not in (request_id, None):
+            raise RuntimeError(f"Respuesta {response.get('id')} fuera de orden (se esperaba {request_id})")
+        return response
+
+    def compile(self, source: str, **options) -> Dict[str, Any]:
+        """Compila una fuente; options: opt_level, cull, emit_svg, ir"""
+        return self._receive(self._send(dict(options, source=source)))
+
+    def compile_many(self, sources: Iterable[str], window: int = DEFAULT_PIPELINE, **options) -> List[Dict[str, Any]]:
+        """Compila varias fuentes por pipelining: mantiene hasta `window`
+        peticiones enviadas sin respuesta. Las respuestas siguen el orden
+        de las fuentes."""
+        responses = []
+        outstanding: List[int] = []
+        for source in sources:
+            if len(outstanding) >= window:
+                responses.append(self._receive(outstanding.pop(0)))
+            outstanding.append(self._send(dict(options, source=source)))
+        for request_id in outstanding:
+            responses.append(self._receive(request_id))
+        return responses
+
+    def stats(self) -> Dict[str, int]:
+        return self._receive(self._send({"command": "stats"}))["stats"]
+
+    def close(self):
+        self._reader.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Servidor de compilación SimpleDraw")
+    arg_parser.add_argument("--socket", default=None, metavar="PATH",
+                            help=f"socket Unix en el que escuchar (por defecto: {DEFAULT_SOCKET})")
+    arg_parser.add_argument("--port", type=int, default=None,
+                            help="escuchar en TCP 127.0.0.1:PORT en lugar de un socket Unix")
+    arg_parser.add_argument("-j", "--workers", type=int, default=None,
+                            help="procesos trabajadores (por defecto: todos los núcleos; 0 compila en el bucle)")
+    arg_parser.add_argument("--pipeline", type=int, default=DEFAULT_PIPELINE,
+                            help=f"respuestas pendientes por conexión (por defecto: {DEFAULT_PIPELINE})")
+    arg_parser.add_argument("--inline-bytes", type=int, default=DEFAULT_INLINE_BYTES,
+                            help="fuentes de hasta este tamaño se compilan sin pasar por los trabajadores "
+                                 f"(por defecto: {DEFAULT_INLINE_BYTES})")
+    arg_parser.add_argument("--max-pending", type=int, default=DEFAULT_MAX_PENDING,
+                            help=f"compilaciones en curso en total (por defecto: {DEFAULT_MAX_PENDING})")
+    args = arg_parser.parse_args(argv)
+
+    server = CompileServer(args.socket, port=args.port, workers=args.workers,
+                           pipeline=args.pipeline, max_pending=args.max_pending,
+                           inline_bytes=args.inline_bytes)
+
+    async def run():
+        await server.start()
+        print(f"✓ Servidor de compilación en {server.address} ({server.workers} trabajadores)")
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"Error: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+MAPA DE FUENTES
+Relaciona cada declaración, instrucción de código intermedio y elemento SVG
+con su posición exacta en el código fuente, en arrays de offsets, para ir de
+un elemento a su línea y de una línea a sus elementos en O(1)
+"""
+
+import json
+from array import array
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from lexer import Lexer, KEYWORDS, NON_LEXER_SPACE
+from parser import STATEMENTS
+
+SOURCE_MAP_EXTENSION = ".map"
+SOURCE_MAP_VERSION = 1
+
+# Palabra clave -> número de operandos
+_ARITY = {word: len(STATEMENTS[token_type][1]) for word, token_type in KEYWORDS.items()}
+# Opcodes que no producen elemento SVG
+_CONFIG_OPS = ('PAPER', 'PEN')
+
+
+@dataclass
+class SourceSpan:
+    """Posición de una declaración: línea y columna (desde 1) y offsets
+    [start, end) en caracteres del texto completo"""
+    line: int
+    column: int
+    start: int
+    end: int
+
+
+def _line_spans(text: str, line: int, offset: int) -> List[Tuple[int, int]]:
+    # Declaraciones de una línea que no encaja en el caso simple: tokens del
+    # lexer; cada declaración acaba donde empieza el token siguiente, sin
+    # espacios ni comentario
+    tokens = list(Lexer(text, first_line=line).iter_tokens())
+    spans = []
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        spec = STATEMENTS.get(token.type)
+        if spec is None:
+            index += 1
+            continue
+        index += 1 + len(spec[1])
+        start = token.column - 1
+        stop = tokens[index].column - 1 if index < len(tokens) else len(text)
+        end = start + len(text[start:stop].split('#')[0].rstrip())
+        spans.append((offset + start, offset + end))
+    return spans
+
+
+def statement_spans(source: str) -> Tuple[array, array, array, array]:
+    """(líneas, columnas, inicios, finales) de cada declaración de un
+    programa sin errores, en el orden del programa.
+
+    Una línea con una sola declaración se mide sin lexer (de la palabra
+    clave al último operando); las demás pasan por el lexer, igual que en el
+    camino rápido del compilador.
+    """
+    lines, columns, starts, ends = array('L'), array('L'), array('L'), array('L')
+    arity = _ARITY
+    offset = 0
+    for number, text in enumerate(source.split('\n'), 1):
+        code = text[:text.index('#')] if '#' in text else text
+        fields = code.split()
+        simple = code.isascii() and not NON_LEXER_SPACE.search(code)
+        if simple and fields and arity.get(fields[0]) == len(fields) - 1:
+            spans = [(offset + len(code) - len(code.lstrip()), offset + len(code.rstrip()))]
+        elif fields or not simple:
+            spans = _line_spans(text, number, offset)
+        else:
+            spans = ()
+        for start, end in spans:
+            lines.append(number)
+            columns.append(start - offset + 1)
+            starts.append(start)
+            ends.append(end)
+        offset += len(text) + 1
+    return lines, columns, starts, ends
+
+
+class SourceMap:
+    """Mapa de fuentes de un programa compilado.
+
+    Todo se guarda en arrays: línea, columna, inicio y final de cada
+    declaración, la declaración de cada instrucción del IR final y la
+    instrucción de cada elemento SVG, más los índices inversos (declaración
+    -> instrucción e instrucción -> elemento, -1 si no hay) y la primera
+    declaración de cada línea. Las declaraciones que elimina la optimización
+    no tienen instrucción ni elemento.
+    """
+
+    def __init__(self, lines: array, columns: array, starts: array, ends: array,
+                 instructions: array, elements: array):
+        self.lines = lines
+        self.columns = columns
+        self.starts = starts
+        self.ends = ends
+        self.instructions = instructions    # instrucción -> declaración
+        self.elements = elements            # elemento -> instrucción
+        # Declaraciones de la línea n: [line_starts[n - 1], line_starts[n])
+        self.line_starts = array('L', [0])
+        for position, line in enumerate(lines):
+            while len(self.line_starts) < line:
+                self.line_starts.append(position)
+        self.line_starts.append(len(lines))
+        self._statement_instruction = array('l', [-1]) * len(lines)
+        for instruction, statement in enumerate(instructions):
+            self._statement_instruction[statement] = instruction
+        self._instruction_element = array('l', [-1]) * len(instructions)
+        for element, instruction in enumerate(elements):
+            self._instruction_element[instruction] = element
+
+    @classmethod
+    def build(cls, source: str, keep: Sequence[bool], ops: Sequence[str],
+              drawn: Optional[Iterable[int]] = None) -> "SourceMap":
+        """Mapa de source. keep dice qué instrucciones del IR sin optimizar
+        (una por declaración) conserva la optimización (ver
+        intermediate_code.keep_flags); ops son los opcodes del IR final y
+        drawn, si se indica, las instrucciones que llegan al SVG (por defecto
+        todas las figuras)."""
+        lines, columns, starts, ends = statement_spans(source)
+        if len(lines) != len(keep):
+            raise ValueError(f"El código fuente tiene {len(lines)} declaraciones y el IR {len(keep)}")
+        instructions = array('L', [statement for statement, flag in enumerate(keep) if flag])
+        if drawn is None:
+            drawn = (index for index, op in enumerate(ops) if op not in _CONFIG_OPS)
+        return cls(lines, columns, starts, ends, instructions, array('L', drawn))
+
+    def with_elements(self, drawn: Iterable[int]) -> "SourceMap":
+        """El mismo mapa con otros elementos SVG (p. ej. tras recortar)"""
+        return SourceMap(self.lines, self.columns, self.starts, self.ends,
+                         self.instructions, array('L', drawn))
+
+    def statement_span(self, statement: int) -> SourceSpan:
+        return SourceSpan(self.lines[statement], self.columns[statement],
+                          self.starts[statement], self.ends[statement])
+
+    def instruction_span(self, instruction: int) -> SourceSpan:
+        return self.statement_span(self.instructions[instruction])
+
+    def element_span(self, element: int) -> SourceSpan:
+        return self.statement_span(self.instructions[self.elements[element]])
+
+    def element_line(self, element: int) -> int:
+        return self.lines[self.instructions[self.elements[element]]]
+
+    def line_statements(self, line: int) -> range:
+        if not 1 <= line < len(self.line_starts):
+            return range(0)
+        return range(self.line_starts[line - 1], self.line_starts[line])
+
+    def line_instructions(self, line: int) -> List[int]:
+        found = (self._statement_instruction[s] for s in self.line_statements(line))
+        return [instruction for instruction in found if instruction >= 0]
+
+    def line_elements(self, line: int) -> List[int]:
+        found = (self._instruction_element[i] for i in self.line_instructions(line))
+        return [element for element in found if element >= 0]
+
+    def to_dict(self) -> dict:
+        return {
+            'version': SOURCE_MAP_VERSION,
+            'lines': self.lines.tolist(),
+            'columns': self.columns.tolist(),
+            'starts': self.starts.tolist(),
+            'ends': self.ends.tolist(),
+            'instructions': self.instructions.tolist(),
+            'elements': self.elements.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SourceMap":
+        if data.get('version') != SOURCE_MAP_VERSION:
+            raise ValueError(f"Versión de mapa de fuentes no soportada: {data.get('version')}")
+        return cls(*(array('L', data[key]) for key in
+                     ('lines', 'columns', 'starts', 'ends', 'instructions', 'elements')))
+
+    def write(self, path: str, svg_file: Optional[str] = None):
+        """Escribe el mapa en JSON; svg_file anota el SVG al que acompaña"""
+        data = self.to_dict()
+        if svg_file is not None:
+            data['file'] = svg_file
+        with open(path, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path: str) -> "SourceMap":
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
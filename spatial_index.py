@@ -0,0 +1,329 @@
+"""
+ÍNDICE ESPACIAL
+R-tree empaquetado (carga masiva Sort-Tile-Recursive) sobre las cajas
+envolventes de las figuras del código intermedio
+"""
+
+import heapq
+import math
+from array import array
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él se ordena con sorted()
+    np = None
+
+from intermediate_code import ColumnarIR, OP_CODES, IR_WIDTH
+
+DEFAULT_NODE_SIZE = 16
+
+Box = Tuple[float, float, float, float]  # (min_x, min_y, max_x, max_y)
+
+_LINE = OP_CODES['LINE']
+_CIRCLE = OP_CODES['CIRCLE']
+_RECT = OP_CODES['RECT']
+_SHAPE_CODES = (_LINE, _CIRCLE, _RECT)
+
+
+def bounding_box(op: str, arg1, arg2, arg3, result) -> Optional[Box]:
+    """Caja envolvente de una instrucción; None si no dibuja nada"""
+    if op == 'LINE':
+        return (min(arg1, arg3), min(arg2, result), max(arg1, arg3), max(arg2, result))
+    elif op == 'CIRCLE':
+        radius = abs(arg3)
+        return (arg1 - radius, arg2 - radius, arg1 + radius, arg2 + radius)
+    elif op == 'RECT':
+        return (min(arg1, arg1 + arg3), min(arg2, arg2 + result),
+                max(arg1, arg1 + arg3), max(arg2, arg2 + result))
+    elif op == 'POLYLINE':
+        xs, ys = arg1[0::2], arg1[1::2]
+        return (min(xs), min(ys), max(xs), max(ys))
+    return None
+
+
+def _segments(arg1) -> Iterator[Tuple]:
+    # Segmentos (x1, y1, x2, y2) consecutivos de una polilínea plana
+    for k in range(0, len(arg1) - 2, 2):
+        yield arg1[k:k + 4]
+
+
+def cull_rows(rows: Iterable[Tuple], paper_size, pen_width) -> Iterator[Tuple]:
+    """Descarta las figuras que quedan fuera del lienzo [0, paper_size]².
+
+    El margen de medio grosor de lápiz conserva los trazos que asoman por el
+    borde; las filas que no son figuras (PAPER, PEN) pasan siempre.
+    """
+    margin = abs(pen_width) / 2
+    low, high = -margin, paper_size + margin
+    for row in rows:
+        box = bounding_box(*row)
+        if box is None or (box[2] >= low and box[3] >= low and box[0] <= high and box[1] <= high):
+            yield row
+
+
+def shape_distance(code: int, operands, x: float, y: float) -> float:
+    """Distancia del punto al trazo de la figura (las figuras no tienen relleno)"""
+    a, b, c, d = operands
+    if code == _LINE:
+        dx, dy = c - a, d - b
+        length = dx * dx + dy * dy
+        t = 0.0 if length == 0 else max(0.0, min(1.0, ((x - a) * dx + (y - b) * dy) / length))
+        return math.hypot(x - (a + t * dx), y - (b + t * dy))
+    elif code == _CIRCLE:
+        return abs(math.hypot(x - a, y - b) - abs(c))
+    min_x, max_x = min(a, a + c), max(a, a + c)
+    min_y, max_y = min(b, b + d), max(b, b + d)
+    if min_x <= x <= max_x and min_y <= y <= max_y:
+        return min(x - min_x, max_x - x, y - min_y, max_y - y)
+    return _box_distance(min_x, min_y, max_x, max_y, x, y)
+
+
+def _box_distance(min_x, min_y, max_x, max_y, x, y) -> float:
+    dx = max(min_x - x, 0.0, x - max_x)
+    dy = max(min_y - y, 0.0, y - max_y)
+    return math.hypot(dx, dy)
+
+
+class SpatialIndex:
+    """R-tree estático de figuras.
+
+    Las hojas son las figuras ordenadas con STR (por franjas en x y, dentro
+    de cada franja, en y); cada nivel superior agrupa node_size entradas
+    consecutivas del anterior. Todo se guarda en arrays planos: las cajas de
+    cada nivel (4 valores por entrada), el índice de instrucción de cada
+    figura y su geometría para las comprobaciones exactas.
+
+    Los resultados son índices en la lista de instrucciones de la que se
+    construyó el índice, en orden de dibujo. Una POLYLINE se guarda como
+    un LINE por segmento, todos con el índice de la polilínea.
+    """
+
+    def __init__(self, node_size: int = DEFAULT_NODE_SIZE):
+        if node_size < 2:
+            raise ValueError("node_size debe ser al menos 2")
+        self.node_size = node_size
+        self.ids = array('Q')
+        self.ops = array('B')
+        self.operands = array('d')
+        self._levels: List[array] = []
+        # Hay ids repetidos (segmentos de polilíneas)
+        self._shared_ids = False
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_instructions(cls, instructions, node_size: int = DEFAULT_NODE_SIZE) -> "SpatialIndex":
+        """Carga masiva desde una lista de instrucciones o un ColumnarIR"""
+        if isinstance(instructions, ColumnarIR) and np is not None:
+            return cls._from_columnar(instructions, node_size)
+        rows = instructions.rows() if isinstance(instructions, ColumnarIR) else (
+            (i.op, i.arg1, i.arg2, i.arg3, i.result) for i in instructions)
+        return cls.bulk_load(enumerate(rows), node_size)
+
+    @classmethod
+    def bulk_load(cls, rows: Iterable[Tuple[int, Tuple]], node_size: int = DEFAULT_NODE_SIZE) -> "SpatialIndex":
+        """Construye el índice de una vez desde pares (id, fila de IR)"""
+        ids, ops, operands, boxes = array('Q'), array('B'), array('d'), array('d')
+        shared_ids = False
+        for shape_id, (op, arg1, arg2, arg3, result) in rows:
+            if op == 'POLYLINE':
+                for segment in _segments(arg1):
+                    ids.append(shape_id)
+                    ops.append(_LINE)
+                    operands.extend(segment)
+                    boxes.extend(bounding_box('LINE', *segment))
+                shared_ids = True
+                continue
+            box = bounding_box(op, arg1, arg2, arg3, result)
+            if box is None:
+                continue
+            ids.append(shape_id)
+            ops.append(OP_CODES[op])
+            operands.extend((arg1, arg2, arg3, result if result is not None else 0.0))
+            boxes.extend(box)
+
+        index = cls(node_size)
+        index._shared_ids = shared_ids
+        if np is not None:
+            index._pack_numpy(ids, ops, operands, boxes)
+        else:
+            index._pack(ids, ops, operands, boxes)
+        return index
+
+    @classmethod
+    def _from_columnar(cls, ir: ColumnarIR, node_size: int) -> "SpatialIndex":
+        codes, values = ir.as_numpy()
+        keep = np.isin(codes, _SHAPE_CODES)
+        codes, values = codes[keep], values[keep]
+        a, b, c, d = values.T
+        radius = np.abs(c)
+        is_line, is_circle = codes == _LINE, codes == _CIRCLE
+        # RECT: (x, y, x + ancho, y + alto); LINE: (x1, y1, x2, y2)
+        far_x = np.where(is_line, c, a + c)
+        far_y = np.where(is_line, d, b + d)
+        boxes = np.column_stack((
+            np.where(is_circle, a - radius, np.minimum(a, far_x)),
+            np.where(is_circle, b - radius, np.minimum(b, far_y)),
+            np.where(is_circle, a + radius, np.maximum(a, far_x)),
+            np.where(is_circle, b + radius, np.maximum(b, far_y)),
+        ))
+        index = cls(node_size)
+        index._pack_numpy(np.flatnonzero(keep).astype(np.uint64), codes, values, boxes)
+        return index
+
+    def _pack(self, ids, ops, operands, boxes):
+        count = len(ids)
+        centers_x = [boxes[i * 4] + boxes[i * 4 + 2] for i in range(count)]
+        centers_y = [boxes[i * 4 + 1] + boxes[i * 4 + 3] for i in range(count)]
+        by_x = sorted(range(count), key=centers_x.__getitem__)
+        order = []
+        slice_size = self._slice_size(count)
+        for start in range(0, count, slice_size):
+            order.extend(sorted(by_x[start:start + slice_size], key=centers_y.__getitem__))
+
+        for i in order:
+            self.ids.append(ids[i])
+            self.ops.append(ops[i])
+            self.operands.extend(operands[i * IR_WIDTH:(i + 1) * IR_WIDTH])
+        level = array('d')
+        for i in order:
+            level.extend(boxes[i * 4:i * 4 + 4])
+        self._build_levels(level)
+
+    def _pack_numpy(self, ids, ops, operands, boxes):
+        ids = np.asarray(ids, dtype=np.uint64)
+        ops = np.asarray(ops, dtype=np.uint8)
+        operands = np.asarray(operands, dtype=np.float64).reshape(-1, IR_WIDTH)
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        count = len(ids)
+        by_x = np.argsort(boxes[:, 0] + boxes[:, 2], kind='stable')
+        slices = np.arange(count) // self._slice_size(count)
+        order = by_x[np.lexsort(((boxes[by_x, 1] + boxes[by_x, 3]), slices))]
+
+        self.ids = array('Q', ids[order].tobytes())
+        self.ops = array('B', ops[order].tobytes())
+        self.operands = array('d', operands[order].tobytes())
+        level = boxes[order]
+        self._levels = [array('d', level.tobytes())]
+        size = self.node_size
+        while len(level) > 1:
+            padding = -len(level) % size
+            mins = np.pad(level[:, :2], ((0, padding), (0, 0)), constant_values=np.inf)
+            maxs = np.pad(level[:, 2:], ((0, padding), (0, 0)), constant_values=-np.inf)
+            level = np.hstack((mins.reshape(-1, size, 2).min(axis=1),
+                               maxs.reshape(-1, size, 2).max(axis=1)))
+            self._levels.append(array('d', level.tobytes()))
+
+    def _slice_size(self, count: int) -> int:
+        leaves = math.ceil(count / self.node_size) or 1
+        return math.ceil(math.sqrt(leaves)) * self.node_size
+
+    def _build_levels(self, level: array):
+        self._levels = [level]
+        size = self.node_size
+        while len(level) > 4:
+            parent = array('d')
+            for start in range(0, len(level), size * 4):
+                group = level[start:start + size * 4]
+                parent.extend((min(group[0::4]), min(group[1::4]), max(group[2::4]), max(group[3::4])))
+            self._levels.append(parent)
+            level = parent
+
+    def _children(self, level: int, node: int) -> range:
+        first = node * self.node_size
+        return range(first, min(first + self.node_size, len(self._levels[level - 1]) // 4))
+
+    def query(self, min_x: float, min_y: float, max_x: float, max_y: float) -> List[int]:
+        """Figuras cuya caja envolvente corta el rectángulo (vista)"""
+        if not self._levels:
+            return []
+        found = []
+        top = len(self._levels) - 1
+        stack = [(top, node) for node in range(len(self._levels[top]) // 4)]
+        while stack:
+            level, node = stack.pop()
+            boxes = self._levels[level]
+            b = node * 4
+            if boxes[b] > max_x or boxes[b + 1] > max_y or boxes[b + 2] < min_x or boxes[b + 3] < min_y:
+                continue
+            if level == 0:
+                found.append(self.ids[node])
+            else:
+                stack.extend((level - 1, child) for child in self._children(level, node))
+        return self._sorted_ids(found)
+
+    def _sorted_ids(self, found: List[int]) -> List[int]:
+        if self._shared_ids:
+            return sorted(set(found))
+        found.sort()
+        return found
+
+    def _operands(self, entry: int):
+        return self.operands[entry * IR_WIDTH:(entry + 1) * IR_WIDTH]
+
+    def hit_test(self, x: float, y: float, tolerance: float = 0.0) -> List[int]:
+        """Figuras cuyo trazo pasa a tolerance o menos del punto; la última
+        de la lista es la que queda encima al dibujar"""
+        if not self._levels:
+            return []
+        hits = []
+        top = len(self._levels) - 1
+        stack = [(top, node) for node in range(len(self._levels[top]) // 4)]
+        while stack:
+            level, node = stack.pop()
+            boxes = self._levels[level]
+            b = node * 4
+            if _box_distance(boxes[b], boxes[b + 1], boxes[b + 2], boxes[b + 3], x, y) > tolerance:
+                continue
+            if level == 0:
+                if shape_distance(self.ops[node], self._operands(node), x, y) <= tolerance:
+                    hits.append(self.ids[node])
+            else:
+                stack.extend((level - 1, child) for child in self._children(level, node))
+        return self._sorted_ids(hits)
+
+    def nearest(self, x: float, y: float, k: int = 1,
+                max_distance: float = math.inf) -> List[Tuple[int, float]]:
+        """Las k figuras con el trazo más cercano al punto, como pares
+        (id, distancia) de menor a mayor distancia.
+
+        Búsqueda best-first: la distancia a una caja nunca supera la
+        distancia a lo que contiene, así que se expanden los nodos por
+        orden de caja hasta tener k figuras más cercanas que cualquier caja
+        pendiente.
+        """
+        if not self._levels or k <= 0:
+            return []
+        result = []
+        seen = set()
+        top = len(self._levels) - 1
+        # (distancia, es_figura, nivel, nodo): a igual distancia, figuras primero
+        heap = []
+        for node in range(len(self._levels[top]) // 4):
+            boxes = self._levels[top]
+            b = node * 4
+            heap.append((_box_distance(boxes[b], boxes[b + 1], boxes[b + 2], boxes[b + 3], x, y), 1, top, node))
+        heapq.heapify(heap)
+
+        while heap and len(result) < k:
+            distance, pending_box, level, node = heapq.heappop(heap)
+            if distance > max_distance:
+                break
+            if not pending_box:
+                # El segmento más cercano de una polilínea sale primero
+                shape_id = self.ids[node]
+                if shape_id not in seen:
+                    seen.add(shape_id)
+                    result.append((shape_id, distance))
+            elif level == 0:
+                exact = shape_distance(self.ops[node], self._operands(node), x, y)
+                heapq.heappush(heap, (exact, 0, 0, node))
+            else:
+                boxes = self._levels[level - 1]
+                for child in self._children(level, node):
+                    b = child * 4
+                    heapq.heappush(heap, (_box_distance(boxes[b], boxes[b + 1], boxes[b + 2], boxes[b + 3], x, y),
+                                          1, level - 1, child))
+        return result
@@ -0,0 +1,149 @@
+"""
+ESCRITOR SVG
+Escribe el SVG directamente en un archivo binario con búfer (o .svgz
+comprimido con gzip), sin construir el documento completo en memoria
+"""
+
+import io
+import gzip
+from typing import Callable, Iterable, Optional, Tuple
+
+SVG_NS = "http://www.w3.org/2000/svg"
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+# Elementos que se acumulan antes de cada write()
+_BATCH = 4096
+# Tope de la caché de números ya formateados
+_FORMAT_CACHE_SIZE = 1 << 16
+
+# Plantillas por operación, mismas que svg_row pero en bytes
+_LINE = b'    <line x1="%s" y1="%s" x2="%s" y2="%s"/>\n'
+_CIRCLE = b'    <circle cx="%s" cy="%s" r="%s"/>\n'
+_RECT = b'    <rect x="%s" y="%s" width="%s" height="%s"/>\n'
+_POLYLINE = b'    <polyline points="%s"/>\n'
+
+Formatter = Callable[[object], bytes]
+
+
+def make_formatter(precision: Optional[int] = None) -> Formatter:
+    """Formateador de números a bytes.
+
+    Sin precisión el texto es el mismo que en build_svg (str del valor). Con
+    precision=n los flotantes se redondean a n decimales y se quitan los
+    ceros sobrantes ("12.50" -> "12.5", "3.000" -> "3"); los enteros no
+    cambian. Los valores ya vistos salen de una caché.
+    """
+    # Cachés separadas: 3 == 3.0 pero se escriben distinto
+    ints, floats = {}, {}
+
+    if precision is None:
+        def convert(value) -> bytes:
+            return str(value).encode()
+    else:
+        pattern = b'%.' + str(precision).encode() + b'f'
+
+        def convert(value) -> bytes:
+            if isinstance(value, int):
+                return b'%d' % value
+            text = (pattern % value).rstrip(b'0').rstrip(b'.') if precision else pattern % value
+            return b'0' if text == b'-0' else text
+
+    def format_number(value) -> bytes:
+        cache = ints if type(value) is int else floats
+        if cache is floats and value == 0:
+            # -0.0 == 0.0 pero str los escribe distinto: sin caché
+            return convert(value)
+        text = cache.get(value)
+        if text is None:
+            text = convert(value)
+            if len(cache) < _FORMAT_CACHE_SIZE:
+                cache[value] = text
+        return text
+
+    return format_number
+
+
+class SvgWriter:
+    """Escritor incremental de SVG.
+
+    Las figuras se formatean con plantillas de bytes precompiladas y se
+    escriben por lotes en un archivo binario con búfer; si la ruta termina
+    en .svgz (o compress=True) la salida pasa por gzip. Uso:
+
+        with SvgWriter("dibujo.svgz", paper_size, pen_width) as writer:
+            writer.write_rows(filas)
+    """
+
+    def __init__(self, path: str, paper_size=100, pen_width=1, precision: Optional[int] = None,
+                 compress: Optional[bool] = None, buffer_size: int = DEFAULT_BUFFER_SIZE,
+                 compresslevel: int = 6):
+        self.path = path
+        self.compress = path.endswith('.svgz') if compress is None else compress
+        self.format = make_formatter(precision)
+        self.elements = 0
+        if self.compress:
+            self._raw = gzip.open(path, 'wb', compresslevel=compresslevel)
+            self._file = io.BufferedWriter(self._raw, buffer_size)
+        else:
+            self._raw = None
+            self._file = open(path, 'wb', buffering=buffer_size)
+        self._write_header(paper_size, pen_width)
+
+    def _write_header(self, paper_size, pen_width):
+        paper, pen = self.format(paper_size), self.format(pen_width)
+        self._file.write(
+            b'<svg width="%s" height="%s" xmlns="%s">\n' % (paper, paper, SVG_NS.encode())
+            + b'  <rect width="100%" height="100%" fill="white"/>\n'
+            + b'  <g stroke="black" stroke-width="%s" fill="none">\n' % pen
+        )
+
+    def write_rows(self, rows: Iterable[Tuple]):
+        """Escribe las figuras de filas (op, arg1, arg2, arg3, result);
+        PAPER y PEN se ignoran"""
+        line, circle, rect = _LINE, _CIRCLE, _RECT
+        f = self.format
+        batch = []
+        append = batch.append
+        for op, a, b, c, d in rows:
+            if op == 'LINE':
+                append(line % (f(a), f(b), f(c), f(d)))
+            elif op == 'CIRCLE':
+                append(circle % (f(a), f(b), f(c)))
+            elif op == 'RECT':
+                append(rect % (f(a), f(b), f(c), f(d)))
+            elif op == 'POLYLINE':
+                append(_POLYLINE % b' '.join(b'%s,%s' % (f(a[k]), f(a[k + 1])) for k in range(0, len(a), 2)))
+            else:
+                continue
+            if len(batch) >= _BATCH:
+                self._flush(batch)
+                batch.clear()
+        self._flush(batch)
+
+    def _flush(self, batch):
+        if batch:
+            self._file.write(b''.join(batch))
+            self.elements += len(batch)
+
+    def close(self):
+        if self._file.closed:
+            return
+        # Mismo final que SVG_FOOTER (sin salto de línea tras </svg>)
+        self._file.write(b'  </g>\n</svg>')
+        self._file.close()
+        if self._raw is not None:
+            self._raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_svg(path: str, rows: Iterable[Tuple], paper_size=100, pen_width=1,
+              precision: Optional[int] = None, compress: Optional[bool] = None) -> int:
+    """Escribe un SVG completo y devuelve el número de elementos"""
+    with SvgWriter(path, paper_size, pen_width, precision, compress) as writer:
+        writer.write_rows(rows)
+    return writer.elements
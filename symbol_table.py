@@ -1,16 +1,51 @@
 """
 TABLA DE SÍMBOLOS
+Las configuraciones y variables se guardan como objetos Symbol; las figuras,
+que son casi todos los símbolos de un programa grande, en columnas por tipo
+que comparten los operandos con el código intermedio. get_symbol las devuelve
+como vistas (ShapeSymbol) sobre esas columnas
 """
 
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
 from dataclasses import dataclass
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Sequence, Tuple
 from enum import Enum
 
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él los desplazamientos recorren el array
+    np = None
+
 class SymbolType(Enum):
     CONFIG = "CONFIG"
     SHAPE = "SHAPE"
     VARIABLE = "VARIABLE"
 
+# Parámetros de cada tipo de figura, en el orden de sus operandos
+SHAPE_FIELDS = {
+    "Line": ("x1", "y1", "x2", "y2"),
+    "Circle": ("x", "y", "radius"),
+    "Rect": ("x", "y", "width", "height"),
+}
+
+def shift_values(values: array, start: int, delta: int):
+    """Suma delta a values[start:] en su sitio. Con NumPy es una suma en
+    bloque sobre el búfer del array, sin crear objetos por elemento"""
+    if not delta or start >= len(values):
+        return
+    if np is None:
+        values[start:] = array(values.typecode, map(delta.__add__, values[start:]))
+        return
+    view = np.frombuffer(values, dtype=values.typecode)[start:]
+    # Restar en lugar de sumar un negativo: los arrays 'L' son sin signo
+    if delta > 0:
+        view += delta
+    else:
+        view -= -delta
+
+
 @dataclass
 class Symbol:
     name: str
@@ -18,54 +53,407 @@ class Symbol:
     value: Any
     line: int
     data_type: str
-    
+
     def __repr__(self):
         return f"Symbol({self.name}, {self.type.name}, {self.data_type})"
 
+
+class _ShapeColumns:
+    """Figuras de un tipo con los mismos parámetros: una lista por parámetro
+    (referencias a los mismos números que el código intermedio), su línea y
+    su número de figura"""
+    __slots__ = ('kind', 'fields', 'columns', 'lines', 'numbers')
+
+    def __init__(self, kind: str, fields: Tuple[str, ...]):
+        self.kind = kind
+        self.fields = fields
+        self.columns: List[list] = [[] for _ in fields]
+        self.lines = array('L')
+        self.numbers = array('L')
+
+
+class ShapeSymbol:
+    """Vista de una figura guardada en columnas, con la interfaz de Symbol;
+    asignar value o line escribe en la tabla"""
+    __slots__ = ('_table', '_number')
+
+    type = SymbolType.SHAPE
+
+    def __init__(self, table: 'SymbolTable', number: int):
+        self._table = table
+        self._number = number
+
+    def _row(self) -> Tuple[_ShapeColumns, int]:
+        return self._table._shape_position(self._number)
+
+    @property
+    def name(self) -> str:
+        return f"{self.data_type}_{self._number}"
+
+    @property
+    def data_type(self) -> str:
+        return self._table._groups[self._table._shape_group[self._number - 1]].kind
+
+    @property
+    def value(self) -> Dict[str, Any]:
+        group, row = self._row()
+        return {name: column[row] for name, column in zip(group.fields, group.columns)}
+
+    @value.setter
+    def value(self, params: Dict[str, Any]):
+        self._table.update_symbol(self.name, params)
+
+    @property
+    def line(self) -> int:
+        group, row = self._row()
+        return group.lines[row]
+
+    @line.setter
+    def line(self, line: int):
+        group, row = self._row()
+        group.lines[row] = line
+
+    def __eq__(self, other):
+        if not isinstance(other, (Symbol, ShapeSymbol)):
+            return NotImplemented
+        return ((self.name, self.type, self.value, self.line, self.data_type) ==
+                (other.name, other.type, other.value, other.line, other.data_type))
+
+    def __repr__(self):
+        return f"Symbol({self.name}, {self.type.name}, {self.data_type})"
+
+
+class SymbolsView(Mapping):
+    """Vista de solo lectura nombre -> símbolo en orden de inserción (la
+    interfaz del antiguo diccionario SymbolTable.symbols)"""
+
+    def __init__(self, table: 'SymbolTable'):
+        self._table = table
+
+    def __getitem__(self, name: str):
+        symbol = self._table.get_symbol(name)
+        if symbol is None:
+            raise KeyError(name)
+        return symbol
+
+    def __contains__(self, name) -> bool:
+        return self._table.exists(name)
+
+    def __len__(self) -> int:
+        return self._table._total
+
+    def __iter__(self) -> Iterator[str]:
+        return (symbol.name for symbol in self._table._iter_all())
+
+    def values(self):
+        return list(self._table._iter_all())
+
+    def items(self):
+        return [(symbol.name, symbol) for symbol in self._table._iter_all()]
+
+
 class SymbolTable:
     def __init__(self):
-        self.symbols: Dict[str, Symbol] = {}
+        # Configuraciones, variables y símbolos añadidos con add_symbol
+        self._named: Dict[str, Symbol] = {}
+        # Número de figuras que había al insertar cada uno (orden de recorrido)
+        self._named_after: Dict[str, int] = {}
+        # Figuras en columnas: grupo de la figura n en la posición n - 1 (la
+        # fila se busca en los números del grupo, que están ordenados)
+        self._groups: List[_ShapeColumns] = []
+        self._group_ids: Dict[Tuple[str, Tuple[str, ...]], int] = {}
+        self._shape_group = array('H')
+        self._hidden = set()            # figuras reemplazadas con add_symbol
+        self._numbered = set()          # nombres con forma de figura ("Line_3")
+        # Contadores incrementales
+        self._counts = {symbol_type: 0 for symbol_type in SymbolType}
+        self._kind_counts: Dict[str, int] = {}
+        self._total = 0
         self.shape_counter = 0
-    
+
+    @property
+    def symbols(self) -> SymbolsView:
+        return SymbolsView(self)
+
+    def _count(self, symbol_type: SymbolType, kind: str, delta: int):
+        self._counts[symbol_type] += delta
+        self._total += delta
+        if symbol_type is SymbolType.SHAPE:
+            self._kind_counts[kind] = self._kind_counts.get(kind, 0) + delta
+
+    def _shape_number(self, name: str) -> Optional[int]:
+        # Número de la figura en columnas que se llama name, si existe
+        kind, _, number = name.rpartition('_')
+        if not number.isdigit():
+            return None
+        number = int(number)
+        if not 1 <= number <= self.shape_counter or number in self._hidden:
+            return None
+        if self._groups[self._shape_group[number - 1]].kind != kind:
+            return None
+        return number
+
+    def _shape_position(self, number: int) -> Tuple[_ShapeColumns, int]:
+        group = self._groups[self._shape_group[number - 1]]
+        return group, bisect_left(group.numbers, number)
+
+    def _group(self, kind: str, fields: Tuple[str, ...]) -> int:
+        key = (kind, fields)
+        group_id = self._group_ids.get(key)
+        if group_id is None:
+            group_id = self._group_ids[key] = len(self._groups)
+            self._groups.append(_ShapeColumns(kind, fields))
+        return group_id
+
     def add_symbol(self, name: str, symbol_type: SymbolType, value: Any, line: int, data_type: str):
         symbol = Symbol(name, symbol_type, value, line, data_type)
-        self.symbols[name] = symbol
+        previous = self._named.get(name)
+        if previous is not None:
+            self._count(previous.type, previous.data_type, -1)
+        else:
+            number = self._shape_number(name)
+            if number is not None:
+                self._hidden.add(number)
+                self._count(SymbolType.SHAPE, self._groups[self._shape_group[number - 1]].kind, -1)
+            self._named_after[name] = self.shape_counter
+            if name.rpartition('_')[2].isdigit():
+                self._numbered.add(name)
+        self._named[name] = symbol
+        self._count(symbol_type, data_type, 1)
         return symbol
-    
+
     def get_symbol(self, name: str) -> Optional[Symbol]:
-        return self.symbols.get(name)
-    
+        symbol = self._named.get(name)
+        if symbol is not None:
+            return symbol
+        number = self._shape_number(name)
+        return None if number is None else ShapeSymbol(self, number)
+
     def exists(self, name: str) -> bool:
-        return name in self.symbols
-    
+        return name in self._named or self._shape_number(name) is not None
+
+    def update_symbol(self, name: str, value: Any):
+        """Cambia el valor de un símbolo existente. El de una figura en
+        columnas es un diccionario con sus mismos parámetros"""
+        symbol = self._named.get(name)
+        if symbol is not None:
+            symbol.value = value
+            if symbol.type is SymbolType.CONFIG:
+                symbol.data_type = type(value).__name__
+            return symbol
+        number = self._shape_number(name)
+        if number is None:
+            raise KeyError(f"Símbolo no definido: {name}")
+        group, row = self._shape_position(number)
+        if tuple(value) != group.fields:
+            raise ValueError(f"Parámetros inválidos para {name}: se esperaba {', '.join(group.fields)}")
+        for column, field_name in zip(group.columns, group.fields):
+            column[row] = value[field_name]
+        return ShapeSymbol(self, number)
+
+    def remove_symbol(self, name: str):
+        """Elimina un símbolo con nombre (configuración, variable o añadido
+        con add_symbol); las figuras en columnas se quitan con splice_shapes"""
+        symbol = self._named.pop(name, None)
+        if symbol is None:
+            raise KeyError(f"Símbolo no definido: {name}")
+        del self._named_after[name]
+        self._numbered.discard(name)
+        self._count(symbol.type, symbol.data_type, -1)
+
+    def splice_shapes(self, first_number: int, removed: int,
+                      entries: Iterable[Tuple[str, Sequence, int]], line_delta: int = 0):
+        """Sustituye las figuras [first_number, first_number + removed) por
+        entries ((tipo, valores, línea), como en add_many). Las siguientes se
+        renumeran y su línea se desplaza line_delta sin crear objetos ni
+        volver a agruparlas (shift_values): el coste sigue siendo lineal en
+        las figuras siguientes, pero con NumPy es el de copiar memoria. No
+        admite figuras reemplazadas con add_symbol"""
+        if self._hidden:
+            raise ValueError("splice_shapes no admite figuras reemplazadas con add_symbol")
+        if not 1 <= first_number <= first_number + removed <= self.shape_counter + 1:
+            raise ValueError(f"Figuras fuera de rango: {first_number}-{first_number + removed - 1}")
+        stop = first_number + removed
+        # Figuras nuevas por grupo, ya con su número
+        group_ids = array('H')
+        added: Dict[int, Tuple[List[list], array, array]] = {}
+        number = first_number
+        for kind, values, line in entries:
+            group_id = self._group(kind, SHAPE_FIELDS[kind])
+            columns, lines, numbers = added.setdefault(
+                group_id, ([[] for _ in SHAPE_FIELDS[kind]], array('L'), array('L')))
+            for column, value in zip(columns, values):
+                column.append(value)
+            lines.append(line)
+            numbers.append(number)
+            group_ids.append(group_id)
+            number += 1
+        delta = len(group_ids) - removed
+
+        for group_id, group in enumerate(self._groups):
+            low = bisect_left(group.numbers, first_number)
+            high = bisect_left(group.numbers, stop)
+            columns, lines, numbers = added.get(group_id, (None, array('L'), array('L')))
+            if high == low and not lines and (low == len(group.numbers) or not (delta or line_delta)):
+                continue
+            self._count(SymbolType.SHAPE, group.kind, len(lines) - (high - low))
+            for row, column in enumerate(group.columns):
+                column[low:high] = columns[row] if columns else ()
+            group.lines[low:high] = lines
+            group.numbers[low:high] = numbers
+            shift_values(group.lines, low + len(lines), line_delta)
+            shift_values(group.numbers, low + len(numbers), delta)
+
+        self._shape_group[first_number - 1:stop - 1] = group_ids
+        self.shape_counter += delta
+        # Los símbolos con nombre insertados entre las figuras quitadas quedan
+        # delante de las nuevas
+        for name, after in self._named_after.items():
+            if after >= first_number:
+                self._named_after[name] = after + delta if after >= stop - 1 else first_number - 1
+
+    def move_symbol(self, name: str, shapes_before: int):
+        """Coloca un símbolo con nombre en el orden de recorrido como si se
+        hubiera añadido cuando había shapes_before figuras"""
+        symbol = self._named.pop(name, None)
+        if symbol is None:
+            raise KeyError(f"Símbolo no definido: {name}")
+        items = list(self._named.items())
+        index = 0
+        while index < len(items) and self._named_after[items[index][0]] <= shapes_before:
+            index += 1
+        items.insert(index, (name, symbol))
+        self._named = dict(items)
+        self._named_after[name] = shapes_before
+
     def add_config(self, config_name: str, value: Any, line: int):
         data_type = type(value).__name__
         return self.add_symbol(config_name, SymbolType.CONFIG, value, line, data_type)
-    
+
     def add_shape(self, shape_type: str, params: Dict, line: int):
+        self._add_shape(shape_type, tuple(params), tuple(params.values()), line)
+        return ShapeSymbol(self, self.shape_counter)
+
+    def _add_shape(self, shape_type: str, fields: Tuple[str, ...], values: Sequence, line: int):
         self.shape_counter += 1
-        shape_name = f"{shape_type}_{self.shape_counter}"
-        return self.add_symbol(shape_name, SymbolType.SHAPE, params, line, shape_type)
-    
+        number = self.shape_counter
+        group_id = self._group(shape_type, fields)
+        group = self._groups[group_id]
+        if self._numbered:
+            # Un símbolo con el mismo nombre queda reemplazado
+            previous = self._named.pop(f"{shape_type}_{number}", None)
+            if previous is not None:
+                del self._named_after[previous.name]
+                self._numbered.discard(previous.name)
+                self._count(previous.type, previous.data_type, -1)
+        self._shape_group.append(group_id)
+        for column, value in zip(group.columns, values):
+            column.append(value)
+        group.lines.append(line)
+        group.numbers.append(number)
+        self._count(SymbolType.SHAPE, shape_type, 1)
+
+    def add_many(self, entries: Iterable[Tuple[str, Sequence, int]]):
+        """Inserción en bloque en el orden del programa. Cada entrada es
+        (clave, valores, línea): la clave es un tipo de SHAPE_FIELDS, con los
+        operandos en su orden, o el nombre de una configuración, con su
+        valor. No crea objetos por figura"""
+        groups = {kind: self._groups[self._group(kind, fields)] for kind, fields in SHAPE_FIELDS.items()}
+        group_ids = {kind: self._group_ids[(kind, fields)] for kind, fields in SHAPE_FIELDS.items()}
+        shape_group = self._shape_group
+        numbered = self._numbered
+        added = dict.fromkeys(groups, 0)
+        number = self.shape_counter
+        for key, values, line in entries:
+            group = groups.get(key)
+            if group is None:
+                self.shape_counter = number
+                self.add_config(key, values, line)
+                continue
+            number += 1
+            if numbered and f"{key}_{number}" in numbered:
+                self.shape_counter = number - 1
+                self._add_shape(key, group.fields, values, line)
+                continue
+            shape_group.append(group_ids[key])
+            for column, value in zip(group.columns, values):
+                column.append(value)
+            group.lines.append(line)
+            group.numbers.append(number)
+            added[key] += 1
+        self.shape_counter = number
+        for kind, count in added.items():
+            self._count(SymbolType.SHAPE, kind, count)
+
+    def _iter_all(self) -> Iterator:
+        # Símbolos con nombre intercalados con las figuras según el orden de inserción
+        named = iter(self._named.items())
+        pending = next(named, None)
+        for number in range(1, self.shape_counter + 1):
+            while pending is not None and self._named_after[pending[0]] < number:
+                yield pending[1]
+                pending = next(named, None)
+            if number not in self._hidden:
+                yield ShapeSymbol(self, number)
+        while pending is not None:
+            yield pending[1]
+            pending = next(named, None)
+
+    def iter_symbols(self, symbol_type: SymbolType) -> Iterator:
+        """Símbolos de un tipo: las figuras en columnas por número y después
+        los símbolos con nombre de ese tipo"""
+        if symbol_type is SymbolType.SHAPE:
+            hidden = self._hidden
+            yield from (ShapeSymbol(self, number) for number in range(1, self.shape_counter + 1)
+                        if number not in hidden)
+        yield from (symbol for symbol in self._named.values() if symbol.type is symbol_type)
+
+    def iter_shapes(self, kind: str) -> Iterator:
+        """Figuras de un tipo ("Line", "Circle", ...) por número, sin recorrer
+        las demás"""
+        groups = [group for group in self._groups if group.kind == kind]
+        numbers = sorted(n for group in groups for n in group.numbers) if len(groups) > 1 else \
+            (groups[0].numbers if groups else ())
+        hidden = self._hidden
+        yield from (ShapeSymbol(self, number) for number in numbers if number not in hidden)
+        yield from (symbol for symbol in self._named.values()
+                    if symbol.type is SymbolType.SHAPE and symbol.data_type == kind)
+
+    def shape_columns(self, kind: str) -> Dict[str, Sequence]:
+        """Columnas de las figuras de un tipo con los parámetros de
+        SHAPE_FIELDS (listas internas: solo lectura), más 'line' y 'number'"""
+        fields = SHAPE_FIELDS[kind]
+        group_id = self._group_ids.get((kind, fields))
+        if group_id is None:
+            return {**{name: [] for name in fields}, 'line': array('L'), 'number': array('L')}
+        group = self._groups[group_id]
+        return {**dict(zip(fields, group.columns)), 'line': group.lines, 'number': group.numbers}
+
+    def count(self, symbol_type: SymbolType) -> int:
+        return self._counts[symbol_type]
+
+    def count_shapes(self, kind: str) -> int:
+        return self._kind_counts.get(kind, 0)
+
     def print_table(self):
         print("\n" + "=" * 80)
         print("TABLA DE SÍMBOLOS".center(80))
         print("=" * 80)
         print(f"{'Nombre':<20} {'Tipo':<15} {'Tipo Dato':<15} {'Valor':<20} {'Línea':<10}")
         print("-" * 80)
-        
-        for name, symbol in self.symbols.items():
+
+        for symbol in self._iter_all():
             value_str = str(symbol.value)
             if len(value_str) > 20:
                 value_str = value_str[:17] + "..."
-            print(f"{name:<20} {symbol.type.name:<15} {symbol.data_type:<15} {value_str:<20} {symbol.line:<10}")
-        
+            print(f"{symbol.name:<20} {symbol.type.name:<15} {symbol.data_type:<15} {value_str:<20} {symbol.line:<10}")
+
         print("=" * 80)
-    
+
     def get_statistics(self):
         return {
-            'total': len(self.symbols),
-            'configs': sum(1 for s in self.symbols.values() if s.type == SymbolType.CONFIG),
-            'shapes': sum(1 for s in self.symbols.values() if s.type == SymbolType.SHAPE),
-            'variables': sum(1 for s in self.symbols.values() if s.type == SymbolType.VARIABLE)
+            'total': self._total,
+            'configs': self._counts[SymbolType.CONFIG],
+            'shapes': self._counts[SymbolType.SHAPE],
+            'variables': self._counts[SymbolType.VARIABLE]
         }
@@ -3,12 +3,46 @@ SUITE DE PRUEBAS COMPLETA
 Tests unitarios para todos los componentes del compilador
 """
 
+import os
+import json
+import errno
+import socket
+import tempfile
 import unittest
-from lexer import Lexer, TokenType
+from lexer import Lexer, TokenType, TokenBuffer, ENGINE_REGEX, ENGINE_SCANNER, iter_tokens_from_chunks
 from parser import Parser, ProgramNode, LineNode
-from symbol_table import SymbolTable, SymbolType
-from intermediate_code import IntermediateCodeGenerator
-from main import SimpleDrawCompiler
+import symbol_table
+from symbol_table import SymbolTable, SymbolType, shift_values
+import intermediate_code
+from unittest import mock
+from intermediate_code import IntermediateCodeGenerator, ColumnarIR, OPT_NONE, OPT_GLOBAL, OPT_GEOMETRY
+from intermediate_code import IntermediateInstruction, merge_lines
+import main
+from main import SimpleDrawCompiler, compile_source, compile_source_cached, compile_source_file
+from compile_cache import CompileCache
+from fast_path import compile_lines
+from validate import validate_source, validate_file
+from source_map import SourceMap
+from batch import compile_batch, expand_inputs
+from parallel import compile_parallel, split_source
+from incremental import IncrementalSession, TextEdit
+import spatial_index
+from spatial_index import SpatialIndex
+from tiles import export_tiles, parse_grid
+from svg_writer import SvgWriter, make_formatter
+from ir_format import MappedIR, write_ir
+from metrics import CompileMetrics, PHASES
+import benchmark
+import asyncio
+import threading
+from server import CompileServer, CompileClient, handle_request
+import raster
+from raster import Raster, rasterize, midpoint_extents, midpoint_reach
+import struct
+import zlib
+import gzip
+import time
+from array import array
 
 class TestLexer(unittest.TestCase):
     """Pruebas del Analizador Léxico"""
@@ -82,6 +116,76 @@ Line 10 20 30 40"""
         self.assertTrue(all(isinstance(t.value, float) for t in numbers))
 
 
+class TestLexerEngines(unittest.TestCase):
+    """Pruebas de equivalencia entre motores léxicos"""
+    
+    def assertSameTokens(self, code):
+        scanner = Lexer(code, engine=ENGINE_SCANNER).tokenize()
+        regex = Lexer(code, engine=ENGINE_REGEX).tokenize()
+        self.assertEqual(
+            [(t.type, t.value, t.line, t.column) for t in scanner],
+            [(t.type, t.value, t.line, t.column) for t in regex],
+        )
+    
+    def test_same_tokens_program(self):
+        """Test: Ambos motores generan los mismos tokens"""
+        self.assertSameTokens("# Casa\nPaper 150\nPen 2\n\tRect 30 60 90 60  # base\nLine 1.5 2 3 4\n")
+    
+    def test_same_tokens_unknown_and_strings(self):
+        """Test: Caracteres desconocidos y cadenas multilínea"""
+        self.assertSameTokens("Pen @ 5 $\n'abc\ndef' Circle \"sin cerrar\nx_1")
+    
+    def test_same_tokens_unicode(self):
+        """Test: Identificadores y dígitos no ASCII"""
+        self.assertSameTokens("Líneá 12\u0663 é_1 \u00bd \xa0 Rect")
+    
+    def test_invalid_engine(self):
+        """Test: Motor desconocido"""
+        with self.assertRaises(ValueError):
+            Lexer("Paper 100", engine="turbo")
+
+
+class TestTokenBuffer(unittest.TestCase):
+    """Pruebas del almacenamiento compacto de tokens"""
+    
+    CODE = "Paper 100\nLine 1.5 2 3 4 # c\n@ 'txt' 99999999999999999999\n"
+    
+    def test_token_has_slots(self):
+        """Test: Token no tiene __dict__"""
+        token = Lexer("Pen 5").tokenize()[0]
+        self.assertFalse(hasattr(token, '__dict__'))
+    
+    def test_buffer_roundtrip(self):
+        """Test: El buffer reproduce los mismos tokens"""
+        tokens = Lexer(self.CODE).tokenize()
+        buffer = Lexer(self.CODE).tokenize_buffer()
+        
+        self.assertEqual(len(buffer), len(tokens))
+        self.assertEqual(list(buffer), tokens)
+        self.assertEqual(buffer[-1].type, TokenType.EOF)
+        self.assertIsInstance(buffer.value_at(4), float)
+    
+    def test_buffer_interns_strings(self):
+        """Test: Las cadenas repetidas se guardan una sola vez"""
+        buffer = TokenBuffer.from_tokens(Lexer("Line Line Line").tokenize())
+        self.assertEqual(buffer.strings.count("Line"), 1)
+    
+    def test_parser_consumes_buffer(self):
+        """Test: El parser acepta un TokenBuffer"""
+        code = "Paper 100\nPen 2\nLine 1 2 3 4\nCircle 5 5 2.5\nRect 1 1 2 2"
+        expected = Parser(Lexer(code).tokenize()).parse()
+        self.assertEqual(Parser(Lexer(code).tokenize_buffer()).parse(), expected)
+    
+    def test_parser_buffer_errors(self):
+        """Test: Mismos errores de sintaxis con TokenBuffer"""
+        for code in ("Paper", "Line 1 2\n3 4", "Circle 1 @ 2", "Pen 5 7"):
+            with self.assertRaises(SyntaxError) as expected:
+                Parser(Lexer(code).tokenize()).parse()
+            with self.assertRaises(SyntaxError) as buffered:
+                Parser(Lexer(code).tokenize_buffer()).parse()
+            self.assertEqual(str(buffered.exception), str(expected.exception))
+
+
 class TestParser(unittest.TestCase):
     """Pruebas del Analizador Sintáctico"""
     
@@ -132,6 +236,32 @@ Line 10 20 30 40"""
         
         with self.assertRaises(SyntaxError):
             parser.parse()
+    
+    def test_nodes_have_slots(self):
+        """Test: Los nodos del AST no tienen __dict__"""
+        ast = Parser(Lexer("Paper 100\nLine 1 2 3 4.5").tokenize()).parse()
+        for node in [ast] + ast.statements:
+            self.assertFalse(hasattr(node, '__dict__'))
+        self.assertEqual(ast.statements[1], LineNode(1, 2, 3, 4.5))
+    
+    def test_token_sources_agree(self):
+        """Test: Lista, TokenBuffer e iterador dan el mismo AST y los mismos errores"""
+        programs = [
+            "Paper 100.7\nPen 2\n\nLine 1 2 3 4.5\nCircle 5 5 2\nRect 1 1 2 2\n" + "Line 9007199254740993 0 1 1\n",
+            "Paper 100\nLine 1 2 3\n",
+            "Line 1 2 3",
+            "Paper 100\nCircle 1 2 'x'\n",
+            "Paper 100\n50 Line\n",
+        ]
+        for code in programs:
+            outcomes = []
+            for source in (Lexer(code).tokenize(), Lexer(code).tokenize_buffer(), iter(Lexer(code).tokenize())):
+                try:
+                    outcomes.append(Parser(source).parse())
+                except SyntaxError as e:
+                    outcomes.append(str(e))
+            self.assertEqual(outcomes[0], outcomes[1], code)
+            self.assertEqual(outcomes[0], outcomes[2], code)
 
 
 class TestSymbolTable(unittest.TestCase):
@@ -175,6 +305,45 @@ class TestSymbolTable(unittest.TestCase):
         self.assertEqual(stats['configs'], 2)
         self.assertEqual(stats['shapes'], 1)
         self.assertEqual(stats['total'], 3)
+    
+    def test_shape_columns(self):
+        """Test: Figuras en columnas con índices por tipo"""
+        self.symbol_table.add_many([
+            ("paper_size", 100, 1),
+            ("Line", (1, 2, 3, 4), 2),
+            ("Circle", (5, 5, 2.5), 3),
+            ("Line", (6, 7, 8, 9), 4),
+            ("pen_width", 3, 5),
+        ])
+        
+        self.assertEqual(list(self.symbol_table.symbols),
+                         ["paper_size", "Line_1", "Circle_2", "Line_3", "pen_width"])
+        circle = self.symbol_table.get_symbol("Circle_2")
+        self.assertEqual(circle.value, {"x": 5, "y": 5, "radius": 2.5})
+        self.assertEqual((circle.type, circle.line, circle.data_type), (SymbolType.SHAPE, 3, "Circle"))
+        self.assertFalse(self.symbol_table.exists("Line_2"))
+        
+        self.assertEqual([s.name for s in self.symbol_table.iter_shapes("Line")], ["Line_1", "Line_3"])
+        self.assertEqual(len(list(self.symbol_table.iter_symbols(SymbolType.CONFIG))), 2)
+        self.assertEqual(self.symbol_table.count_shapes("Line"), 2)
+        self.assertEqual(self.symbol_table.shape_columns("Line")["x2"], [3, 8])
+        self.assertEqual(self.symbol_table.get_statistics(),
+                         {'total': 5, 'configs': 2, 'shapes': 3, 'variables': 0})
+    
+    def test_update_shape(self):
+        """Test: Actualizar una figura y reemplazarla por nombre"""
+        self.symbol_table.add_shape("Rect", {"x": 1, "y": 1, "width": 2, "height": 2}, 1)
+        self.symbol_table.update_symbol("Rect_1", {"x": 0, "y": 0, "width": 5, "height": 5})
+        self.assertEqual(self.symbol_table.get_symbol("Rect_1").value["width"], 5)
+        with self.assertRaises(ValueError):
+            self.symbol_table.update_symbol("Rect_1", {"x": 0})
+        with self.assertRaises(KeyError):
+            self.symbol_table.update_symbol("Rect_2", {})
+        
+        self.symbol_table.add_symbol("Rect_1", SymbolType.VARIABLE, 7, 2, "int")
+        stats = self.symbol_table.get_statistics()
+        self.assertEqual((stats['shapes'], stats['variables'], stats['total']), (0, 1, 1))
+        self.assertEqual(self.symbol_table.get_symbol("Rect_1").value, 7)
 
 
 class TestIntermediateCode(unittest.TestCase):
@@ -230,6 +399,129 @@ Line 10 20 30 40"""
         self.assertLess(len(code_gen.instructions), initial_count)
 
 
+class TestGlobalOptimization(unittest.TestCase):
+    """Pruebas de la optimización global (nivel 2)"""
+    
+    CODE = """Paper 100
+Pen 2
+Line 10 20 30 40
+Circle 50 50 10
+Pen 2
+Line 30 40 10 20.0
+Pen 3
+Pen 4
+Circle 50 50 10
+Paper 150
+Pen 2
+Circle 50 50 10
+Pen 7"""
+    
+    def generate(self, generator_class=IntermediateCodeGenerator):
+        generator = generator_class()
+        generator.generate_from_ast(Parser(Lexer(self.CODE).tokenize()).parse())
+        return generator
+    
+    def test_global_dedup(self):
+        """Test: Elimina figuras repetidas con el mismo lápiz"""
+        generator = self.generate()
+        removed = generator.optimize(OPT_GLOBAL)
+        
+        self.assertEqual([repr(i) for i in generator.instructions],
+                         ['PEN 2', 'LINE 10, 20, 30, 40', 'CIRCLE 50, 50, 10',
+                          'PEN 4', 'CIRCLE 50, 50, 10', 'PAPER 150', 'PEN 7'])
+        self.assertEqual(removed, 6)
+    
+    def test_global_dedup_columnar(self):
+        """Test: Mismo resultado con el backend columnar"""
+        listed = self.generate()
+        columnar = self.generate(ColumnarIR)
+        
+        self.assertEqual(columnar.optimize(OPT_GLOBAL), listed.optimize(OPT_GLOBAL))
+        self.assertEqual(list(columnar), listed.instructions)
+    
+    def test_no_optimization(self):
+        """Test: El nivel 0 no elimina nada"""
+        generator = self.generate()
+        self.assertEqual(generator.optimize(OPT_NONE), 0)
+    
+    def test_compile_opt_level(self):
+        """Test: El SVG conserva la configuración final"""
+        result = compile_source(self.CODE, opt_level=OPT_GLOBAL)
+        
+        self.assertEqual(result.svg.count('<circle'), 2)
+        self.assertIn('width="150"', result.svg)
+        self.assertIn('stroke-width="7"', result.svg)
+
+
+class TestColumnarIR(unittest.TestCase):
+    """Pruebas del código intermedio columnar"""
+    
+    CODE = """Paper 100
+Pen 2
+Line 10 20 30 40
+Line 10.0 20 30 40
+Circle 50 50 12.5
+Rect 1 2 3 4"""
+    
+    def build(self):
+        ast = Parser(Lexer(self.CODE).tokenize()).parse()
+        listed = IntermediateCodeGenerator()
+        listed.generate_from_ast(ast)
+        columnar = ColumnarIR()
+        columnar.generate_from_ast(ast)
+        return listed, columnar
+    
+    def test_same_instructions(self):
+        """Test: Mismas instrucciones que el generador de listas"""
+        listed, columnar = self.build()
+        
+        self.assertEqual(len(columnar), 6)
+        self.assertEqual(list(columnar), listed.instructions)
+        self.assertEqual(columnar.to_json(), listed.to_json())
+        self.assertIsInstance(columnar[2].arg1, int)
+        self.assertIsInstance(columnar[3].arg1, float)
+    
+    def test_optimize(self):
+        """Test: Optimización equivalente, con y sin NumPy"""
+        for numpy_module in (intermediate_code.np, None):
+            with mock.patch.object(intermediate_code, 'np', numpy_module):
+                listed, columnar = self.build()
+                self.assertEqual(columnar.optimize(), listed.optimize())
+                self.assertEqual(list(columnar), listed.instructions)
+    
+    def test_transform(self):
+        """Test: Transformación en bloque, con y sin NumPy"""
+        results = []
+        for numpy_module in (intermediate_code.np, None):
+            with mock.patch.object(intermediate_code, 'np', numpy_module):
+                _, columnar = self.build()
+                columnar.transform(scale=2, dx=1, dy=0.5)
+                results.append(list(columnar.rows()))
+        
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0][2], ('LINE', 21, 40.5, 61, 80.5))
+        self.assertEqual(results[0][4], ('CIRCLE', 101, 100.5, 25.0, None))
+    
+    def test_compile_columnar_svg(self):
+        """Test: El SVG no cambia con el backend columnar"""
+        self.assertEqual(compile_source(self.CODE, columnar=True).svg, compile_source(self.CODE).svg)
+    
+    def test_rejects_inexact_ints(self):
+        """Test: Los enteros que float64 redondearía se rechazan, no se redondean"""
+        big = 2 ** 53
+        ir = ColumnarIR()
+        ir.emit('LINE', 0, 0, big, -big)
+        self.assertEqual(ir[0].arg3, big)
+        with self.assertRaises(ValueError):
+            ir.emit('LINE', 0, 0, big + 1, 1)
+        self.assertEqual(len(ir), 1)
+        code = f"Paper 100\nLine 0 0 {big + 1} 1"
+        result = compile_source(code, columnar=True)
+        self.assertFalse(result.success)
+        self.assertIn(str(big + 1), result.errors[0])
+        self.assertEqual(compile_source(code).instructions[1].arg3, big + 1)
+
+
 class TestCompiler(unittest.TestCase):
     """Pruebas del Compilador Completo"""
     
@@ -283,6 +575,1315 @@ Line 10 10 90 90"""
             self.assertIn('<line', svg)
 
 
+class TestCompileAPI(unittest.TestCase):
+    """Pruebas de la API de compilación silenciosa"""
+    
+    CODE = """Paper 100
+Pen 3
+Line 10 10 90 90
+Circle 50 50 20"""
+    
+    def test_compile_source_result(self):
+        """Test: compile_source devuelve IR y SVG sin tokens"""
+        result = compile_source(self.CODE)
+        
+        self.assertTrue(result.success)
+        self.assertEqual(len(result.instructions), 4)
+        self.assertIn('<circle', result.svg)
+        self.assertIsNone(result.tokens)
+        self.assertEqual(result.diagnostics, [])
+    
+    def test_compile_source_keep_tokens(self):
+        """Test: Tokens opcionales"""
+        result = compile_source(self.CODE, keep_tokens=True, emit_svg=False)
+        
+        self.assertEqual(result.tokens[-1].type, TokenType.EOF)
+        self.assertIsNone(result.svg)
+    
+    def test_compile_source_errors(self):
+        """Test: Los errores se devuelven como diagnósticos"""
+        result = compile_source("Paper")
+        
+        self.assertFalse(result.success)
+        self.assertEqual(len(result.diagnostics), 1)
+        self.assertIn("NUMBER", result.diagnostics[0])
+    
+    def test_compile_source_trace(self):
+        """Test: El trazado informa de cada fase"""
+        phases = []
+        compile_source(self.CODE, trace=lambda phase, data: phases.append(phase))
+        
+        self.assertEqual(phases, ['lex', 'parse', 'symbols', 'ir', 'optimize', 'emit'])
+    
+    def test_compile_source_is_silent(self):
+        """Test: No escribe en consola por defecto"""
+        import io
+        import contextlib
+        
+        buffer = io.StringIO()
+        with contextlib.redirect_stdout(buffer):
+            compile_source(self.CODE)
+            compile_source("Paper")
+        self.assertEqual(buffer.getvalue(), "")
+
+
+class TestFastPath(unittest.TestCase):
+    """Pruebas del camino rápido por líneas"""
+    
+    def compile_both(self, code):
+        results = []
+        for fast in (True, False):
+            compiler = SimpleDrawCompiler()
+            success = compiler.compile(code, verbose=False, keep_tokens=False, fast_path=fast)
+            results.append((success, compiler.errors, repr(compiler.code_generator.instructions),
+                            compiler.build_svg() if success else None,
+                            compiler.symbol_table.get_statistics()))
+        return results
+    
+    def test_same_result_as_full_path(self):
+        """Test: Mismo IR, SVG y símbolos que lexer + parser"""
+        code = ("# Dibujo\r\nPaper 120.7\r\nPen 2\n\n  Line 1 2 3.50 4  # comentario\n"
+                "Circle 5 5 2\tRect 1 1 2 2\nLine 9007199254740993 0 1. 1\n# Círculo\nRect 0 0 1 1")
+        fast, full = self.compile_both(code)
+        self.assertTrue(fast[0])
+        self.assertEqual(fast, full)
+        instructions = compile_lines(code)
+        self.assertEqual([i.op for i in instructions], ['PAPER', 'PEN', 'LINE', 'CIRCLE', 'RECT', 'LINE', 'RECT'])
+        self.assertEqual(instructions[0].arg1, 120)
+        self.assertIsInstance(instructions[2].arg3, float)
+    
+    def test_same_diagnostics(self):
+        """Test: Los errores salen del camino completo"""
+        for code in ["Paper 100\nLine 1 2 3\n", "Paper\nLine 1.2.3 0 0 0\n", "Paper 100 'x\nLine 1 2 3 4\n",
+                     "Line 1 2 3 -4\n", "Pen\u00a02\n", "Line 1 2 3 4\n\u00a0\n", "Line 1 2 3 4\x0c\n"]:
+            fast, full = self.compile_both(code)
+            self.assertFalse(fast[0], code)
+            self.assertEqual(fast, full, code)
+            self.assertIsNone(compile_lines(code), code)
+    
+    def test_compile_source_skips_tokens_and_ast(self):
+        """Test: compile_source usa el camino rápido; keep_tokens no"""
+        compiler = SimpleDrawCompiler()
+        self.assertTrue(compiler.compile("Paper 100\nLine 1 2 3 4", verbose=False, keep_tokens=False))
+        self.assertIsNone(compiler.ast)
+        compiler = SimpleDrawCompiler()
+        self.assertTrue(compiler.compile("Paper 100\nLine 1 2 3 4", verbose=False))
+        self.assertIsNotNone(compiler.ast)
+
+
+class TestValidate(unittest.TestCase):
+    """Pruebas del modo de solo validación"""
+    
+    BAD = "Paper 100\nLine 1 2 3\nCircle 1 2 x\nRect 1.2.3 0 0 0\n\"abc\ndef\" Pen 2\nPen 3 Paper 2\nLine 1 2 3"
+    
+    def test_valid_program(self):
+        """Test: Un programa correcto no tiene errores"""
+        code = "# Casa\nPaper 100\r\nPen 2\n\nLine 1 2 3.5 4  # techo\nCircle 5 5 2 Rect 1 1 2 2\n"
+        result = validate_source(code)
+        self.assertTrue(result.valid)
+        self.assertEqual(result.statements, 5)
+        self.assertEqual(result.lines, 6)
+    
+    def test_collects_all_errors(self):
+        """Test: Todos los errores con línea, columna y el mensaje del compilador"""
+        result = validate_source(self.BAD)
+        self.assertFalse(result.valid)
+        self.assertEqual([(e.line, e.column) for e in result.errors], [(2, 11), (3, 12), (4, 6), (5, 1), (8, 11)])
+        self.assertEqual(result.statements, 3)
+        self.assertEqual(result.lines, 8)
+        self.assertIn("UNKNOWN en línea 3", result.errors[1].message)
+        self.assertIn("1.2.3", result.errors[2].message)
+        self.assertEqual(result.errors[3].message, "Declaración inesperada: STRING")
+        self.assertIn("EOF en línea 8", result.errors[4].message)
+        self.assertEqual(compile_source("Paper 100\nLine 1 2 3\n").errors, ["Error: " + result.errors[0].message])
+    
+    def test_max_errors_and_file(self):
+        """Test: Se detiene en el límite de errores; el archivo se lee por líneas"""
+        result = validate_source(self.BAD, max_errors=2)
+        self.assertEqual(len(result.errors), 2)
+        self.assertTrue(result.truncated)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "malo.sd")
+            with open(path, "w") as f:
+                f.write(self.BAD)
+            self.assertEqual(validate_file(path), validate_source(self.BAD))
+    
+    def test_agrees_with_compiler(self):
+        """Test: Válido si y solo si compila"""
+        for code in ["Paper 100", "Paper", "Line 1 2 3 4 5", "Line 1 2 3 -4", "Pen\u00a02", "Pen 2\x0c",
+                     "Rect 1. 2 3 4", "Circle .5 1 1", "Line 1 2 3 4 # 'x", "Circle 1 1 1 '#'"]:
+            self.assertEqual(validate_source(code).valid, compile_source(code).success, code)
+
+
+class TestSourceMap(unittest.TestCase):
+    """Pruebas del mapa de fuentes"""
+    
+    CODE = ("# Dibujo\nPaper 100\n\n  Line 10 10 90 90  # diagonal\n"
+            "Circle 50 50 20\tRect 5 5 10 10\nLine 10 10 90 90\nRect 500 500 10 10")
+    
+    def test_spans_and_lookups(self):
+        """Test: Posición exacta de cada elemento y elementos de cada línea"""
+        result = compile_source(self.CODE, opt_level=OPT_NONE, source_map=True)
+        source_map = result.source_map
+        texts = [self.CODE[span.start:span.end] for span in map(source_map.element_span, range(5))]
+        self.assertEqual(texts, ["Line 10 10 90 90", "Circle 50 50 20", "Rect 5 5 10 10",
+                                 "Line 10 10 90 90", "Rect 500 500 10 10"])
+        span = source_map.element_span(2)
+        self.assertEqual((span.line, span.column), (5, 17))
+        self.assertEqual(source_map.element_line(0), 4)
+        self.assertEqual(source_map.line_elements(5), [1, 2])
+        self.assertEqual(source_map.line_elements(1), [])
+        self.assertEqual(source_map.line_elements(99), [])
+        self.assertEqual(source_map.instruction_span(0).line, 2)
+        self.assertEqual(source_map.line_instructions(2), [0])
+    
+    def test_optimization_culling_and_export(self):
+        """Test: Declaraciones eliminadas, recorte y archivo .map"""
+        result = compile_source(self.CODE, opt_level=OPT_GLOBAL, cull=True, source_map=True)
+        source_map = result.source_map
+        self.assertEqual(len(source_map.elements), result.svg.count('/>') - 1)
+        self.assertEqual(source_map.line_elements(6), [])   # línea repetida
+        self.assertEqual(source_map.line_elements(7), [])   # fuera del lienzo
+        self.assertEqual([source_map.element_line(e) for e in range(3)], [4, 5, 5])
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "out.svg.map")
+            source_map.write(path, "out.svg")
+            loaded = SourceMap.load(path)
+        self.assertEqual(loaded.to_dict(), source_map.to_dict())
+        self.assertEqual(loaded.line_elements(5), [1, 2])
+        
+        compiler = SimpleDrawCompiler()
+        self.assertFalse(compiler.compile(self.CODE, verbose=False, opt_level=OPT_GEOMETRY, source_map=True))
+        with self.assertRaises(ValueError):
+            compile_source(self.CODE, opt_level=OPT_GEOMETRY, source_map=True)
+    
+    def test_symbol_lines(self):
+        """Test: Los símbolos guardan su línea real en todos los caminos"""
+        expected = [("paper_size", 2), ("Line_1", 4), ("Circle_2", 5), ("Rect_3", 5),
+                    ("Line_4", 6), ("Rect_5", 7)]
+        for keep_tokens in (False, True):
+            result = compile_source(self.CODE, keep_tokens=keep_tokens)
+            self.assertEqual([(s.name, s.line) for s in result.symbols.symbols.values()], expected)
+        session = IncrementalSession(self.CODE)
+        session.apply_edit(TextEdit(1, 1, 1, 1, "\n"))
+        self.assertEqual([(s.name, s.line) for s in session.symbol_table.symbols.values()],
+                         [(name, line + 1) for name, line in expected])
+
+
+class TestCompileCache(unittest.TestCase):
+    """Pruebas de la caché de compilación en disco"""
+    
+    CODE = "Paper 100\nPen 2\nLine 10 20 30 40.5\nCircle 50 50 10"
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = CompileCache(self.tmp.name)
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def test_hit_skips_compilation(self):
+        """Test: La segunda compilación sale de la caché"""
+        first = compile_source_cached(self.CODE, self.cache)
+        second = compile_source_cached(self.CODE, self.cache)
+        
+        self.assertFalse(first.cached)
+        self.assertTrue(second.cached)
+        self.assertEqual(second.svg, first.svg)
+        self.assertEqual(second.instructions, first.instructions)
+        self.assertIsInstance(second.instructions[2].result, float)
+        self.assertEqual((self.cache.stats.hits, self.cache.stats.misses), (1, 1))
+    
+    def test_key_includes_options(self):
+        """Test: Otras opciones no reutilizan la entrada"""
+        compile_source_cached(self.CODE, self.cache)
+        result = compile_source_cached(self.CODE, self.cache, opt_level=OPT_GLOBAL)
+        
+        self.assertFalse(result.cached)
+        self.assertEqual(self.cache.stats.entries, 2)
+    
+    def test_key_includes_compiler_code(self):
+        """Test: Un cambio en el código del compilador invalida las entradas"""
+        compile_source_cached(self.CODE, self.cache)
+        self.assertTrue(main.compiler_version().startswith(main.__version__ + "+"))
+        main.compiler_version.cache_clear()
+        try:
+            with mock.patch('main.code_fingerprint', return_value="otro"):
+                result = compile_source_cached(self.CODE, self.cache)
+        finally:
+            main.compiler_version.cache_clear()
+        
+        self.assertFalse(result.cached)
+    
+    def test_errors_are_cached(self):
+        """Test: Los diagnósticos también se guardan"""
+        compile_source_cached("Paper", self.cache)
+        result = compile_source_cached("Paper", self.cache)
+        
+        self.assertTrue(result.cached)
+        self.assertFalse(result.success)
+        self.assertEqual(len(result.errors), 1)
+    
+    def test_lru_eviction(self):
+        """Test: Se expulsa la entrada usada hace más tiempo"""
+        self.cache.put("a", {"data": "x" * 100})
+        self.cache.put("b", {"data": "x" * 100})
+        self.cache.get("a")
+        self.cache.max_bytes = 250
+        self.cache.put("c", {"data": "x" * 100})
+        
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.stats.evictions, 1)
+    
+    def test_stats_persist(self):
+        """Test: Las estadísticas se acumulan entre sesiones"""
+        compile_source_cached(self.CODE, self.cache)
+        self.cache.save_stats()
+        reopened = CompileCache(self.tmp.name)
+        compile_source_cached(self.CODE, reopened)
+        totals = reopened.save_stats()
+        
+        self.assertEqual((totals.hits, totals.misses, totals.entries), (1, 1, 1))
+
+
+class TestBatch(unittest.TestCase):
+    """Pruebas de la compilación por lotes"""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.tmp.name, "src")
+        os.makedirs(os.path.join(self.src, "sub"))
+        files = {
+            "a.sd": "Paper 100\nLine 1 2 3 4",
+            "b.sd": "Paper",
+            os.path.join("sub", "a.sd"): "Circle 5 5 2",
+            "notes.txt": "no es fuente",
+        }
+        for name, code in files.items():
+            with open(os.path.join(self.src, name), "w") as f:
+                f.write(code)
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def test_expand_inputs(self):
+        """Test: Directorios y globs se expanden a archivos .sd"""
+        from_dir = expand_inputs([self.src])
+        from_glob = expand_inputs([os.path.join(self.src, "*.sd")])
+        
+        self.assertEqual([os.path.basename(p) for p in from_dir], ["a.sd", "b.sd", "a.sd"])
+        self.assertEqual(len(from_glob), 2)
+    
+    def test_compile_batch(self):
+        """Test: Cada archivo tiene su resultado, con uno o varios procesos"""
+        for workers in (1, 2):
+            out_dir = os.path.join(self.tmp.name, f"out{workers}")
+            summary = compile_batch([self.src], output_dir=out_dir, workers=workers)
+            
+            self.assertEqual(len(summary.results), 3)
+            self.assertEqual(len(summary.succeeded), 2)
+            self.assertEqual([os.path.basename(r.path) for r in summary.failed], ["b.sd"])
+            self.assertIn("NUMBER", summary.failed[0].errors[0])
+            self.assertTrue(os.path.exists(os.path.join(out_dir, "sub", "a_output.svg")))
+            self.assertTrue(os.path.exists(os.path.join(out_dir, "a_intermediate.json")))
+            self.assertIn("Con errores: 1", summary.report())
+    
+    def test_cache_size_stats_and_exit_status(self):
+        """Test: El lote respeta --cache-size, guarda las estadísticas y falla si falla un archivo"""
+        import io
+        import contextlib
+        
+        cache_dir = os.path.join(self.tmp.name, "cache")
+        out_dir = os.path.join(self.tmp.name, "out")
+        compile_batch([self.src], output_dir=out_dir, workers=1, cache_dir=cache_dir, cache_size=1)
+        self.assertEqual(CompileCache(cache_dir).stats.entries, 0)
+        
+        compile_batch([self.src], output_dir=out_dir, workers=2, cache_dir=cache_dir)
+        summary = compile_batch([self.src], output_dir=out_dir, workers=2, cache_dir=cache_dir)
+        self.assertEqual((summary.cache_stats.hits, summary.cache_stats.misses), (3, 6))
+        self.assertEqual(CompileCache(cache_dir).load_totals().hits, 3)
+        
+        buffer = io.StringIO()
+        with contextlib.redirect_stdout(buffer):
+            status = main.main([self.src, "--out-dir", out_dir, "--cache", cache_dir, "--cache-stats"])
+            ok = main.main([os.path.join(self.src, "a.sd"), "--batch", "--out-dir", out_dir])
+        self.assertEqual((status, ok), (1, 0))
+        self.assertIn("6 aciertos", buffer.getvalue())
+    
+    def test_cache_size_with_workers(self):
+        """Test: El límite de la caché se respeta con varios procesos"""
+        many = os.path.join(self.tmp.name, "many")
+        os.makedirs(many)
+        for index in range(40):
+            with open(os.path.join(many, f"f{index}.sd"), "w") as f:
+                f.write("Paper 100\n" + "".join(f"Line {index} {k} 2 3\n" for k in range(20)))
+        cache_dir = os.path.join(self.tmp.name, "cache")
+        summary = compile_batch([many], output_dir=os.path.join(self.tmp.name, "out"), workers=4,
+                                cache_dir=cache_dir, cache_size=20000)
+        on_disk = sum(os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir)
+                      if name.endswith(".entry.json"))
+        self.assertLessEqual(on_disk, 20000)
+        self.assertEqual(summary.cache_stats.size_bytes, on_disk)
+        self.assertGreater(summary.cache_stats.evictions, 0)
+    
+    def test_missing_file(self):
+        """Test: Un archivo inexistente no detiene el lote"""
+        summary = compile_batch([os.path.join(self.src, "a.sd"), os.path.join(self.src, "x.sd")],
+                                output_dir=os.path.join(self.tmp.name, "out"), workers=1)
+        self.assertEqual((len(summary.succeeded), len(summary.failed)), (1, 1))
+
+
+class TestParallel(unittest.TestCase):
+    """Pruebas de la compilación por fragmentos de un solo archivo"""
+    
+    CODE = "# Rejilla\nPaper 100\nPen 1\n" + "".join(
+        f"Line {i} 0 {i} 100\nLine {i} 0 {i} 100\nCircle {i} {i} 2.5\n" for i in range(40))
+    
+    def test_split_source(self):
+        """Test: Los fragmentos terminan en salto de línea y cuentan líneas"""
+        chunks = split_source(self.CODE, 50)
+        
+        self.assertEqual("".join(text for text, _ in chunks), self.CODE)
+        self.assertTrue(all(text.endswith("\n") for text, _ in chunks))
+        for (text, line), (_, next_line) in zip(chunks, chunks[1:]):
+            self.assertEqual(next_line, line + text.count("\n"))
+    
+    def test_same_result_as_serial(self):
+        """Test: Mismo IR, SVG y tabla de símbolos que en serie"""
+        expected = compile_source(self.CODE)
+        for workers in (1, 2):
+            result = compile_parallel(self.CODE, workers=workers, chunk_chars=64)
+            
+            self.assertEqual(result.instructions, expected.instructions)
+            self.assertEqual(result.svg, expected.svg)
+            self.assertEqual(
+                [(s.name, s.line, s.value) for s in result.symbols.symbols.values()],
+                [(s.name, s.line, s.value) for s in expected.symbols.symbols.values()])
+    
+    def test_same_error_as_serial(self):
+        """Test: El primer error es el mismo, con la línea del archivo completo"""
+        code = self.CODE + "Line 1 2\n" + self.CODE + "Rect 1\n"
+        expected = compile_source(code)
+        result = compile_parallel(code, workers=1, chunk_chars=64)
+        
+        self.assertFalse(result.success)
+        self.assertEqual(result.errors, expected.errors)
+        self.assertIn("línea 124", result.errors[0])
+    
+    def test_lexical_error_after_syntax_error(self):
+        """Test: Un error léxico en un fragmento posterior gana, como en serie"""
+        code = "Paper 100\nLine 1 2\n" + self.CODE + "Line 1.2.3 0 0 0\n"
+        expected = compile_source(code)
+        self.assertIn("1.2.3", expected.errors[0])
+        for workers in (1, 2):
+            result = compile_parallel(code, workers=workers, chunk_chars=64)
+            self.assertFalse(result.success)
+            self.assertEqual(result.errors, expected.errors)
+
+
+class TestStreaming(unittest.TestCase):
+    """Pruebas del modo de compilación en streaming"""
+    
+    CODE = """# Triángulo
+Paper 100
+Pen 3
+Line 50 10 10 90
+Line 10 90 90 90
+Line 10 90 90 90
+Circle 50 50 12.5
+"""
+    
+    def test_chunked_tokens_match(self):
+        """Test: Tokenizar por fragmentos equivale a tokenizar todo"""
+        expected = [(t.type, t.value, t.line, t.column) for t in Lexer(self.CODE).tokenize()]
+        chunks = [self.CODE[i:i + 3] for i in range(0, len(self.CODE), 3)]
+        streamed = [(t.type, t.value, t.line, t.column) for t in iter_tokens_from_chunks(chunks)]
+        self.assertEqual(streamed, expected)
+    
+    def test_long_token_in_many_chunks(self):
+        """Test: Un token partido en muchos fragmentos no se vuelve a analizar en cada uno"""
+        code = 'Paper 100\n"' + "x" * 5000 + '"\nLine 1 2 3 4\n'
+        expected = [(t.type, t.value, t.line, t.column) for t in Lexer(code).tokenize()]
+        scan = Lexer._scan_regex
+        with mock.patch.object(Lexer, "_scan_regex", autospec=True, side_effect=scan) as scans:
+            streamed = [(t.type, t.value, t.line, t.column) for t in iter_tokens_from_chunks(code)]
+        self.assertEqual(streamed, expected)
+        self.assertLess(scans.call_count, 100)
+    
+    def test_parser_accepts_iterator(self):
+        """Test: El parser consume un iterador de tokens"""
+        expected = Parser(Lexer(self.CODE).tokenize()).parse()
+        streamed = list(Parser(Lexer(self.CODE).iter_tokens()).iter_statements())
+        self.assertEqual(streamed, expected.statements)
+    
+    def test_compile_stream_svg(self):
+        """Test: El SVG en streaming contiene lo mismo que el normal"""
+        compiler = SimpleDrawCompiler()
+        compiler.compile(self.CODE)
+        with tempfile.TemporaryDirectory() as tmp:
+            expected = compiler.generate_svg(os.path.join(tmp, "a.svg"))
+            output = os.path.join(tmp, "b.svg")
+            streaming = SimpleDrawCompiler()
+            self.assertTrue(streaming.compile_stream(self.CODE.splitlines(True), output))
+            with open(output) as f:
+                streamed = f.read()
+        self.assertEqual(" ".join(streamed.split()), " ".join(expected.split()).replace(
+            'stroke="black" stroke-width="3"', 'stroke-width="3" stroke="black"'))
+        self.assertEqual(streaming.stream_stats['elements'], 3)
+    
+    def test_compile_stream_error_removes_output(self):
+        """Test: Un error de sintaxis no deja un SVG a medias"""
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "out.svg")
+            compiler = SimpleDrawCompiler()
+            self.assertFalse(compiler.compile_stream(["Paper 100\n", "Line 1 2\n"], output))
+            self.assertFalse(os.path.exists(output))
+            self.assertEqual(len(compiler.errors), 1)
+
+
+class TestMappedLexer(unittest.TestCase):
+    """Pruebas del lexer sobre bytes / mmap"""
+    
+    CODE = ("# Diseño\r\nPaper 100\r\nPen 3 # ñandú\n"
+            "Line 1 2 3 4 'a\r\nb' Líneá 12.5\rCírculo ½ @\n")
+    
+    def tokens(self, lexer):
+        return [(t.type, t.value, t.line, t.column) for t in lexer.tokenize()]
+    
+    def test_bytes_match_text(self):
+        """Test: Los bytes UTF-8 dan los mismos tokens que el texto"""
+        text = self.CODE.replace('\r\n', '\n').replace('\r', '\n')
+        self.assertEqual(self.tokens(Lexer(self.CODE.encode('utf-8'))), self.tokens(Lexer(text)))
+    
+    def test_from_file(self):
+        """Test: Lexer.from_file equivale a leer el archivo en modo texto"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.sd")
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                f.write(self.CODE)
+            with open(path, encoding="utf-8") as f:
+                expected = self.tokens(Lexer(f.read()))
+            with Lexer.from_file(path) as lexer:
+                self.assertEqual(self.tokens(lexer), expected)
+    
+    def test_empty_file(self):
+        """Test: Un archivo vacío solo produce EOF"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "vacio.sd")
+            open(path, "w").close()
+            with Lexer.from_file(path) as lexer:
+                tokens = lexer.tokenize()
+        self.assertEqual([t.type for t in tokens], [TokenType.EOF])
+    
+    def test_compile_source_file(self):
+        """Test: compile_source_file da el mismo resultado que compile_source"""
+        code = "Paper 100\nPen 3\nLine 50 10 10 90\nCircle 50 50 12.5\n"
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.sd")
+            with open(path, "w") as f:
+                f.write(code)
+            result = compile_source_file(path)
+        expected = compile_source(code)
+        self.assertTrue(result.success)
+        self.assertEqual(result.instructions, expected.instructions)
+        self.assertEqual(result.svg, expected.svg)
+
+
+class TestIncremental(unittest.TestCase):
+    """Pruebas de la sesión de compilación incremental"""
+    
+    CODE = """Paper 100
+Pen 3
+Line 50 10 10 90
+# comentario
+Circle 50 50 12
+Rect 1 2 3 4"""
+    
+    def assertMatchesFull(self, session):
+        full = compile_source(session.source, opt_level=OPT_NONE)
+        self.assertEqual(session.success, full.success)
+        self.assertEqual(session.errors, full.errors)
+        if full.success:
+            self.assertEqual(session.instructions, full.instructions)
+            self.assertEqual(session.build_svg(), full.svg)
+            self.assertEqual({n: (s.value, s.line) for n, s in session.symbol_table.symbols.items()},
+                             {n: (s.value, s.line) for n, s in full.symbols.symbols.items()})
+    
+    def test_value_edit_in_place(self):
+        """Test: Cambiar un número corrige solo el elemento afectado"""
+        session = IncrementalSession(self.CODE)
+        statement = session.program.statements[3]
+        patch = session.apply_edit(TextEdit(5, 8, 5, 10, "60"))
+        self.assertEqual((patch.start, patch.removed), (1, 1))
+        self.assertEqual(patch.elements, ['    <circle cx="60" cy="50" r="12"/>'])
+        self.assertIsNone(patch.header)
+        self.assertIsNot(session.program.statements[3], statement)
+        self.assertEqual(session.symbol_table.get_symbol("Circle_2").value["x"], 60)
+        self.assertMatchesFull(session)
+    
+    def test_paper_edit_changes_header(self):
+        """Test: Cambiar Paper solo cambia la cabecera"""
+        session = IncrementalSession(self.CODE)
+        patch = session.apply_edit(TextEdit(1, 7, 1, 10, "250"))
+        self.assertEqual(patch.removed, 0)
+        self.assertIn('width="250"', patch.header[0])
+        self.assertMatchesFull(session)
+    
+    def test_insert_and_delete_lines(self):
+        """Test: Insertar y borrar líneas renumera figuras como el compilador"""
+        session = IncrementalSession(self.CODE)
+        patch = session.apply_edit(TextEdit(3, 1, 3, 1, "Line 1 1 2 2\nRect 0 0 5 5\n"))
+        self.assertEqual((patch.start, patch.removed, len(patch.elements)), (0, 1, 3))
+        self.assertEqual(session.symbol_table.get_symbol("Line_1").value["x2"], 2)
+        self.assertMatchesFull(session)
+        patch = session.apply_edit(TextEdit(2, 1, 5, 1, ""))
+        self.assertEqual((patch.start, patch.removed, len(patch.elements)), (0, 3, 1))
+        self.assertMatchesFull(session)
+    
+    def test_errors_follow_edits(self):
+        """Test: Los errores se detectan y desaparecen al corregirlos"""
+        session = IncrementalSession(self.CODE)
+        session.apply_edit(TextEdit(3, 11, 3, 17, ""))
+        self.assertFalse(session.success)
+        self.assertMatchesFull(session)
+        session.apply_edit(TextEdit(1, 1, 1, 1, "1.2.3\n"))
+        self.assertMatchesFull(session)
+        session.apply_edit(TextEdit(1, 1, 2, 1, ""))
+        session.apply_edit(TextEdit(3, 11, 3, 11, " 10 90"))
+        self.assertTrue(session.success)
+        self.assertMatchesFull(session)
+    
+    def test_edits_do_not_rebuild_symbols(self):
+        """Test: Insertar declaraciones o líneas no reconstruye la tabla de símbolos"""
+        session = IncrementalSession(self.CODE)
+        with mock.patch.object(IncrementalSession, '_rebuild_symbols') as rebuild:
+            session.apply_edit(TextEdit(3, 1, 3, 1, "Pen 5 Circle 1 1 1\n"))
+            self.assertMatchesFull(session)
+            session.apply_edit(TextEdit(1, 1, 1, 1, "# nuevo\n\n"))
+            self.assertMatchesFull(session)
+            session.apply_edit(TextEdit(2, 1, 2, 1, "Line 1"))
+            self.assertMatchesFull(session)
+            session.apply_edit(TextEdit(2, 1, 2, 7, "Rect 0 0 2 2\n"))
+            self.assertMatchesFull(session)
+            session.apply_edit(TextEdit(4, 1, 6, 1, ""))
+            self.assertMatchesFull(session)
+        rebuild.assert_not_called()
+    
+    def test_shift_values(self):
+        """Test: El desplazamiento en bloque, con y sin NumPy"""
+        for numpy_module in (symbol_table.np, None):
+            with mock.patch.object(symbol_table, 'np', numpy_module):
+                values = array('L', [1, 5, 9, 12])
+                shift_values(values, 1, -3)
+                shift_values(values, 3, 4)
+                self.assertEqual(values.tolist(), [1, 2, 6, 13])
+    
+    @unittest.skipIf(symbol_table.np is None, "el desplazamiento en bloque requiere NumPy")
+    def test_line_edits_scale(self):
+        """Test: Insertar y borrar líneas cuesta poco frente a cargar el texto"""
+        code = "Paper 1000\nPen 2\n" + "".join(f"Line {i} 1 2 3\nCircle {i} 5 6\n" for i in range(10000))
+        start = time.perf_counter()
+        session = IncrementalSession(code)
+        load = time.perf_counter() - start
+        edit = float("inf")
+        for _ in range(5):
+            start = time.perf_counter()
+            session.apply_edit(TextEdit(10, 1, 10, 1, "Rect 1 2 3 4\n"))
+            session.apply_edit(TextEdit(10, 1, 11, 1, ""))
+            edit = min(edit, time.perf_counter() - start)
+        self.assertEqual(session.source, code)
+        self.assertLess(edit, load / 50)
+    
+    def test_invalid_range(self):
+        """Test: Un rango fuera del texto se rechaza"""
+        session = IncrementalSession(self.CODE)
+        with self.assertRaises(ValueError):
+            session.apply_edit(TextEdit(9, 1, 9, 1, "x"))
+        with self.assertRaises(ValueError):
+            session.apply_edit(TextEdit(2, 3, 1, 1, "x"))
+
+
+class TestSpatialIndex(unittest.TestCase):
+    """Pruebas del índice espacial de figuras"""
+    
+    CODE = """Paper 200
+Pen 2
+Line 10 10 50 50
+Circle 100 100 20
+Rect 150 150 30 20
+Line 0 190 190 190
+"""
+    
+    def build(self, node_size=2):
+        compiler = SimpleDrawCompiler()
+        compiler.compile(self.CODE, verbose=False, opt_level=OPT_NONE)
+        return compiler.build_spatial_index(node_size)
+    
+    def test_query_viewport(self):
+        """Test: La consulta devuelve las figuras cuya caja corta la vista"""
+        index = self.build()
+        self.assertEqual(len(index), 4)
+        self.assertEqual(index.query(0, 0, 60, 60), [2])
+        self.assertEqual(index.query(70, 70, 200, 200), [3, 4, 5])
+        self.assertEqual(index.query(300, 300, 400, 400), [])
+    
+    def test_hit_test_uses_stroke(self):
+        """Test: El punto debe tocar el trazo, no solo la caja"""
+        index = self.build()
+        self.assertEqual(index.hit_test(100, 100, tolerance=1), [])
+        self.assertEqual(index.hit_test(120.5, 100, tolerance=1), [3])
+        self.assertEqual(index.hit_test(30, 31, tolerance=1), [2])
+        self.assertEqual(index.hit_test(160, 170.3, tolerance=0.5), [4])
+    
+    def test_nearest(self):
+        """Test: nearest ordena por distancia al trazo"""
+        index = self.build()
+        (first, distance), (second, _) = index.nearest(100, 175, k=2)
+        self.assertEqual((first, distance), (5, 15))
+        self.assertEqual(second, 4)
+        self.assertEqual(index.nearest(100, 175, max_distance=5), [])
+    
+    def test_matches_linear_scan(self):
+        """Test: Con y sin NumPy, el índice coincide con un recorrido lineal"""
+        import random
+        rng = random.Random(7)
+        ir = ColumnarIR()
+        for _ in range(500):
+            op = rng.choice(['LINE', 'CIRCLE', 'RECT', 'PEN'])
+            values = [rng.randint(0, 1000) for _ in range(4)]
+            ir.emit(op, *values[:intermediate_code.OP_ARITY[op]])
+        boxes = [spatial_index.bounding_box(*row) for row in ir.rows()]
+        viewport = (200, 300, 450, 500)
+        expected = [i for i, box in enumerate(boxes) if box and not (
+            box[0] > viewport[2] or box[1] > viewport[3] or box[2] < viewport[0] or box[3] < viewport[1])]
+        
+        variants = [SpatialIndex.from_instructions(ir.to_instructions())]
+        with mock.patch.object(spatial_index, "np", None):
+            variants.append(SpatialIndex.from_instructions(ir))
+        if spatial_index.np is not None:
+            variants.append(SpatialIndex.from_instructions(ir))
+        for index in variants:
+            self.assertEqual(index.query(*viewport), expected)
+            nearest = index.nearest(500, 500, k=3)
+            self.assertEqual([d for _, d in nearest], sorted(d for _, d in nearest))
+
+
+class TestCullingAndTiles(unittest.TestCase):
+    """Pruebas del recorte fuera del lienzo y la exportación en mosaico"""
+    
+    CODE = """Paper 100
+Pen 2
+Line 10 10 40 40
+Circle 75 25 10
+Rect 60 60 30 30
+Line 101 0 101 100
+Circle 300 300 5
+"""
+    
+    def test_cull_drops_offcanvas_shapes(self):
+        """Test: cull omite las figuras fuera del lienzo y conserva las del borde"""
+        full = compile_source(self.CODE)
+        culled = compile_source(self.CODE, cull=True)
+        self.assertIn('cx="300"', full.svg)
+        self.assertNotIn('cx="300"', culled.svg)
+        # Con Pen 2 el trazo en x=101 todavía asoma por el borde
+        self.assertIn('x1="101"', culled.svg)
+        self.assertEqual(culled.instructions, full.instructions)
+        self.assertNotIn('x1="101"', compile_source(self.CODE.replace("Pen 2", "Pen 1"), cull=True).svg)
+    
+    def test_parse_grid(self):
+        """Test: Formato NxM de la cuadrícula"""
+        self.assertEqual(parse_grid("4x3"), (4, 3))
+        self.assertEqual(parse_grid("2"), (2, 2))
+        with self.assertRaises(ValueError):
+            parse_grid("0x3")
+    
+    def test_tiles_contain_intersecting_shapes(self):
+        """Test: Cada baldosa lleva solo las figuras que la cortan"""
+        compiler = SimpleDrawCompiler()
+        compiler.compile(self.CODE, verbose=False)
+        with tempfile.TemporaryDirectory() as tmp:
+            manifest = compiler.export_tiles(tmp, 2, 2, workers=2)
+            counts = {(t.row, t.col): t.elements for t in manifest.tiles}
+            with open(os.path.join(tmp, "tile_1_1.svg")) as f:
+                bottom_right = f.read()
+            self.assertTrue(os.path.exists(os.path.join(tmp, "tiles.json")))
+        self.assertEqual(counts, {(0, 0): 1, (0, 1): 2, (1, 0): 0, (1, 1): 2})
+        self.assertIn('viewBox="50 50 50 50"', bottom_right)
+        self.assertIn('<rect x="60" y="60" width="30" height="30"/>', bottom_right)
+        self.assertNotIn('cx="300"', bottom_right)
+
+
+class TestSvgWriter(unittest.TestCase):
+    """Pruebas del escritor SVG directo a archivo"""
+    
+    CODE = """Paper 120
+Pen 2
+Line 10 10 90.25 90
+Circle 50 50 12.5
+Rect 1 2 3.0 4
+"""
+    
+    def compiled(self):
+        compiler = SimpleDrawCompiler()
+        compiler.compile(self.CODE, verbose=False)
+        return compiler
+    
+    def test_same_bytes_as_build_svg(self):
+        """Test: Sin precisión el archivo es idéntico a build_svg"""
+        compiler = self.compiled()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.svg")
+            self.assertEqual(compiler.write_svg(path), 3)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), compiler.build_svg().encode())
+    
+    def test_svgz(self):
+        """Test: .svgz se escribe comprimido con gzip"""
+        compiler = self.compiled()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.svgz")
+            compiler.write_svg(path)
+            with gzip.open(path) as f:
+                self.assertEqual(f.read(), compiler.build_svg().encode())
+    
+    def test_precision(self):
+        """Test: La precisión redondea flotantes y quita ceros sobrantes"""
+        fmt = make_formatter(2)
+        self.assertEqual(fmt(3), b"3")
+        self.assertEqual(fmt(3.0), b"3")
+        self.assertEqual(fmt(12.5), b"12.5")
+        self.assertEqual(fmt(1 / 3), b"0.33")
+        self.assertEqual(fmt(-0.001), b"0")
+        exact = make_formatter()
+        self.assertEqual((exact(3), exact(3.0)), (b"3", b"3.0"))
+        self.assertEqual((exact(0.0), exact(-0.0), exact(0.0)), (b"0.0", b"-0.0", b"0.0"))
+        self.assertEqual((fmt(-0.0), fmt(0.0)), (b"0", b"0"))
+    
+    def test_cli_modes_apply_output_options(self):
+        """Test: --mmap, --parallel y --cache escriben con --svgz, --precision y --png"""
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "a.sd")
+            with open(source, "w") as f:
+                f.write(self.CODE)
+            expected = os.path.join(tmp, "expected")
+            options = ["-q", "--svgz", "--precision", "0", "--png"]
+            with mock.patch("builtins.print"):
+                main.main([source, "-o", expected] + options)
+                for mode in (["--mmap"], ["--parallel", "-j", "1"], ["--cache", os.path.join(tmp, "cache")]):
+                    output = os.path.join(tmp, mode[0].strip("-"))
+                    main.main([source, "-o", output] + options + mode)
+                    with gzip.open(output + "_output.svgz") as a, gzip.open(expected + "_output.svgz") as b:
+                        self.assertEqual(a.read(), b.read())
+                    with open(output + "_output.png", "rb") as a, open(expected + "_output.png", "rb") as b:
+                        self.assertEqual(a.read(), b.read())
+    
+    def test_cli_rejects_ignored_options(self):
+        """Test: Se rechazan las opciones que un modo no usa y los valores no válidos"""
+        for argv in (["a.sd", "--stream", "--tiles", "2x2"], ["a.sd", "--stream", "--cull"],
+                     ["a.sd", "--parallel", "--metrics", "-"], ["a.sd", "--cache", "c", "--source-map"],
+                     ["a.sd", "b.sd", "--svgz"], ["a.sdir", "-O", "2"], ["a.sd", "--precision", "-1"],
+                     ["a.sd", "-O", "3", "--source-map"], ["a.sd", "--mmap", "-O", "3", "--source-map"]):
+            with self.assertRaises(SystemExit), mock.patch("sys.stderr"):
+                main.main(argv)
+    
+    def test_writer_rows(self):
+        """Test: SvgWriter ignora PAPER/PEN y cuenta los elementos"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.svg")
+            with SvgWriter(path, 50, 3, precision=1) as writer:
+                writer.write_rows([('PAPER', 50, None, None, None),
+                                   ('LINE', 0.04, 1, 2.26, 3)])
+            with open(path) as f:
+                content = f.read()
+        self.assertEqual(writer.elements, 1)
+        self.assertIn('<line x1="0" y1="1" x2="2.3" y2="3"/>', content)
+        self.assertTrue(content.endswith("</svg>"))
+
+
+class TestLineMerging(unittest.TestCase):
+    """Pruebas de la unión de segmentos en polilíneas (-O 3)"""
+    
+    @staticmethod
+    def lines(*segments):
+        return [IntermediateInstruction('LINE', *segment) for segment in segments]
+    
+    def test_collinear(self):
+        """Test: Segmentos colineales que se tocan o solapan forman uno"""
+        merged = merge_lines(self.lines((0, 0, 10, 0), (20, 0, 10, 0), (5, 0, 15, 0)))
+        self.assertEqual(merged, self.lines((0, 0, 20, 0)))
+        # Alineados pero separados: no se unen
+        merged = merge_lines(self.lines((0, 0, 1, 1), (2, 2, 3, 3)))
+        self.assertEqual(len(merged), 2)
+    
+    def test_chain(self):
+        """Test: Segmentos conectados forman una POLYLINE"""
+        merged = merge_lines(self.lines((10, 0, 10, 10), (0, 0, 10, 0), (10, 10, 0, 10.0)))
+        self.assertEqual(merged, [IntermediateInstruction('POLYLINE', (0, 0, 10, 0, 10, 10, 0, 10.0))])
+    
+    def test_pen_splits_runs(self):
+        """Test: No se unen líneas de lápices distintos"""
+        code = self.lines((0, 0, 10, 0))
+        code.append(IntermediateInstruction('PEN', 3))
+        code.extend(self.lines((10, 0, 20, 0)))
+        self.assertEqual(merge_lines(code), code)
+    
+    def test_star_svg(self):
+        """Test: La estrella de ejemplo es una sola polilínea cerrada"""
+        with open(os.path.join(os.path.dirname(__file__), "..", "examples", "star.sd")) as f:
+            code = f.read()
+        result = compile_source(code, opt_level=OPT_GEOMETRY)
+        self.assertTrue(result.success)
+        self.assertEqual([i.op for i in result.instructions], ['PAPER', 'PEN', 'POLYLINE'])
+        self.assertIn('<polyline points="75,20 45,130 140,55 10,55 105,130 75,20"/>', result.svg)
+        self.assertLess(len(result.svg), len(compile_source(code, opt_level=OPT_GLOBAL).svg))
+    
+    def test_writer_and_index(self):
+        """Test: SvgWriter y SpatialIndex admiten POLYLINE"""
+        compiler = SimpleDrawCompiler()
+        compiler.compile("Line 0 0 10 0\nLine 10 0 10 10\nCircle 50 50 5\n", verbose=False,
+                         opt_level=OPT_GEOMETRY)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.svg")
+            self.assertEqual(compiler.write_svg(path), 2)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), compiler.build_svg().encode())
+        index = compiler.build_spatial_index()
+        self.assertEqual(index.query(0, 0, 100, 100), [0, 1])
+        self.assertEqual(index.hit_test(10, 5), [0])
+        self.assertEqual([shape for shape, _ in index.nearest(10, 0, k=2)], [0, 1])
+    
+    def test_columnar_rejects(self):
+        """Test: ColumnarIR no puede representar POLYLINE"""
+        ir = ColumnarIR()
+        ir.emit('LINE', 0, 0, 1, 1)
+        with self.assertRaises(ValueError):
+            ir.optimize(OPT_GEOMETRY)
+
+
+class TestBinaryIR(unittest.TestCase):
+    """Pruebas del formato binario .sdir"""
+    
+    CODE = """Paper 150
+Pen 3
+Line 0 0 10 0
+Line 10 0 10 10.5
+Circle 50 50 12.5
+Rect 1 2 3.0 4
+"""
+    
+    def round_trip(self, instructions):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.sdir")
+            write_ir(path, instructions)
+            with MappedIR(path) as ir:
+                return ir.to_instructions(), ir.canvas(), len(ir)
+    
+    def test_round_trip(self):
+        """Test: Las instrucciones (y 3 frente a 3.0) sobreviven al formato"""
+        result = compile_source(self.CODE)
+        loaded, canvas, count = self.round_trip(result.instructions)
+        self.assertEqual(repr(loaded), repr(result.instructions))
+        self.assertEqual(canvas, (150, 3))
+        self.assertEqual(count, 6)
+    
+    def test_optimized_canvas(self):
+        """Test: El .sdir optimizado conserva el lápiz final del SVG"""
+        code = "Pen 2\nLine 0 0 10 10\nPen 7"
+        for level in (OPT_GLOBAL, OPT_GEOMETRY):
+            result = compile_source(code, opt_level=level)
+            _, canvas, _ = self.round_trip(result.instructions)
+            self.assertIn('stroke-width="7"', result.svg)
+            self.assertEqual(canvas, (100, 7))
+    
+    def test_polyline(self):
+        """Test: POLYLINE se guarda en la sección de puntos"""
+        result = compile_source(self.CODE, opt_level=OPT_GEOMETRY)
+        loaded, _, _ = self.round_trip(result.instructions)
+        self.assertEqual(loaded, list(result.instructions))
+        self.assertEqual(loaded[2].arg1, (0, 0, 10, 0, 10, 10.5))
+    
+    def test_columnar_views(self):
+        """Test: Un ColumnarIR se vuelca y se lee como vistas sin copia"""
+        result = compile_source(self.CODE, columnar=True)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.sdir")
+            write_ir(path, result.instructions)
+            with MappedIR(path) as ir:
+                self.assertIsInstance(ir.operands, memoryview)
+                self.assertEqual(ir.operands.format, "d")
+                self.assertEqual(list(ir.to_columnar().rows()), list(result.instructions.rows()))
+    
+    def test_invalid_file(self):
+        """Test: Un archivo que no es .sdir se rechaza"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.sdir")
+            with open(path, "wb") as f:
+                f.write(b"Paper 100\n" * 10)
+            with self.assertRaises(ValueError):
+                MappedIR(path)
+    
+    def test_cli_render(self):
+        """Test: La CLI genera el mismo SVG desde el .sdir"""
+        from main import main
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "a.sd")
+            with open(source, "w") as f:
+                f.write(self.CODE)
+            first, second = os.path.join(tmp, "a"), os.path.join(tmp, "b")
+            with mock.patch("builtins.print"):
+                main([source, "-q", "--binary-ir", "-o", first])
+                main([first + "_intermediate.sdir", "-o", second])
+            self.assertFalse(os.path.exists(first + "_intermediate.json"))
+            with open(first + "_output.svg") as a, open(second + "_output.svg") as b:
+                self.assertEqual(a.read(), b.read())
+
+
+class TestRaster(unittest.TestCase):
+    """Pruebas del rasterizador PNG"""
+    
+    ROWS = [('PAPER', 40, None, None, None),
+            ('LINE', 2, 3, 30, 17.5),
+            ('LINE', 5, 35, 8, 2),
+            ('CIRCLE', 20, 20, 9.5, None),
+            ('RECT', 30, 30, -12, 6),
+            ('POLYLINE', (0, 0, 39, 0, 39, 39), None, None, None)]
+    
+    @staticmethod
+    def black(raster_image):
+        data = raster_image.tobytes()
+        return {(i % raster_image.width, i // raster_image.width) for i, v in enumerate(data) if v == 0}
+    
+    def test_bresenham_line(self):
+        """Test: Una línea de un píxel es la de Bresenham"""
+        image = Raster(10, 10)
+        image.line(0, 0, 9, 3)
+        self.assertEqual(self.black(image), {(0, 0), (1, 0), (2, 1), (3, 1), (4, 1),
+                                             (5, 2), (6, 2), (7, 2), (8, 3), (9, 3)})
+        # El grosor se extiende en el eje menor
+        image = Raster(10, 10)
+        image.line(1, 5, 8, 5, 3)
+        self.assertEqual(self.black(image), {(x, y) for x in range(1, 9) for y in (4, 5, 6)})
+    
+    def test_midpoint_circle(self):
+        """Test: Contorno del punto medio"""
+        self.assertEqual(midpoint_extents(5), [5, 5, 5, 4, 3, 2])
+        image = Raster(11, 11)
+        image.circle(5, 5, 4.5)
+        pixels = self.black(image)
+        self.assertIn((0, 5), pixels)
+        self.assertIn((5, 10), pixels)
+        self.assertNotIn((5, 5), pixels)
+    
+    def test_midpoint_reach(self):
+        """Test: Las filas sueltas coinciden con el contorno completo"""
+        for radius in range(60):
+            self.assertEqual(midpoint_reach(radius, 0, radius), midpoint_extents(radius))
+            self.assertEqual(midpoint_reach(radius, 3, radius - 2), midpoint_extents(radius)[3:radius - 1])
+    
+    def test_huge_circle(self):
+        """Test: Un radio enorme solo calcula las filas visibles"""
+        image = Raster(100, 100)
+        with mock.patch('raster.midpoint_extents', side_effect=AssertionError):
+            image.circle(50, 50, 5000000)
+            image.circle(50, 5000050, 5000000)
+        self.assertEqual(self.black(image), {(x, 49) for x in range(100)})
+    
+    def test_rect(self):
+        """Test: El borde del rectángulo, sin relleno"""
+        image = Raster(8, 8)
+        image.rect(1, 1, 4, 3)
+        expected = {(x, y) for x in range(1, 6) for y in (1, 4)} | {(x, y) for x in (1, 5) for y in (2, 3)}
+        self.assertEqual(self.black(image), expected)
+    
+    def test_numpy_and_pure_python_agree(self):
+        """Test: Con y sin NumPy se obtiene el mismo PNG"""
+        for pen_width, size in ((1, None), (3, 64), (2, 17)):
+            png = rasterize(self.ROWS, 40, pen_width, size).to_png()
+            with mock.patch.object(raster, "np", None):
+                self.assertEqual(rasterize(self.ROWS, 40, pen_width, size).to_png(), png)
+    
+    def test_big_coordinates(self):
+        """Test: Coordenadas enteras enormes se recortan sin desbordar int64"""
+        big = 10 ** 20
+        rows = [('LINE', 0, 0, big, 5), ('LINE', 3, 0, 4, big), ('RECT', 0, 0, big, 3),
+                ('CIRCLE', 1, 1, big, None), ('LINE', 0, 0, 10 ** 400, 1)]
+        png = rasterize(rows, 20).to_png()
+        with mock.patch.object(raster, "np", None):
+            self.assertEqual(rasterize(rows, 20).to_png(), png)
+        image = rasterize(rows[:1], 20)
+        self.assertEqual(self.black(image), {(x, 0) for x in range(20)})
+    
+    def test_image_size_limits(self):
+        """Test: El lado de la imagen se limita a MAX_SIDE"""
+        with mock.patch.object(raster, "MAX_SIDE", 64):
+            self.assertEqual(rasterize([], 10 ** 9).width, 64)
+            for size in (0, -3, 65):
+                with self.assertRaises(ValueError):
+                    rasterize([], 100, size=size)
+        with self.assertRaises(SystemExit), mock.patch('sys.stderr'):
+            main.build_arg_parser().parse_args(["--png-size", "0"])
+    
+    def test_png_file(self):
+        """Test: El PNG es válido y se descomprime con zlib"""
+        compiler = SimpleDrawCompiler()
+        compiler.compile("Paper 20\nPen 2\nLine 0 10 20 10\n", verbose=False)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.png")
+            self.assertEqual(compiler.write_png(path, size=10), (10, 10))
+            with open(path, "rb") as f:
+                data = f.read()
+        self.assertEqual(data[:8], raster.PNG_SIGNATURE)
+        self.assertEqual(struct.unpack(">II", data[16:24]), (10, 10))
+        length = struct.unpack(">I", data[33:37])[0]
+        raw = zlib.decompress(data[41:41 + length])
+        self.assertEqual(len(raw), 10 * 11)
+        # Fila 5 (índice de línea 10 * 0.5) en negro, fila 0 en blanco
+        self.assertEqual(raw[5 * 11:6 * 11], b"\0" * 11)
+        self.assertEqual(raw[:11], b"\0" + b"\xff" * 10)
+
+
+class TestMetrics(unittest.TestCase):
+    """Pruebas de la instrumentación por fase"""
+    
+    CODE = "Paper 100\nPen 2\nLine 0 0 10 10\nLine 0 0 10 10\nCircle 50 50 5\n"
+    
+    def test_phases(self):
+        """Test: compile_source mide todas las fases en orden"""
+        result = compile_source(self.CODE, instrument=True)
+        metrics = result.metrics
+        self.assertEqual([p.name for p in metrics.phases], list(PHASES))
+        self.assertEqual(metrics.get('lex').items['tokens'], 24)
+        self.assertEqual(metrics.get('parse').items['statements'], 5)
+        self.assertEqual(metrics.get('optimize').items, {'removed': 1, 'instructions': 4})
+        self.assertEqual(metrics.get('emit').items['bytes'], len(result.svg))
+        self.assertGreater(metrics.get('lex').peak_bytes, 0)
+        for p in metrics.phases:
+            self.assertGreaterEqual(p.wall_seconds, 0)
+        self.assertIsNone(compile_source(self.CODE).metrics)
+    
+    def test_without_memory(self):
+        """Test: memory=False no usa tracemalloc"""
+        import tracemalloc
+        metrics = CompileMetrics(memory=False)
+        SimpleDrawCompiler().compile(self.CODE, verbose=False, metrics=metrics)
+        self.assertEqual(len(metrics.phases), 5)
+        self.assertEqual(metrics.peak_bytes, 0)
+        self.assertFalse(tracemalloc.is_tracing())
+    
+    def test_failed_compile(self):
+        """Test: La fase que falla también se mide"""
+        result = compile_source("Paper 100\nCircle 1\n", instrument=True)
+        self.assertFalse(result.success)
+        self.assertEqual([p.name for p in result.metrics.phases], ['lex', 'parse'])
+    
+    def test_exports(self):
+        """Test: JSON y texto de Prometheus"""
+        import json
+        metrics = compile_source(self.CODE, instrument=True).metrics
+        data = json.loads(metrics.to_json())
+        self.assertEqual(data['phases'][0]['name'], 'lex')
+        self.assertAlmostEqual(data['wall_seconds'], metrics.wall_seconds)
+        text = metrics.to_prometheus(labels={'file': 'a"b.sd'})
+        self.assertIn('# TYPE simpledraw_phase_wall_seconds gauge', text)
+        self.assertIn('simpledraw_phase_items{phase="lex",item="tokens",file="a\\"b.sd"} 24', text)
+
+
+class TestBenchmark(unittest.TestCase):
+    """Pruebas de los generadores y la suite de benchmarks"""
+    
+    def test_generate_program(self):
+        """Test: El programa sintético es determinista y compila"""
+        source = benchmark.generate_program(300, comments=0.5, seed=7)
+        self.assertEqual(source, benchmark.generate_program(300, comments=0.5, seed=7))
+        self.assertIn("\n# ", source)
+        result = compile_source(source, opt_level=OPT_NONE)
+        self.assertTrue(result.success)
+        self.assertEqual(len(result.instructions), 302)
+        only_lines = benchmark.generate_program(50, mix=(("line", 1),))
+        self.assertEqual(only_lines.count("Line "), 50)
+        self.assertEqual(only_lines.count("Circle"), 0)
+    
+    def test_strings_are_lexer_only(self):
+        """Test: Las cadenas largas se analizan pero no son declaraciones"""
+        source = benchmark.generate_program(100, strings=1.0, string_length=500)
+        tokens = Lexer(source).tokenize()
+        self.assertEqual(sum(t.type == TokenType.STRING for t in tokens), 100)
+        self.assertFalse(compile_source(source).success)
+    
+    def test_suite_and_baseline(self):
+        """Test: La suite mide las fases y se compara con la línea base"""
+        suite = benchmark.run_suite(200, rounds=1, workloads=["mixed", "strings"], run_main=False)
+        mixed, strings = suite.results
+        self.assertEqual(set(mixed.phases), set(PHASES))
+        self.assertEqual(mixed.shapes, 200)
+        self.assertGreater(mixed.tokens_per_second, 0)
+        self.assertGreater(mixed.peak_bytes, 0)
+        self.assertEqual(list(strings.phases), ["lex"])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "baseline.json")
+            suite.save(path)
+            baseline = benchmark.SuiteResult.load(path)
+        self.assertEqual(baseline.results[0].tokens, mixed.tokens)
+        baseline.results[0].total_seconds = mixed.total_seconds / 2
+        worse = benchmark.regressions(benchmark.compare(baseline, suite))
+        self.assertEqual([(c.workload, c.metric) for c in worse], [("mixed", "total_seconds")])
+        baseline.rounds = 3
+        with self.assertRaises(ValueError):
+            benchmark.compare(baseline, suite)
+    
+    def test_baseline_kept_on_regression(self):
+        """Test: Una regresión o una línea base de otra configuración no sobrescriben la línea base"""
+        def suite(seconds, shapes=200):
+            return benchmark.SuiteResult(shapes, 1, [benchmark.WorkloadResult("mixed", 10, 5, shapes, {}, seconds)])
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "baseline.json")
+            suite(1.0).save(path)
+            argv = ["--suite", "--shapes", "200", "--rounds", "1", "--baseline", path]
+            with mock.patch("builtins.print"):
+                with mock.patch.object(benchmark, "run_suite", return_value=suite(2.0)):
+                    self.assertEqual(benchmark.main(argv), 1)
+                self.assertEqual(benchmark.SuiteResult.load(path).results[0].total_seconds, 1.0)
+                with mock.patch.object(benchmark, "run_suite", return_value=suite(0.5, shapes=100)):
+                    self.assertEqual(benchmark.main(argv), 1)
+                self.assertEqual(benchmark.SuiteResult.load(path).results[0].total_seconds, 1.0)
+                with mock.patch.object(benchmark, "run_suite", return_value=suite(0.5)):
+                    self.assertEqual(benchmark.main(argv), 0)
+                self.assertEqual(benchmark.SuiteResult.load(path).results[0].total_seconds, 0.5)
+
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "requiere sockets Unix")
+class TestServer(unittest.TestCase):
+    """Pruebas del servidor de compilación"""
+    
+    def start(self, path=None, **options):
+        if path is None:
+            tmp = tempfile.TemporaryDirectory()
+            self.addCleanup(tmp.cleanup)
+            path = os.path.join(tmp.name, "sd.sock")
+        server = CompileServer(path, **options)
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(server.start())
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        
+        def stop():
+            asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+        self.addCleanup(stop)
+        return server
+    
+    def test_compile_matches_library(self):
+        """Test: La respuesta trae el mismo IR y SVG que compile_source"""
+        code = "Paper 100\nPen 2\nLine 0 0 10 10\nLine 10 10 20 20\nCircle 50 50 10\n"
+        server = self.start(workers=0)
+        expected = compile_source(code, opt_level=OPT_GLOBAL)
+        with CompileClient(server.path) as client:
+            response = client.compile(code, opt_level=OPT_GLOBAL)
+            bad = client.compile("Paper x\n")
+            invalid = client.compile(code, opt_level=9)
+        self.assertTrue(response["success"])
+        self.assertEqual(response["svg"], expected.svg)
+        self.assertEqual([tuple(row) for row in response["instructions"]],
+                         [(i.op, i.arg1, i.arg2, i.arg3, i.result) for i in expected.instructions])
+        self.assertFalse(bad["success"])
+        self.assertEqual(bad["errors"], compile_source("Paper x\n").errors)
+        self.assertFalse(invalid["success"])
+        self.assertIn("opt_level", invalid["errors"][0])
+        for opt_level in (True, False, 1.0):
+            with self.assertRaises(ValueError):
+                handle_request({"source": code, "opt_level": opt_level})
+    
+    def test_close_with_open_connections(self):
+        """Test: Cerrar el servidor espera a las conexiones abiertas sin sondear"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "sd.sock")
+            
+            async def scenario():
+                server = await CompileServer(path, workers=0).start()
+                clients = [await asyncio.open_unix_connection(path) for _ in range(3)]
+                while len(server._connections) < 3:
+                    await asyncio.sleep(0)
+                with mock.patch("asyncio.sleep") as sleep:
+                    await asyncio.wait_for(server.close(), 5)
+                sleep.assert_not_called()
+                for _, writer in clients:
+                    writer.close()
+                return server
+            
+            server = asyncio.run(scenario())
+        self.assertEqual(server._connections, {})
+    
+    def test_socket_path_checks(self):
+        """Test: Solo se reemplaza un socket abandonado, nunca otro archivo"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "sd.sock")
+            with open(path, "w") as f:
+                f.write("datos")
+            with self.assertRaises(FileExistsError):
+                asyncio.run(CompileServer(path, workers=0).start())
+            os.unlink(path)
+            
+            stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            stale.bind(path)
+            stale.close()
+            self.start(path, workers=0)
+            with CompileClient(path) as client:
+                self.assertTrue(client.compile("Paper 10\n")["success"])
+            with self.assertRaises(OSError) as raised:
+                asyncio.run(CompileServer(path, workers=0).start())
+            self.assertEqual(raised.exception.errno, errno.EADDRINUSE)
+    
+    def test_commands_any_key_order(self):
+        """Test: Los comandos se reconocen por su clave, no por el texto de la línea"""
+        server = self.start(workers=0)
+        with CompileClient(server.path) as client:
+            client._socket.sendall(b'{"id": 7, "command": "stats"}\n{ "command" : "stats"}\n'
+                                   b'{"command": "otro"}\nno es JSON\n')
+            responses = [json.loads(client._reader.readline()) for _ in range(4)]
+        self.assertEqual(responses[0]["id"], 7)
+        self.assertIn("requests", responses[0]["stats"])
+        self.assertTrue(responses[1]["success"])
+        self.assertIn("comando desconocido", responses[2]["errors"][0])
+        self.assertIn("petición no válida", responses[3]["errors"][0])
+    
+    def test_pipelining_and_concurrent_clients(self):
+        """Test: Varios clientes con peticiones encadenadas reciben sus respuestas en orden"""
+        server = self.start(workers=1, pipeline=4, inline_bytes=0)
+        sources = [f"Paper 100\nLine 0 0 {k} 10\n" for k in range(40)]
+        results = {}
+        
+        def run(name):
+            with CompileClient(server.path) as client:
+                results[name] = client.compile_many(sources, window=16, emit_svg=False)
+        
+        threads = [threading.Thread(target=run, args=(k,)) for k in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for responses in results.values():
+            self.assertEqual([r["instructions"][1][3] for r in responses], list(range(40)))
+            self.assertNotIn("svg", responses[0])
+        with CompileClient(server.path) as client:
+            stats = client.stats()
+        self.assertEqual(stats["connections"], 4)
+        self.assertEqual(stats["requests"], 121)
+    
+    def test_oversized_request(self):
+        """Test: Una petición mayor que el límite recibe un error"""
+        server = self.start(workers=0, max_request_bytes=1024)
+        with CompileClient(server.path) as client:
+            response = client.compile("Line 0 0 1 1\n" * 200)
+        self.assertFalse(response["success"])
+        self.assertIn("1024", response["errors"][0])
+
+
 class TestIntegration(unittest.TestCase):
     """Pruebas de Integración Completas"""
     
@@ -332,10 +1933,33 @@ def run_tests():
     
     # Agregar tests
     suite.addTests(loader.loadTestsFromTestCase(TestLexer))
+    suite.addTests(loader.loadTestsFromTestCase(TestLexerEngines))
+    suite.addTests(loader.loadTestsFromTestCase(TestTokenBuffer))
     suite.addTests(loader.loadTestsFromTestCase(TestParser))
     suite.addTests(loader.loadTestsFromTestCase(TestSymbolTable))
     suite.addTests(loader.loadTestsFromTestCase(TestIntermediateCode))
+    suite.addTests(loader.loadTestsFromTestCase(TestGlobalOptimization))
+    suite.addTests(loader.loadTestsFromTestCase(TestColumnarIR))
     suite.addTests(loader.loadTestsFromTestCase(TestCompiler))
+    suite.addTests(loader.loadTestsFromTestCase(TestCompileAPI))
+    suite.addTests(loader.loadTestsFromTestCase(TestFastPath))
+    suite.addTests(loader.loadTestsFromTestCase(TestValidate))
+    suite.addTests(loader.loadTestsFromTestCase(TestSourceMap))
+    suite.addTests(loader.loadTestsFromTestCase(TestCompileCache))
+    suite.addTests(loader.loadTestsFromTestCase(TestBatch))
+    suite.addTests(loader.loadTestsFromTestCase(TestParallel))
+    suite.addTests(loader.loadTestsFromTestCase(TestStreaming))
+    suite.addTests(loader.loadTestsFromTestCase(TestMappedLexer))
+    suite.addTests(loader.loadTestsFromTestCase(TestIncremental))
+    suite.addTests(loader.loadTestsFromTestCase(TestSpatialIndex))
+    suite.addTests(loader.loadTestsFromTestCase(TestCullingAndTiles))
+    suite.addTests(loader.loadTestsFromTestCase(TestSvgWriter))
+    suite.addTests(loader.loadTestsFromTestCase(TestLineMerging))
+    suite.addTests(loader.loadTestsFromTestCase(TestBinaryIR))
+    suite.addTests(loader.loadTestsFromTestCase(TestRaster))
+    suite.addTests(loader.loadTestsFromTestCase(TestMetrics))
+    suite.addTests(loader.loadTestsFromTestCase(TestBenchmark))
+    suite.addTests(loader.loadTestsFromTestCase(TestServer))
     suite.addTests(loader.loadTestsFromTestCase(TestIntegration))
     
     # Ejecutar tests
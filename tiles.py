@@ -0,0 +1,131 @@
+"""
+EXPORTACIÓN EN MOSAICO
+Divide un dibujo grande en una cuadrícula de archivos SVG pequeños,
+generados en paralelo
+"""
+
+import os
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import List, Optional, Tuple
+
+from spatial_index import SpatialIndex
+
+MANIFEST_FILE = "tiles.json"
+
+TileJob = Tuple[str, Tuple, object, List[Tuple]]  # (ruta, límites, grosor, filas)
+
+
+@dataclass
+class Tile:
+    row: int
+    col: int
+    x: float
+    y: float
+    width: float
+    height: float
+    path: str
+    elements: int = 0
+
+
+@dataclass
+class TileManifest:
+    rows: int
+    cols: int
+    paper_size: float
+    pen_width: float
+    tiles: List[Tile] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), indent=2)
+
+
+def parse_grid(text: str) -> Tuple[int, int]:
+    """'4x3' -> (4 filas, 3 columnas)"""
+    rows, _, cols = text.lower().partition('x')
+    try:
+        grid = (int(rows), int(cols or rows))
+    except ValueError:
+        raise ValueError(f"Cuadrícula no válida: {text!r} (formato NxM)") from None
+    if min(grid) < 1:
+        raise ValueError(f"Cuadrícula no válida: {text!r} (formato NxM)")
+    return grid
+
+
+def _coord(value: float):
+    # Enteros sin decimales y el resto sin ruido de coma flotante
+    return int(value) if float(value).is_integer() else round(value, 6)
+
+
+def tile_bounds(paper_size, rows: int, cols: int) -> List[Tuple[int, int, float, float, float, float]]:
+    """(fila, columna, x, y, ancho, alto) de cada baldosa; la fila 0 es la de arriba"""
+    width, height = paper_size / cols, paper_size / rows
+    return [(row, col, _coord(col * width), _coord(row * height), _coord(width), _coord(height))
+            for row in range(rows) for col in range(cols)]
+
+
+def tile_svg(bounds: Tuple, pen_width, rows: List[Tuple]) -> str:
+    """SVG de una baldosa: el viewBox recorta el lienzo, así que las
+    coordenadas de las figuras no cambian"""
+    from main import SVG_NS, SVG_FOOTER, svg_row
+
+    x, y, width, height = bounds
+    lines = [
+        f'<svg width="{width}" height="{height}" viewBox="{x} {y} {width} {height}" xmlns="{SVG_NS}">',
+        f'  <rect x="{x}" y="{y}" width="{width}" height="{height}" fill="white"/>',
+        f'  <g stroke="black" stroke-width="{pen_width}" fill="none">',
+    ]
+    lines.extend(svg_row(*row) for row in rows)
+    lines.extend(SVG_FOOTER)
+    return '\n'.join(lines)
+
+
+def _write_tile(job: TileJob) -> int:
+    path, bounds, pen_width, rows = job
+    with open(path, 'w') as f:
+        f.write(tile_svg(bounds, pen_width, rows))
+    return len(rows)
+
+
+def export_tiles(instructions, output_dir: str, rows: int, cols: int, paper_size=100,
+                 pen_width=1, workers: Optional[int] = None) -> TileManifest:
+    """Escribe el lienzo como rows x cols baldosas SVG en output_dir.
+
+    Cada baldosa lleva solo las figuras cuya caja (más medio grosor de
+    lápiz) la corta, buscadas en un SpatialIndex; las figuras fuera del
+    lienzo no caen en ninguna. El formateo y la escritura se reparten en un
+    ProcessPoolExecutor (workers=1 escribe en este proceso). tiles.json
+    describe la cuadrícula para el visor.
+    """
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    if hasattr(instructions, 'rows'):  # ColumnarIR
+        all_rows = list(instructions.rows())
+    else:
+        all_rows = [(i.op, i.arg1, i.arg2, i.arg3, i.result) for i in instructions]
+    index = SpatialIndex.bulk_load(enumerate(all_rows))
+    margin = abs(pen_width) / 2
+
+    manifest = TileManifest(rows, cols, paper_size, pen_width)
+    jobs = []
+    for row, col, x, y, width, height in tile_bounds(paper_size, rows, cols):
+        found = index.query(x - margin, y - margin, x + width + margin, y + height + margin)
+        path = os.path.join(output_dir, f"tile_{row}_{col}.svg")
+        manifest.tiles.append(Tile(row, col, x, y, width, height, os.path.basename(path), len(found)))
+        jobs.append((path, (x, y, width, height), pen_width, [all_rows[i] for i in found]))
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    if workers == 1:
+        for job in jobs:
+            _write_tile(job)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(_write_tile, jobs))
+
+    manifest.seconds = time.perf_counter() - start
+    with open(os.path.join(output_dir, MANIFEST_FILE), 'w') as f:
+        f.write(manifest.to_json())
+    return manifest
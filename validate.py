@@ -0,0 +1,183 @@
+"""
+VALIDACIÓN
+Comprueba la sintaxis de un programa en una sola pasada por líneas, sin
+construir AST, código intermedio ni tabla de símbolos, y reúne todos los
+errores con su línea y columna
+"""
+
+import io
+import re
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Tuple
+
+from lexer import Lexer, Token, TokenType, KEYWORDS, NON_LEXER_SPACE
+from parser import STATEMENTS, expected_message, unexpected_message
+
+DEFAULT_MAX_ERRORS = 100
+
+# Palabra clave -> número de operandos (todos NUMBER)
+_ARITY = {word: len(STATEMENTS[token_type][1]) for word, token_type in KEYWORDS.items()}
+# Candidatos a número del lexer, para situar un error léxico
+_NUMBER_RE = re.compile(r'(?<![\w.])\d[\d.]*')
+
+
+@dataclass
+class ValidationError:
+    line: int
+    column: int
+    message: str
+
+    def __str__(self):
+        return f"línea {self.line}, columna {self.column}: {self.message}"
+
+
+@dataclass
+class ValidationResult:
+    errors: List[ValidationError] = field(default_factory=list)
+    lines: int = 0
+    statements: int = 0
+    truncated: bool = False     # se alcanzó max_errors y no se siguió leyendo
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+    def report(self, name: str = "") -> str:
+        prefix = f"{name}:" if name else ""
+        lines = [f"{prefix}{e.line}:{e.column}: {e.message}" for e in self.errors]
+        if self.truncated:
+            lines.append(f"{prefix} se detuvo tras {len(self.errors)} errores")
+        return '\n'.join(lines)
+
+
+def _fast_line_ok(text: str) -> Optional[int]:
+    """Número de declaraciones (0 o 1) de una línea bien formada sin pasar
+    por el lexer, o None si hay que analizarla token a token"""
+    code = text[:text.index('#')] if '#' in text else text
+    fields = code.split()
+    if not code.isascii() or NON_LEXER_SPACE.search(code):
+        return None
+    if not fields:
+        return 0
+    if _ARITY.get(fields[0]) != len(fields) - 1:
+        return None
+    operands = fields[1:]
+    digits = ''.join(operands)
+    if digits.isdigit():
+        return 1
+    # Flotantes: empiezan por dígito y tienen un solo punto ("1.2.3" es un error léxico)
+    if digits.replace('.', '').isdigit() and all(op[0] != '.' and op.count('.') <= 1 for op in operands):
+        return 1
+    return None
+
+
+def _lex(text: str, line: int) -> Tuple[List[Token], Optional[ValidationError]]:
+    # Tokens del texto; si el lexer falla, los leídos hasta entonces y el error
+    tokens: List[Token] = []
+    try:
+        for token in Lexer(text, first_line=line).iter_tokens():
+            tokens.append(token)
+    except ValueError as e:
+        # El número erróneo está después del último token leído
+        after = tokens[-1] if tokens else None
+        error_line = line if after is None else after.line + (after.type is TokenType.NEWLINE)
+        rows = text.split('\n')
+        row = rows[min(error_line - line, len(rows) - 1)]
+        start = after.column if after is not None and after.line == error_line else 0
+        column = 1
+        for match in _NUMBER_RE.finditer(row, start):
+            try:
+                float(match.group())
+            except ValueError:
+                column = match.start() + 1
+                break
+        return tokens, ValidationError(error_line, column, str(e))
+    return tokens, None
+
+
+def _open_string(tokens: List[Token]) -> bool:
+    # La última cadena llegó al final del texto sin cerrarse (sigue en la
+    # línea siguiente): después de ella solo queda EOF
+    return len(tokens) >= 2 and tokens[-2].type is TokenType.STRING and tokens[-1].type is TokenType.EOF
+
+
+def _check_tokens(tokens: List[Token]) -> Tuple[int, Optional[ValidationError]]:
+    """Declaraciones correctas y primer error de sintaxis, con los mismos
+    mensajes que el parser"""
+    statements = 0
+    expected: Tuple[TokenType, ...] = ()
+    index = 0
+    for token in tokens:
+        kind = token.type
+        if index < len(expected):
+            if kind is not expected[index]:
+                message = expected_message(expected[index], kind.name, token.line)
+                return statements, ValidationError(token.line, token.column, message)
+            index += 1
+            if index == len(expected):
+                statements += 1
+            continue
+        if kind is TokenType.NEWLINE or kind is TokenType.EOF:
+            continue
+        spec = STATEMENTS.get(kind)
+        if spec is None:
+            return statements, ValidationError(token.line, token.column, unexpected_message(kind.name))
+        expected, index = spec[1], 0
+    return statements, None
+
+
+def validate_lines(lines: Iterable[str], max_errors: int = DEFAULT_MAX_ERRORS) -> ValidationResult:
+    """Valida un programa línea a línea (líneas con su '\\n', como al
+    recorrer un archivo de texto) sin guardarlo entero.
+
+    Las líneas con una declaración bien formada se aceptan sin lexer; las
+    demás se analizan token a token y dan como mucho un error cada una (el
+    primero), con los mismos mensajes que el compilador. Una cadena sin
+    cerrar se une con las líneas siguientes, como hace el lexer. Se detiene
+    al reunir max_errors errores (result.truncated).
+    """
+    result = ValidationResult()
+    errors = result.errors
+    fast_line_ok = _fast_line_ok
+    lines = iter(lines)
+    number = 0
+    for text in lines:
+        number += 1
+        statements = fast_line_ok(text)
+        if statements is not None:
+            result.statements += statements
+            continue
+
+        first = number
+        while True:
+            tokens, error = _lex(text, first)
+            if error is not None or not _open_string(tokens) or not text.endswith('\n'):
+                break
+            extra = next(lines, None)
+            if extra is None:
+                break
+            text += extra
+            number += 1
+        if error is None:
+            statements, error = _check_tokens(tokens)
+            result.statements += statements
+        if error is not None:
+            errors.append(error)
+            if len(errors) >= max_errors:
+                result.truncated = True
+                break
+
+    result.lines = number
+    return result
+
+
+def validate_source(source: str, max_errors: int = DEFAULT_MAX_ERRORS) -> ValidationResult:
+    """validate_lines sobre un texto"""
+    return validate_lines(io.StringIO(source, newline='\n'), max_errors)
+
+
+def validate_file(path: str, max_errors: int = DEFAULT_MAX_ERRORS) -> ValidationResult:
+    """validate_lines leyendo el archivo por líneas (memoria constante)"""
+    with open(path, encoding='utf-8') as f:
+        return validate_lines(f, max_errors)
+